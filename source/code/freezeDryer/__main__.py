@@ -0,0 +1,41 @@
+"""
+Use Freeze Dryer without the interface.
+
+    python -m freezeDryer status [directory]
+"""
+
+import os
+import sys
+import argparse
+from freezeDryer import core
+
+def status(directory):
+    root = core.findRoot(os.path.abspath(directory))
+    if root is None:
+        print("No project settings were found.", file=sys.stderr)
+        return 1
+    for line in core.formatStatus(core.getStatus(root)):
+        print(line)
+    return 0
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog="freezeDryer")
+    commands = parser.add_subparsers(dest="command")
+    statusParser = commands.add_parser(
+        "status",
+        help="List the changes since the newest state."
+    )
+    statusParser.add_argument(
+        "directory",
+        nargs="?",
+        default=os.getcwd(),
+        help="A directory in the project. The default is the current directory."
+    )
+    arguments = parser.parse_args(arguments)
+    if arguments.command == "status":
+        return status(arguments.directory)
+    parser.print_help()
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
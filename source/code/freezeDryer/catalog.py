@@ -0,0 +1,120 @@
+import os
+import json
+import uuid
+from freezeDryer import storage
+
+# -------
+# Catalog
+# -------
+
+catalogFormatVersion = 0
+
+def getCatalogPath(archiveDirectory):
+    """
+    The catalog lists the states in an archive so
+    that they can be listed without going through
+    the archive directory. It is a JSON lines file.
+    The first line is a header and each line after
+    that is the record for one state. New states
+    are appended to the end.
+
+    The header and each record hold the archive
+    directory's modification time at the moment
+    that they were written. If the archive
+    directory has been modified since the last
+    line was written, states may have been added
+    or removed by something other than a commit,
+    so the catalog is considered to be out of
+    date. A catalog without records is valid.
+    """
+    return os.path.join(storage.getArchiveDataDirectory(archiveDirectory), "catalog.jsonl")
+
+def makeCatalogRecord(stamp, message=None, size=0, fileCount=0, manifest=None):
+    """
+    size and fileCount describe the files in the
+    project at the time of the commit, not the
+    files on disk. Compressed UFOs are counted
+    as the files that they contain. manifest is
+    the path to the state's manifest relative to
+    the archive directory or None.
+    """
+    record = dict(
+        stamp=stamp,
+        message=message,
+        size=size,
+        fileCount=fileCount,
+        manifest=manifest
+    )
+    return record
+
+def readCatalog(archiveDirectory, validate=True):
+    """
+    Read the catalog records sorted from oldest to
+    newest. This returns None if there is no catalog,
+    if it can't be read or, if validate is True,
+    if it is out of date.
+    """
+    path = getCatalogPath(archiveDirectory)
+    try:
+        with open(path, "r", encoding="utf8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    try:
+        header = json.loads(lines[0])
+        if header.get("formatVersion") != catalogFormatVersion:
+            return None
+        records = [json.loads(line) for line in lines[1:] if line]
+        archiveModified = header.get("archiveModified")
+        # a state may have been recorded more
+        # than once. the last record wins.
+        stamps = {}
+        for record in records:
+            archiveModified = record.pop("archiveModified", archiveModified)
+            stamps[record["stamp"]] = record
+    except (IndexError, ValueError, AttributeError, KeyError, TypeError):
+        return None
+    if validate:
+        if archiveModified != _getArchiveModificationTime(archiveDirectory):
+            return None
+    records = [stamps[stamp] for stamp in sorted(stamps)]
+    return records
+
+def appendToCatalog(archiveDirectory, record):
+    """
+    Append a record to the catalog. The catalog
+    must exist and be current, other than the
+    state that the record describes.
+    """
+    path = getCatalogPath(archiveDirectory)
+    record = dict(record, archiveModified=_getArchiveModificationTime(archiveDirectory))
+    with open(path, "a", encoding="utf8") as f:
+        f.write(_dumpLine(record))
+
+def writeCatalog(archiveDirectory, records):
+    """
+    Replace the catalog with records. The file is
+    swapped in whole so that a reader never sees
+    a partially written catalog.
+    """
+    path = getCatalogPath(archiveDirectory)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    archiveModified = _getArchiveModificationTime(archiveDirectory)
+    lines = [_dumpLine(dict(formatVersion=catalogFormatVersion, archiveModified=archiveModified))]
+    for record in records:
+        lines.append(_dumpLine(dict(record, archiveModified=archiveModified)))
+    tempPath = os.path.join(directory, "%s.tmp" % uuid.uuid4().hex)
+    try:
+        with open(tempPath, "w", encoding="utf8") as f:
+            f.write("".join(lines))
+        os.replace(tempPath, path)
+    finally:
+        if os.path.exists(tempPath):
+            os.remove(tempPath)
+
+def _dumpLine(data):
+    return json.dumps(data, separators=(",", ":")) + "\n"
+
+def _getArchiveModificationTime(archiveDirectory):
+    return os.stat(archiveDirectory).st_mtime_ns
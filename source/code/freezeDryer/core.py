@@ -1,9 +1,16 @@
 import os
-import shutil
-import glob
 import time
 import plistlib
 import re
+import zipfile
+import struct
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from freezeDryer import storage
+from freezeDryer import catalog
+from freezeDryer import diffCache
+from freezeDryer.ignore import IgnoreMatcher
+from freezeDryer.tree import walkTree
 
 # --------
 # Settings
@@ -13,6 +20,13 @@ def getDefaultSettings(root):
     settings = dict(
         formatVersion=0,
         compressUFOs=False,
+        deduplicateFiles=False,
+        cloneFiles=True,
+        copyThreadCount=8,
+        diffProcessCount=0,
+        diffEngine="fontParts",
+        diffCacheSize=256,
+        cacheDiffReports=True,
         makeGlyphSetProof=False,
         makeVisualDiffsReport=False,
         normalizeDataInVisualDiffsReport=True,
@@ -98,57 +112,615 @@ def initializeProject(root, settings):
 
 statePattern = re.compile("\d\d\d\d-\d\d-\d\d-\d\d-\d\d$")
 
+def getStateNames(archiveDirectory):
+    """
+    Get the names of all states in the archive
+    sorted from oldest to newest.
+    """
+    return [record["stamp"] for record in getStateRecords(archiveDirectory)]
+
+def getStateRecords(archiveDirectory):
+    """
+    Get the catalog records for all states in the
+    archive sorted from oldest to newest. The
+    catalog is rebuilt if it is out of date.
+    """
+    records = catalog.readCatalog(archiveDirectory)
+    if records is None:
+        records = rebuildCatalog(archiveDirectory)
+    return records
+
+def rebuildCatalog(archiveDirectory):
+    """
+    Rebuild the catalog from the states in the
+    archive directory. Records for states that
+    are already in the catalog are kept, so only
+    new states are read. Objects that are no
+    longer in any state are removed from the
+    object store.
+    """
+    known = catalog.readCatalog(archiveDirectory, validate=False)
+    if known is None:
+        known = []
+    known = {record["stamp"] : record for record in known}
+    records = []
+    for fileName in sorted(os.listdir(archiveDirectory)):
+        if not statePattern.match(fileName):
+            continue
+        record = known.get(fileName)
+        if record is None:
+            record = makeStateRecord(archiveDirectory, fileName)
+        records.append(record)
+    try:
+        catalog.writeCatalog(archiveDirectory, records)
+    except OSError:
+        # the archive may be read only
+        pass
+    # states may have been removed, so objects
+    # that were only in them can be removed too.
+    storage.pruneObjectStore(storage.getObjectStoreDirectory(archiveDirectory))
+    return records
+
+def makeStateRecord(archiveDirectory, stamp):
+    """
+    Make a catalog record for an existing state.
+    """
+    stateDirectory = getStatePath(archiveDirectory, stamp)
+    message = None
+    messagePath = os.path.join(stateDirectory, makeMessageFileName(stamp))
+    if os.path.exists(messagePath):
+        with open(messagePath, "rb") as f:
+            message = f.read().decode("utf8")
+    manifest = readStateManifest(archiveDirectory, stamp)
+    manifestPath = None
+    if manifest is not None:
+        manifestPath = os.path.join(stamp, makeManifestFileName(stamp))
+        size = sum(entry[0] for entry in manifest.values())
+        fileCount = len(manifest)
+    else:
+        # states from before manifests were written
+        size = 0
+        fileCount = 0
+        skipPaths = getStateFilePaths(archiveDirectory, stamp)
+        snapshot = walkTree(stateDirectory, skipPaths=skipPaths)
+        for path in snapshot.files.keys():
+            if os.path.splitext(path)[-1].lower() == ".ufoz":
+                with zipfile.ZipFile(snapshot.getPath(path), "r") as archive:
+                    for info in archive.infolist():
+                        if not info.is_dir():
+                            size += info.file_size
+                            fileCount += 1
+            else:
+                size += snapshot.stat(path).st_size
+                fileCount += 1
+    record = catalog.makeCatalogRecord(
+        stamp,
+        message=message,
+        size=size,
+        fileCount=fileCount,
+        manifest=manifestPath
+    )
+    return record
+
 def getDiffStateCandidates(root):
-    states = []
     settings = readSettings(root)
     directory = getArchiveDirectory(root, settings)
-    for fileName in reversed(sorted(os.listdir(directory))):
-        if not statePattern.match(fileName):
-            continue
-        states.append(fileName)
+    states = list(reversed(getStateNames(directory)))
     states.insert(0, "Current")
     return states
 
 def compileDiffReport(root, state1, state2, normalize=False, onlyCompareFontDefaultLayers=True):
-    from freezeDryer import diff
     from freezeDryer import diffReport
     rootSettings = readSettings(root)
+    archiveDirectory = os.path.normpath(getArchiveDirectory(root, rootSettings))
+    cacheKey = _getDiffCacheKey(root, rootSettings, state1, state2, normalize, onlyCompareFontDefaultLayers)
+    if cacheKey is not None and rootSettings["cacheDiffReports"]:
+        report = diffCache.readCachedDiffReport(archiveDirectory, cacheKey)
+        if report is not None:
+            return report
+    differences = compileDifferences(
+        root,
+        state1,
+        state2,
+        normalize=normalize,
+        onlyCompareFontDefaultLayers=onlyCompareFontDefaultLayers
+    )
+    report = diffReport.makeDiffReport(differences)
+    if cacheKey is not None and rootSettings["cacheDiffReports"]:
+        diffCache.writeCachedDiffReport(archiveDirectory, cacheKey, report, _getDiffCacheSize(rootSettings))
+    return report
+
+def compileDifferences(root, state1, state2, normalize=False, onlyCompareFontDefaultLayers=True):
+    """
+    Compile the differences between two states.
+    Either state may be "Current".
+    """
+    from freezeDryer import diff
+    events = iterateDifferences(
+        root,
+        state1,
+        state2,
+        normalize=normalize,
+        onlyCompareFontDefaultLayers=onlyCompareFontDefaultLayers
+    )
+    return diff.collectDifferences(events)
+
+def iterateDifferences(root, state1, state2, normalize=False, onlyCompareFontDefaultLayers=True):
+    """
+    Yield the results of comparing two states as soon
+    as they are found. See diff.iterateDifferences.
+    Either state may be "Current". The differences
+    between two archived states are kept in the
+    archive's diff cache once they are complete.
+    """
+    from freezeDryer import diff
+    rootSettings = readSettings(root)
     archiveDirectory = getArchiveDirectory(root, rootSettings)
     # normalize the paths for safety
     root = os.path.normpath(root)
     archiveDirectory = os.path.normpath(archiveDirectory)
+    # differences between archived states never change
+    cacheKey = _getDiffCacheKey(root, rootSettings, state1, state2, normalize, onlyCompareFontDefaultLayers)
+    if cacheKey is not None:
+        differences = diffCache.readCachedDifferences(archiveDirectory, cacheKey)
+        if differences is not None:
+            yield from diff.iterateCollectedDifferences(differences)
+            return
+    # compile
+    events = diff.iterateDifferences(
+        onlyCompareFontDefaultLayers=onlyCompareFontDefaultLayers,
+        normalizeFontContours=normalize,
+        normalizeFontComponents=normalize,
+        normalizeFontAnchors=normalize,
+        normalizeFontGuidelines=normalize,
+        workerCount=_getDiffProcessCount(rootSettings),
+        engine=rootSettings["diffEngine"],
+        **_locateDiffStates(root, archiveDirectory, state1, state2)
+    )
+    if cacheKey is None:
+        yield from events
+        return
+    # keep the results as they go by so that they
+    # can be cached if the comparison is completed.
+    collected = []
+    for event in events:
+        collected.append(event)
+        yield event
+    differences = diff.collectDifferences(collected)
+    diffCache.writeCachedDifferences(archiveDirectory, cacheKey, differences, _getDiffCacheSize(rootSettings))
+
+def haveChanges(root):
+    """
+    Find out if the project is different from the
+    newest state in the archive. This is much faster
+    than compiling the differences. See
+    diff.haveDifferences for the details. If there
+    are no states, everything is a change. If the
+    archive is missing, there is nothing to compare
+    with and nothing can be committed, so this
+    is False.
+    """
+    from freezeDryer import diff
+    settings = readSettings(root)
+    archiveDirectory = getArchiveDirectory(root, settings)
+    # normalize the paths for safety
+    root = os.path.normpath(root)
+    archiveDirectory = os.path.normpath(archiveDirectory)
+    if not os.path.exists(archiveDirectory):
+        return False
+    stamps = getStateNames(archiveDirectory)
+    if not stamps:
+        return True
+    return diff.haveDifferences(**_locateDiffStates(root, archiveDirectory, stamps[-1], "Current"))
+
+def _locateDiffStates(root, archiveDirectory, state1, state2):
+    """
+    Locate two states and everything that is known
+    about them. This returns the keyword arguments
+    for diff.iterateDifferences and friends.
+    """
     # locate the states
+    stamp1 = stamp2 = None
     if state1 == "Current":
         state1 = root
     else:
+        stamp1 = state1
         state1 = os.path.join(archiveDirectory, state1)
     if state2 == "Current":
         state2 = root
     else:
+        stamp2 = state2
         state2 = os.path.join(archiveDirectory, state2)
     # locate files that should be ignored
-    state1IgnoredPaths = []
+    state1IgnoreMatcher = None
     if haveSettings(state1):
         state1Settings = readSettings(state1)
-        state1IgnoredPaths = gatherIgnoredPaths(state1, state1Settings["ignore"])
-    state2IgnoredPaths = []
+        state1IgnoreMatcher = IgnoreMatcher(state1Settings["ignore"])
+    state1IgnoredPaths = []
+    if stamp1 is None:
+        state1IgnoredPaths.append(archiveDirectory)
+    else:
+        state1IgnoredPaths.extend(getStateFilePaths(archiveDirectory, stamp1))
+    state2IgnoreMatcher = None
     if haveSettings(state2):
         state2Settings = readSettings(state2)
-        state2IgnoredPaths = gatherIgnoredPaths(state2, state2Settings["ignore"])
-    # compile
-    differences = diff.diffDirectories(
-        state1,
-        state2,
+        state2IgnoreMatcher = IgnoreMatcher(state2Settings["ignore"])
+    state2IgnoredPaths = []
+    if stamp2 is None:
+        state2IgnoredPaths.append(archiveDirectory)
+    else:
+        state2IgnoredPaths.extend(getStateFilePaths(archiveDirectory, stamp2))
+    # locate the manifests. the current state is
+    # checked against the manifest of a state.
+    manifest1 = manifest2 = None
+    if stamp1 is not None:
+        manifest1 = readStateManifest(archiveDirectory, stamp1)
+    if stamp2 is not None:
+        manifest2 = readStateManifest(archiveDirectory, stamp2)
+    statCache1 = statCache2 = None
+    if stamp1 is None or stamp2 is None:
+        statCache = manifest1 or manifest2
+        if statCache is None:
+            stamps = getStateNames(archiveDirectory)
+            if stamps:
+                statCache = readStateManifest(archiveDirectory, stamps[-1])
+        if stamp1 is None:
+            statCache1 = statCache
+        if stamp2 is None:
+            statCache2 = statCache
+    locations = dict(
+        root1=state1,
+        root2=state2,
         ignorePaths1=state1IgnoredPaths,
         ignorePaths2=state2IgnoredPaths,
-        onlyCompareFontDefaultLayers=onlyCompareFontDefaultLayers,
-        normalizeFontContours=normalize,
-        normalizeFontComponents=normalize,
-        normalizeFontAnchors=normalize,
-        normalizeFontGuidelines=normalize
+        ignoreMatcher1=state1IgnoreMatcher,
+        ignoreMatcher2=state2IgnoreMatcher,
+        manifest1=manifest1,
+        manifest2=manifest2,
+        statCache1=statCache1,
+        statCache2=statCache2
     )
-    report = diffReport.makeDiffReport(differences)
-    return report
+    return locations
+
+def _getDiffCacheKey(root, settings, state1, state2, normalize, onlyCompareFontDefaultLayers):
+    """
+    Get the diff cache key for two states. This is None
+    if the cache is off or if either state is "Current",
+    which can change at any time.
+    """
+    if not settings["diffCacheSize"]:
+        return None
+    if state1 == "Current" or state2 == "Current":
+        return None
+    archiveDirectory = os.path.normpath(getArchiveDirectory(root, settings))
+    return diffCache.makeDiffCacheKey(
+        os.path.join(archiveDirectory, state1),
+        os.path.join(archiveDirectory, state2),
+        normalize,
+        onlyCompareFontDefaultLayers,
+        settings["diffEngine"]
+    )
+
+def _getDiffCacheSize(settings):
+    # the setting is in megabytes
+    return settings["diffCacheSize"] * 1024 * 1024
+
+def _getDiffProcessCount(settings):
+    """
+    RoboFont can't start processes that import
+    freezeDryer, so files are compared one at a
+    time in it. Otherwise 0 means one per core.
+    """
+    try:
+        import mojo
+        return 1
+    except ImportError:
+        pass
+    count = settings["diffProcessCount"]
+    if count == 0:
+        count = os.cpu_count() or 1
+    return count
+
+# ------
+# Status
+# ------
+
+def getStatusIndexPath(archiveDirectory):
+    """
+    The status index records the digests of the files
+    in the root that getStatus had to hash, along with
+    their size and modification time, so that they are
+    only hashed again after they change. Files that
+    haven't changed since the newest state was
+    committed are found in that state's manifest, so
+    they aren't recorded here. It has the same format
+    as a manifest. Deleting it is safe.
+    """
+    return os.path.join(storage.getArchiveDataDirectory(archiveDirectory), "status.json")
+
+def getStatus(root):
+    """
+    Compare the files in the root with the newest state
+    in the archive. This returns a dict:
+
+    - archive: False if the archive is missing. The
+      status is empty when it is.
+    - state: the newest state or None if there are none.
+    - added, removed, modified: paths relative to the
+      root. UFOs are listed as single paths.
+    - glyphs: the changed glyphs in modified UFO
+      directories, keyed by the UFO's path. Each has
+      added, removed and modified lists of
+      (layer name, glyph name).
+
+    The root is walked the same way that a commit
+    walks it and files are compared by digest, so
+    fonts are never opened. A file is only hashed if
+    its size or modification time is not in the
+    newest state's manifest or in the status index.
+    Older states that don't have a manifest are
+    hashed in full.
+    """
+    startTime = time.time_ns()
+    settings = readSettings(root)
+    archiveDirectory = getArchiveDirectory(root, settings)
+    # normalize the paths for safety
+    root = os.path.normpath(root)
+    archiveDirectory = os.path.normpath(archiveDirectory)
+    status = dict(
+        archive=os.path.exists(archiveDirectory),
+        state=None,
+        added=[],
+        removed=[],
+        modified=[],
+        glyphs={}
+    )
+    if not status["archive"]:
+        return status
+    # get the digests of the newest state
+    stamps = getStateNames(archiveDirectory)
+    stamp = None
+    stateManifest = {}
+    stateDigests = {}
+    if stamps:
+        stamp = stamps[-1]
+        stateManifest = readStateManifest(archiveDirectory, stamp)
+        if stateManifest is None:
+            stateManifest = {}
+            stateDigests = _readStateDigests(archiveDirectory, stamp)
+        else:
+            stateDigests = {
+                path : entry[2]
+                for path, entry in stateManifest.items()
+                if not _isDSStore(path)
+            }
+            # racy files were recorded without a digest
+            missing = [path for path, digest in stateDigests.items() if digest is None]
+            if missing:
+                stateDigests.update(_readMissingStateDigests(archiveDirectory, stamp, stateManifest, missing))
+    # get the digests of the root
+    snapshot = walkTree(
+        root,
+        IgnoreMatcher(settings["ignore"]),
+        skipPaths=[archiveDirectory],
+        includeUFOContents=True
+    )
+    indexPath = getStatusIndexPath(archiveDirectory)
+    index = storage.readManifest(indexPath) or {}
+    newIndex = {}
+    rootDigests = {}
+    for path, dirEntry in snapshot.files.items():
+        if dirEntry.name == ".DS_Store":
+            continue
+        info = dirEntry.stat()
+        entry = (info.st_size, info.st_mtime_ns)
+        previousEntry = stateManifest.get(path)
+        if storage.entryIsUnchanged(entry, previousEntry):
+            rootDigests[path] = previousEntry[2]
+            continue
+        previousEntry = index.get(path)
+        if storage.entryIsUnchanged(entry, previousEntry):
+            digest = previousEntry[2]
+        else:
+            digest = storage.hashFile(snapshot.getPath(path))
+        rootDigests[path] = digest
+        if not storage.entryIsRacy(entry, startTime):
+            newIndex[path] = entry + (digest,)
+    if newIndex != index and os.path.exists(archiveDirectory):
+        _writeStatusIndex(indexPath, newIndex)
+    # compare
+    changes = {}
+    for path, digest in rootDigests.items():
+        stateDigest = stateDigests.get(path)
+        if stateDigest is None:
+            changes[path] = "added"
+        elif stateDigest != digest:
+            changes[path] = "modified"
+    for path in stateDigests.keys() - rootDigests.keys():
+        changes[path] = "removed"
+    status["state"] = stamp
+    ufoChanges = {}
+    for path, change in changes.items():
+        ufoPath = _getStatusUFOPath(path)
+        if ufoPath is None:
+            status[change].append(path)
+        else:
+            if ufoPath not in ufoChanges:
+                ufoChanges[ufoPath] = {}
+            ufoChanges[ufoPath][path[len(ufoPath) + 1:]] = change
+    for ufoPath, files in sorted(ufoChanges.items()):
+        # a file that is unchanged is in both
+        unchanged = any(
+            path in rootDigests and path not in changes
+            for path in snapshot.ufoContents.get(ufoPath, ())
+        )
+        inRoot = unchanged or any(change != "removed" for change in files.values())
+        inState = unchanged or any(change != "added" for change in files.values())
+        if not inState:
+            status["added"].append(ufoPath)
+        elif not inRoot:
+            status["removed"].append(ufoPath)
+        else:
+            status["modified"].append(ufoPath)
+            glyphs = _getStatusGlyphs(root, archiveDirectory, stamp, ufoPath, files)
+            if glyphs:
+                status["glyphs"][ufoPath] = glyphs
+    for key in ("added", "removed", "modified"):
+        status[key].sort()
+    return status
+
+def formatStatus(status):
+    """
+    Format a status as lines of text, marked
+    like this:
+
+    A added
+    D removed
+    M modified
+    M font.ufo layer:glyph
+    """
+    if not status["archive"]:
+        return ["The archive is not available."]
+    if status["state"] is None:
+        lines = ["There are no states."]
+    else:
+        lines = ["Changes since %s:" % status["state"]]
+    changes = []
+    for key, marker in (("added", "A"), ("removed", "D"), ("modified", "M")):
+        for path in status[key]:
+            changes.append((path, marker, None))
+    for ufoPath, glyphs in status["glyphs"].items():
+        for key, marker in (("added", "A"), ("removed", "D"), ("modified", "M")):
+            for layerName, glyphName in glyphs[key]:
+                changes.append((ufoPath, marker, "%s:%s" % (layerName, glyphName)))
+    if not changes:
+        lines.append("No changes.")
+    for path, marker, glyph in sorted(changes, key=lambda change: (change[0], change[2] or "")):
+        if glyph is None:
+            lines.append("%s %s" % (marker, path))
+        else:
+            lines.append("%s %s %s" % (marker, path, glyph))
+    return lines
+
+def _writeStatusIndex(path, index):
+    # swap the file in whole so that a reader
+    # never sees a partially written index.
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    tempPath = os.path.join(directory, "%s.tmp" % uuid.uuid4().hex)
+    try:
+        storage.writeManifest(tempPath, index)
+        os.replace(tempPath, path)
+    finally:
+        if os.path.exists(tempPath):
+            os.remove(tempPath)
+
+def _isDSStore(path):
+    # endswith is much faster than basename
+    return path.endswith(".DS_Store") and os.path.basename(path) == ".DS_Store"
+
+def _getStatusUFOPath(path):
+    marker = ".ufo" + os.sep
+    index = path.lower().find(marker)
+    if index == -1:
+        return None
+    return path[:index + 4]
+
+def _readStateDigests(archiveDirectory, stamp):
+    """
+    Hash the files in a state that doesn't have a
+    manifest. Compressed UFOs are listed under their
+    uncompressed paths, the same as in a manifest.
+    """
+    from freezeDryer import diff
+    stateDirectory = getStatePath(archiveDirectory, stamp)
+    skip = getStateFilePaths(archiveDirectory, stamp)
+    snapshot = walkTree(stateDirectory, skipPaths=skip, includeUFOContents=False)
+    source = diff.makeDigestSource(stateDirectory)
+    digests = {}
+    for path in snapshot.getTopLevelPaths():
+        if path in snapshot.ufos:
+            parent = os.path.dirname(path)
+            for name, digest in diff.getUFODigests(source, path).items():
+                digests[os.path.join(parent, name)] = digest
+        elif not _isDSStore(path):
+            digests[path] = diff.getFileDigest(source, path)
+    return digests
+
+def _readMissingStateDigests(archiveDirectory, stamp, manifest, paths):
+    """
+    Hash the files in paths, which are in a state's
+    manifest without a digest. Files in compressed
+    UFOs are read from the UFOZ.
+    """
+    from freezeDryer import diff
+    stateDirectory = getStatePath(archiveDirectory, stamp)
+    source = diff.makeDigestSource(stateDirectory, manifest)
+    digests = {}
+    ufoPaths = set()
+    for path in paths:
+        ufoPath = _getStatusUFOPath(path)
+        if ufoPath is None:
+            digests[path] = diff.getFileDigest(source, path)
+        else:
+            ufoPaths.add(ufoPath)
+    paths = set(paths)
+    for ufoPath in sorted(ufoPaths):
+        parent = os.path.dirname(ufoPath)
+        statePath = ufoPath
+        if not os.path.exists(os.path.join(stateDirectory, statePath)):
+            statePath = os.path.splitext(statePath)[0] + ".ufoz"
+        for name, digest in diff.getUFODigests(source, statePath).items():
+            path = os.path.join(parent, name)
+            if path in paths:
+                digests[path] = digest
+    return digests
+
+def _getStatusGlyphs(root, archiveDirectory, stamp, ufoPath, files):
+    """
+    Find the glyphs of the changed GLIF files in a UFO.
+    files maps paths relative to the UFO to "added",
+    "removed" or "modified". The glyph names are read
+    from the UFO in the root, or in the state for
+    removed GLIFs.
+    """
+    glyphs = dict(added=[], removed=[], modified=[])
+    names = {}
+    if any(change != "removed" for change in files.values()):
+        names.update(_readGLIFNames(os.path.join(root, ufoPath)))
+    if "removed" in files.values():
+        statePath = os.path.join(getStatePath(archiveDirectory, stamp), ufoPath)
+        if not os.path.exists(statePath):
+            statePath = os.path.splitext(statePath)[0] + ".ufoz"
+        stateNames = _readGLIFNames(statePath)
+        for path, change in files.items():
+            if change == "removed" and path in stateNames:
+                names[path] = stateNames[path]
+    for path, change in sorted(files.items()):
+        if path in names:
+            glyphs[change].append(names[path])
+    if not any(glyphs.values()):
+        return None
+    return glyphs
+
+def _readGLIFNames(path):
+    """
+    Map the GLIF files in the UFO or UFOZ at path, by
+    their path relative to the UFO, to (layer name,
+    glyph name).
+    """
+    from fontTools.ufoLib import UFOReader
+    from fontTools.ufoLib.errors import UFOLibError
+    names = {}
+    try:
+        with UFOReader(path, validate=False) as reader:
+            for layerName in reader.getLayerNames():
+                glyphSet = reader.getGlyphSet(layerName, validateRead=False)
+                for glyphName, fileName in glyphSet.contents.items():
+                    names[os.path.join(glyphSet.dirName, fileName)] = (layerName, glyphName)
+    except (OSError, UFOLibError):
+        return {}
+    return names
 
 # ------
 # Commit
@@ -174,13 +746,14 @@ def canPerformCommit(root):
         return False, "Archive is missing."
     # stamp already exists
     stamp = makeTimeStamp()
-    stateDirectory = getStatePath(archiveDirectory, stamp)
-    if os.path.exists(stateDirectory):
+    if stamp in getStateNames(archiveDirectory):
         return False, "A state directory with this same time stamp already exists."
     return True, stamp
 
 def performCommit(root, stamp, message=None, progressBar=None):
+    startTime = time.time_ns()
     settings = readSettings(root)
+    tickCount = 0
     if progressBar is not None:
         tickCount = 4
         tickCount += settings["compressUFOs"]
@@ -195,47 +768,115 @@ def performCommit(root, stamp, message=None, progressBar=None):
     archiveDirectory = os.path.normpath(archiveDirectory)
     # make the state directory
     stateDirectory = getStatePath(archiveDirectory, stamp)
-    # locate files that should be ignored
-    ignorePatterns = settings["ignore"]
-    ignoredPaths = gatherIgnoredPaths(root, ignorePatterns)
-    def ignoreArchiveFunction(path, names):
-        ignore = []
-        for name in names:
-            if path in ignoredPaths:
-                return names
-            p = os.path.join(path, name)
-            if p == archiveDirectory:
-                return [name]
-            if p in ignoredPaths:
-                ignore.append(name)
-        return ignore
+    # make sure the catalog is current before
+    # the state is added to the archive.
+    previousStamp = getPreviousStateName(archiveDirectory, stamp)
+    # walk the root once. everything below works
+    # from this instead of going back to the disk.
+    ignoreMatcher = IgnoreMatcher(settings["ignore"])
+    snapshot = walkTree(
+        root,
+        ignoreMatcher,
+        skipPaths=[archiveDirectory],
+        includeUFOContents=True
+    )
+    # UFOs that will be compressed are written straight
+    # from the root into UFOZs, so they aren't copied.
+    compressedUFOPaths = []
+    skip = set()
+    if settings["compressUFOs"]:
+        for path in snapshot.ufos:
+            if path in snapshot.ufoContents:
+                compressedUFOPaths.append(path)
+                skip.add(path)
+                skip.update(snapshot.ufoContents[path])
+    directories = [(root, stateDirectory)] + [
+        (snapshot.getPath(path), os.path.join(stateDirectory, path))
+        for path in snapshot.directories
+        if path not in skip
+    ]
+    files = [
+        (snapshot.getPath(path), os.path.join(stateDirectory, path))
+        for path in snapshot.files.keys()
+        if path not in skip
+    ]
     # copy the whole root to the state directory
     if progressBar:
         progressBar.update("Copying files...")
-    shutil.copytree(root, stateDirectory, ignore=ignoreArchiveFunction)
-    # remove ignored directories
-    for path in ignoredPaths:
-        base = os.path.relpath(path, root)
-        path = os.path.join(stateDirectory, base)
-        if not os.path.exists(path):
-            continue
-        if os.path.isdir(path):
-            # there shouldn't be anything there,
-            # but fail if there is just to be safe
-            assert not list(os.listdir(path))
-            shutil.rmtree(path)
+    objectStoreDirectory = None
+    if settings["deduplicateFiles"]:
+        objectStoreDirectory = storage.getObjectStoreDirectory(archiveDirectory)
+    cloneFiles = False
+    if settings["cloneFiles"]:
+        # probe in the data directory so that the
+        # archive directory, and the catalog that
+        # depends on its modification time, is untouched.
+        dataDirectory = storage.getArchiveDataDirectory(archiveDirectory)
+        os.makedirs(dataDirectory, exist_ok=True)
+        cloneFiles = storage.canCloneFiles(getSettingsPath(root), dataDirectory)
+    previousManifest = None
+    if previousStamp is not None:
+        previousManifest = readStateManifest(archiveDirectory, previousStamp)
+    manifest = {}
+    copyFunction = storage.makeCopyFunction(
+        root,
+        manifest,
+        previousManifest=previousManifest,
+        objectStoreDirectory=objectStoreDirectory,
+        cloneFiles=cloneFiles,
+        snapshot=snapshot,
+        startTime=startTime
+    )
+    storage.copyFiles(
+        directories,
+        files,
+        copyFunction=copyFunction,
+        threadCount=settings["copyThreadCount"]
+    )
+    # compress UFOs
+    if settings["compressUFOs"]:
+        if progressBar:
+            progressBar.update("Compressing UFOs...")
+            tickCount += len(compressedUFOPaths)
+            progressBar.setTickCount(tickCount)
+        pairs = []
+        for path in compressedUFOPaths:
+            ufozPath = os.path.splitext(path)[0] + ".ufoz"
+            ufozPath = os.path.join(stateDirectory, ufozPath)
+            pairs.append((snapshot.getPath(path), ufozPath))
+        previousStateDirectory = None
+        if previousStamp is not None:
+            previousStateDirectory = getStatePath(archiveDirectory, previousStamp)
+        entries = writeUFOZs(
+            pairs,
+            progressBar=progressBar,
+            relativeTo=root,
+            previousDirectory=previousStateDirectory,
+            previousManifest=previousManifest,
+            cloneFiles=cloneFiles,
+            snapshot=snapshot,
+            startTime=startTime
+        )
+        for path, entry in entries.items():
+            manifest[os.path.relpath(path, root)] = entry
+    # write the manifest
+    manifestPath = os.path.join(stateDirectory, makeManifestFileName(stamp))
+    storage.writeManifest(manifestPath, manifest)
     # write the message
     if message:
-        message = message.encode("utf8")
         messagePath = os.path.join(stateDirectory, makeMessageFileName(stamp))
         f = open(messagePath, "wb")
-        f.write(message)
+        f.write(message.encode("utf8"))
         f.close()
-    # compress UFOs
-    if settings["compressUFOs"]:
-        if progressBar:
-            progressBar.update("Compressing UFOs...")
-        recursivelyCompressUFOs(stateDirectory)
+    # add the state to the catalog
+    record = catalog.makeCatalogRecord(
+        stamp,
+        message=message or None,
+        size=sum(entry[0] for entry in manifest.values()),
+        fileCount=len(manifest),
+        manifest=os.path.join(stamp, makeManifestFileName(stamp))
+    )
+    catalog.appendToCatalog(archiveDirectory, record)
     # make the diffs
     if settings["makeVisualDiffsReport"]:
         if progressBar:
@@ -262,17 +903,56 @@ def performCommit(root, stamp, message=None, progressBar=None):
         if progressBar:
             progressBar.update("Making glyph set proof...")
         from freezeDryer import proof
-        proof.makeGlyphSetProof(stateDirectory, stamp, makeProofFileName(stamp))
+        ufoPaths = []
+        for path in snapshot.ufos:
+            if path in compressedUFOPaths:
+                path = os.path.splitext(path)[0] + ".ufoz"
+            ufoPaths.append(os.path.join(stateDirectory, path))
+        proof.makeGlyphSetProof(stateDirectory, stamp, makeProofFileName(stamp), paths=ufoPaths)
 
 def makeMessageFileName(stamp):
     return stamp + " message.txt"
 
+def makeManifestFileName(stamp):
+    return stamp + " manifest.json"
+
+def getPreviousStateName(archiveDirectory, stamp):
+    """
+    Get the name of the newest state
+    that is older than stamp.
+    """
+    previous = [state for state in getStateNames(archiveDirectory) if state < stamp]
+    if not previous:
+        return None
+    return previous[-1]
+
+def readStateManifest(archiveDirectory, stamp):
+    path = os.path.join(getStatePath(archiveDirectory, stamp), makeManifestFileName(stamp))
+    return storage.readManifest(path)
+
 def makeProofFileName(stamp):
     return stamp + " glyphs.pdf"
 
 def makeDiffReportFileName(stamp):
     return stamp + " diffs.html"
 
+def getStateFilePaths(archiveDirectory, stamp):
+    """
+    Get the paths of the files that Freeze Dryer
+    writes into a state. These aren't part of
+    the project.
+    """
+    stateDirectory = getStatePath(archiveDirectory, stamp)
+    return [
+        os.path.join(stateDirectory, fileName(stamp))
+        for fileName in (
+            makeManifestFileName,
+            makeMessageFileName,
+            makeDiffReportFileName,
+            makeProofFileName
+        )
+    ]
+
 # -----
 # Tools
 # -----
@@ -290,56 +970,285 @@ def findRoot(directory, level=0):
         return findRoot(os.path.dirname(directory), level)
     return None
 
-def gatherIgnoredPaths(directory, ignorePatterns, level=0):
-    found = []
-    # match file names
-    for pattern in ignorePatterns:
-        if pattern.startswith("/") and level > 0:
-            continue
-        elif pattern.startswith("/"):
-            pattern = pattern[1:]
-        fullPattern = os.path.join(directory, pattern)
-        found += glob.glob(fullPattern)
-    # recurse through sub-directories
-    level += 1
-    for fileName in os.listdir(directory):
-        if os.path.splitext(fileName)[-1].lower() == ".ufo":
-            continue
-        fullPath = os.path.join(directory, fileName)
-        if fullPath in found:
-            continue
-        if os.path.isdir(fullPath):
-            found += gatherIgnoredPaths(fullPath, ignorePatterns, level)
-    return found
+def gatherIgnoredPaths(directory, ignorePatterns):
+    snapshot = walkTree(directory, IgnoreMatcher(ignorePatterns), includeUFOContents=False)
+    return [snapshot.getPath(path) for path in snapshot.ignored]
 
 # ---------------
 # UFO Compression
 # ---------------
 
 def gatherUFOPaths(directory):
-    ufos = []
-    for fileName in os.listdir(directory):
-        path = os.path.join(directory, fileName)
-        if os.path.splitext(fileName)[-1].lower() in (".ufo", ".ufoz"):
-            ufos.append(path)
-        elif os.path.isdir(path):
-            ufos += gatherUFOPaths(path)
-    return ufos
-
-def recursivelyCompressUFOs(directory):
-    paths = gatherUFOPaths(directory)
-    for path in paths:
-        if os.path.splitext(path)[-1].lower() == ".ufoz":
-            continue
-        convertUFOToUFOZ(path)
+    snapshot = walkTree(directory, includeUFOContents=False)
+    return [snapshot.getPath(path) for path in snapshot.ufos]
 
-def convertUFOToUFOZ(path):
-    ufozPath = os.path.splitext(path)[0] + ".ufoz"
-    zipPath = shutil.make_archive(
+def writeUFOZs(
+        pairs,
+        progressBar=None,
+        relativeTo=None,
+        workerCount=None,
+        previousDirectory=None,
+        previousManifest=None,
+        cloneFiles=False,
+        snapshot=None,
+        startTime=None
+    ):
+    """
+    Write the UFOs in pairs of (ufoPath, ufozPath)
+    to UFOZ without changing the UFOs.
+
+    previousManifest may be the manifest of a
+    previous state, stored in previousDirectory,
+    with paths relative to relativeTo. UFOZs in
+    that state are reused for anything that
+    hasn't changed since then.
+
+    snapshot may be a TreeSnapshot that contains
+    the UFOs and their contents. startTime is
+    passed to writeUFOZ.
+
+    The UFOs are compressed at the same time by
+    workerCount threads. zlib releases the GIL
+    while it compresses, so this uses all of the
+    cores. workerCount defaults to the number of
+    cores. progressBar is updated once for each
+    UFO. The manifest entries for all files in
+    the UFOs are returned.
+    """
+    entries = {}
+    if not pairs:
+        return entries
+    previousUFOEntries = {}
+    if previousManifest is not None:
+        previousUFOEntries = storage.groupManifestByUFO(previousManifest)
+    if workerCount is None:
+        workerCount = os.cpu_count() or 1
+    workerCount = max(1, min(workerCount, len(pairs)))
+    with ThreadPoolExecutor(max_workers=workerCount) as executor:
+        futures = {}
+        for ufoPath, ufozPath in pairs:
+            previousUFOZPath = None
+            previousEntries = None
+            if previousDirectory is not None:
+                relativePath = os.path.relpath(ufoPath, relativeTo)
+                previousUFOZPath = os.path.splitext(relativePath)[0] + ".ufoz"
+                previousUFOZPath = os.path.join(previousDirectory, previousUFOZPath)
+                previousEntries = previousUFOEntries.get(relativePath)
+            future = executor.submit(
+                writeUFOZ,
+                ufoPath,
+                ufozPath,
+                previousUFOZPath,
+                previousEntries,
+                cloneFiles,
+                snapshot,
+                startTime
+            )
+            futures[future] = ufoPath
+        for future in as_completed(futures):
+            entries.update(future.result())
+            if progressBar:
+                path = futures[future]
+                if relativeTo is not None:
+                    path = os.path.relpath(path, relativeTo)
+                progressBar.update("Compressed %s" % path)
+    return entries
+
+def writeUFOZ(
+        ufoPath,
         ufozPath,
-        "zip",
-        os.path.dirname(path),
-        os.path.basename(path)
-    )
-    os.rename(zipPath, ufozPath)
-    shutil.rmtree(path)
+        previousUFOZPath=None,
+        previousEntries=None,
+        cloneFiles=False,
+        snapshot=None,
+        startTime=None
+    ):
+    """
+    Write the UFO at ufoPath into a zip at ufozPath.
+    The UFO directory is the top level item in the
+    zip, the same as shutil.make_archive would do.
+    The files are hashed while they are compressed
+    and manifest entries for them are returned,
+    keyed by the path of each file.
+
+    previousUFOZPath may be a UFOZ written from
+    the same UFO by a previous commit and
+    previousEntries the manifest entries for it,
+    keyed by their names in the UFOZ. If nothing
+    has changed, the previous UFOZ is copied.
+    Otherwise, the files that haven't changed
+    are copied from it without recompressing.
+
+    If snapshot is given, the contents of the UFO
+    are taken from it rather than from the disk.
+    If startTime is given, racy entries are
+    returned without a digest. See
+    storage.entryIsRacy.
+    """
+    if previousEntries is None:
+        previousEntries = {}
+    parent = os.path.dirname(ufoPath)
+    directories = []
+    files = []
+    relativeUFOPath = None
+    if snapshot is not None:
+        relativeUFOPath = os.path.relpath(ufoPath, snapshot.root)
+        if relativeUFOPath not in snapshot.ufoContents:
+            relativeUFOPath = None
+    if relativeUFOPath is not None:
+        # paths in the snapshot are relative to the root,
+        # names in the zip are relative to the UFO's parent.
+        start = len(os.path.dirname(relativeUFOPath))
+        if start:
+            start += 1
+        directories.append((ufoPath, relativeUFOPath[start:]))
+        for relativePath in snapshot.ufoContents[relativeUFOPath]:
+            path = snapshot.getPath(relativePath)
+            name = relativePath[start:]
+            if relativePath in snapshot.files:
+                entry = storage.makeManifestEntry(path, info=snapshot.stat(relativePath))
+                files.append((path, name, entry))
+            else:
+                directories.append((path, name))
+    else:
+        for directory, directoryNames, fileNames in os.walk(ufoPath):
+            directoryNames.sort()
+            relativeDirectory = os.path.relpath(directory, parent)
+            directories.append((directory, relativeDirectory))
+            for fileName in sorted(fileNames):
+                path = os.path.join(directory, fileName)
+                name = os.path.join(relativeDirectory, fileName)
+                files.append((path, name, storage.makeManifestEntry(path)))
+    previousArchive = None
+    if previousEntries and previousUFOZPath is not None and os.path.exists(previousUFOZPath):
+        previousArchive = zipfile.ZipFile(previousUFOZPath, "r")
+    try:
+        # reuse the whole UFOZ
+        if previousArchive is not None:
+            previousDirectoryNames = set(
+                info.filename.rstrip("/")
+                for info in previousArchive.infolist()
+                if info.is_dir()
+            )
+            directoryNames = set(_zipName(name) for directory, name in directories)
+            unchanged = directoryNames == previousDirectoryNames
+            unchanged = unchanged and len(files) == len(previousEntries)
+            if unchanged:
+                for path, name, entry in files:
+                    if not storage.entryIsUnchanged(entry, previousEntries.get(name)):
+                        unchanged = False
+                        break
+            if unchanged:
+                storage.copyFile(previousUFOZPath, ufozPath, clone=cloneFiles)
+                entries = {
+                    path : entry[:2] + (previousEntries[name][2],)
+                    for path, name, entry in files
+                }
+                return _forgetRacyDigests(entries, startTime)
+        # write a new UFOZ
+        entries = {}
+        with zipfile.ZipFile(ufozPath, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for directory, name in directories:
+                archive.write(directory, name)
+            for path, name, entry in files:
+                previousEntry = previousEntries.get(name)
+                if previousArchive is not None and storage.entryIsUnchanged(entry, previousEntry):
+                    try:
+                        previousInfo = previousArchive.getinfo(_zipName(name))
+                    except KeyError:
+                        previousInfo = None
+                    if previousInfo is not None:
+                        _copyCompressedZipMember(previousArchive, previousInfo, archive)
+                        entries[path] = entry[:2] + (previousEntry[2],)
+                        continue
+                info = zipfile.ZipInfo.from_file(path, name)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with open(path, "rb") as source:
+                    with archive.open(info, "w", force_zip64=info.file_size > zipfile.ZIP64_LIMIT) as destination:
+                        digest = storage.copyAndHashStream(source, destination)
+                entries[path] = entry[:2] + (digest,)
+        return _forgetRacyDigests(entries, startTime)
+    finally:
+        if previousArchive is not None:
+            previousArchive.close()
+
+def _forgetRacyDigests(entries, startTime):
+    if startTime is None:
+        return entries
+    return {
+        path : entry[:2] + (None,) if storage.entryIsRacy(entry, startTime) else entry
+        for path, entry in entries.items()
+    }
+
+def _zipName(path):
+    return path.replace(os.sep, "/")
+
+def _copyCompressedZipMember(sourceArchive, sourceInfo, destinationArchive):
+    """
+    Copy a member from one zip to another without
+    decompressing and recompressing it. If that
+    fails, the member is read and written again.
+    """
+    try:
+        _copyRawZipMember(sourceArchive, sourceInfo, destinationArchive)
+    except Exception:
+        # the raw copy depends on private parts of
+        # ZipFile. if they change, or anything else
+        # goes wrong, fall back to the public API.
+        info = zipfile.ZipInfo(sourceInfo.filename, sourceInfo.date_time)
+        info.compress_type = sourceInfo.compress_type
+        info.external_attr = sourceInfo.external_attr
+        info.create_system = sourceInfo.create_system
+        destinationArchive.writestr(info, sourceArchive.read(sourceInfo.filename))
+
+def _copyRawZipMember(sourceArchive, sourceInfo, destinationArchive):
+    """
+    XXX
+    zipfile doesn't have an API for this, so this
+    does what ZipFile._open_to_write does with
+    the parts of ZipFile that it uses. These have
+    been the same since Python 3.6.
+    """
+    # locate the data in the source
+    sourceFile = sourceArchive.fp
+    sourceFile.seek(sourceInfo.header_offset)
+    header = sourceFile.read(zipfile.sizeFileHeader)
+    if header[:4] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile("Bad magic number for file header")
+    nameLength, extraLength = struct.unpack("<HH", header[26:30])
+    sourceFile.seek(nameLength + extraLength, os.SEEK_CUR)
+    # make the info
+    info = zipfile.ZipInfo(sourceInfo.filename, sourceInfo.date_time)
+    info.compress_type = sourceInfo.compress_type
+    info.external_attr = sourceInfo.external_attr
+    info.create_system = sourceInfo.create_system
+    info.CRC = sourceInfo.CRC
+    info.compress_size = sourceInfo.compress_size
+    info.file_size = sourceInfo.file_size
+    zip64 = max(info.file_size, info.compress_size) > zipfile.ZIP64_LIMIT
+    # write
+    with destinationArchive._lock:
+        if destinationArchive._writing:
+            raise ValueError("Can't write to the ZIP file while there is another write handle open on it.")
+        destinationFile = destinationArchive.fp
+        destinationFile.seek(destinationArchive.start_dir)
+        info.header_offset = destinationFile.tell()
+        destinationArchive._writecheck(info)
+        destinationArchive._didModify = True
+        try:
+            destinationFile.write(info.FileHeader(zip64))
+            remaining = info.compress_size
+            while remaining:
+                block = sourceFile.read(min(remaining, storage.blockSize))
+                if not block:
+                    raise zipfile.BadZipFile("Truncated file data")
+                destinationFile.write(block)
+                remaining -= len(block)
+        except Exception:
+            # remove the partial member
+            destinationFile.seek(info.header_offset)
+            destinationFile.truncate()
+            raise
+        destinationArchive.start_dir = destinationFile.tell()
+        destinationArchive.filelist.append(info)
+        destinationArchive.NameToInfo[info.filename] = info
@@ -1,8 +1,26 @@
 import os
+import json
+import base64
+import datetime
 import itertools
 import filecmp
-from fontTools.ufoLib import fontInfoAttributesVersion3
-from fontParts.world import OpenFont
+import zipfile
+import heapq
+import hashlib
+import queue
+import threading
+import plistlib
+from xml.parsers.expat import ExpatError
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from fontTools.ufoLib import UFOReader, fontInfoAttributesVersion3
+from freezeDryer import storage
+from freezeDryer import ufoData
+from freezeDryer.tree import walkTree
+
+try:
+    from fontParts.world import OpenFont
+except ImportError:
+    OpenFont = None
 
 # ---------
 # Directory
@@ -13,102 +31,637 @@ def diffDirectories(
         root2,
         ignorePaths1=None,
         ignorePaths2=None,
+        ignoreMatcher1=None,
+        ignoreMatcher2=None,
+        onlyCompareFontDefaultLayers=True,
+        normalizeFontContours=True,
+        normalizeFontComponents=True,
+        normalizeFontAnchors=True,
+        normalizeFontGuidelines=True,
+        snapshot1=None,
+        snapshot2=None,
+        manifest1=None,
+        manifest2=None,
+        statCache1=None,
+        statCache2=None,
+        workerCount=1,
+        engine="fontParts"
+    ):
+    """
+    snapshot1 and snapshot2 may be TreeSnapshots
+    of the roots that have already been made.
+    Otherwise, the roots are walked here.
+
+    manifest1 and manifest2 may be the manifests
+    of states. Files with the same digest in both
+    are not compared. statCache1 and statCache2
+    may be manifests of a state that was committed
+    from a project root. The digests in them are
+    used for files in the root that have the same
+    size and modification time. Anything else is
+    hashed as needed.
+
+    If workerCount is more than 1, files are
+    compared in that many processes, so several
+    UFOs can be compared at the same time. The
+    results are the same as when they are compared
+    in order. The caller must be able to start
+    processes, which isn't the case in RoboFont,
+    and on platforms that spawn processes the
+    main module must be importable.
+
+    engine is passed to diffFile.
+
+    This collects everything from iterateDifferences.
+    """
+    events = iterateDifferences(
+        root1,
+        root2,
+        ignorePaths1=ignorePaths1,
+        ignorePaths2=ignorePaths2,
+        ignoreMatcher1=ignoreMatcher1,
+        ignoreMatcher2=ignoreMatcher2,
+        onlyCompareFontDefaultLayers=onlyCompareFontDefaultLayers,
+        normalizeFontContours=normalizeFontContours,
+        normalizeFontComponents=normalizeFontComponents,
+        normalizeFontAnchors=normalizeFontAnchors,
+        normalizeFontGuidelines=normalizeFontGuidelines,
+        snapshot1=snapshot1,
+        snapshot2=snapshot2,
+        manifest1=manifest1,
+        manifest2=manifest2,
+        statCache1=statCache1,
+        statCache2=statCache2,
+        workerCount=workerCount,
+        engine=engine
+    )
+    return collectDifferences(events)
+
+def iterateDifferences(
+        root1,
+        root2,
+        ignorePaths1=None,
+        ignorePaths2=None,
+        ignoreMatcher1=None,
+        ignoreMatcher2=None,
         onlyCompareFontDefaultLayers=True,
         normalizeFontContours=True,
         normalizeFontComponents=True,
         normalizeFontAnchors=True,
-        normalizeFontGuidelines=True
+        normalizeFontGuidelines=True,
+        snapshot1=None,
+        snapshot2=None,
+        manifest1=None,
+        manifest2=None,
+        statCache1=None,
+        statCache2=None,
+        workerCount=1,
+        engine="fontParts"
     ):
+    """
+    Compare two roots and yield the results as soon
+    as they are found. The arguments are the same as
+    the arguments for diffDirectories. Each result
+    is a dict with a "type":
+
+    - "paths" is always first. It has root1, root2,
+      added, removed and common, which is the list
+      of paths that will be compared.
+    - "glyph" is yielded for each glyph that is
+      different in a UFO that is being compared.
+      It has path, layer, glyph and differences.
+      layer is the name of the layer in root1.
+    - "file" is yielded when a path in common has
+      been compared. It has path and details, which
+      is None if nothing is different. For UFOs,
+      details includes the glyphs that were
+      already yielded.
+
+    The files are compared in the order of common,
+    but if workerCount is more than 1, the "file"
+    results come in the order that they finish and
+    the "glyph" results for a UFO come together
+    right before its "file" result. The comparisons
+    happen in another thread or in other processes,
+    so the consumer can show the results while the
+    rest are compared. If the iteration is stopped
+    early, the files that haven't been started
+    are not compared.
+    """
     # gather from first root
-    if ignorePaths1 is None:
-        ignorePaths1 = []
-    paths1 = _gatherFiles(root1, ignorePaths1)
-    paths1 = [
-        os.path.relpath(path, root1)
-        for path in paths1
-        if os.path.basename(path) != ".DS_Store"
-    ]
+    if snapshot1 is None:
+        snapshot1 = walkTree(root1, ignoreMatcher1, skipPaths=ignorePaths1, includeUFOContents=False)
+    paths1 = _gatherFiles(snapshot1)
     # gather from second root
-    if ignorePaths2 is None:
-        ignorePaths2 = []
-    paths2 = _gatherFiles(root2, ignorePaths2)
-    paths2 = [
-        os.path.relpath(path, root2)
-        for path in paths2
-        if os.path.basename(path) != ".DS_Store"
-    ]
+    if snapshot2 is None:
+        snapshot2 = walkTree(root2, ignoreMatcher2, skipPaths=ignorePaths2, includeUFOContents=False)
+    paths2 = _gatherFiles(snapshot2)
     # look for existance differences
-    added = []
-    removed = []
-    common = []
-    ufos = {}
-    allPaths = set(paths1) | set(paths2)
-    for path in sorted(allPaths):
-        if path in paths1 and path not in paths2:
-            removed.append(path)
-        elif path not in paths1 and path in paths2:
-            added.append(path)
-        else:
-            common.append(path)
-    # catch UFOs that were compressed on commit
-    pairedUFOs = []
-    for path in removed:
-        base, ext = os.path.splitext(path)
-        # XXX this assumes that the extensions will be all lowercase
-        if ext == ".ufoz":
-            if base + ".ufo" in added:
-                pairedUFOs.append((path, base + ".ufo"))
-    common.extend(pairedUFOs)
-    for before, after in pairedUFOs:
-        removed.remove(before)
-        added.remove(after)
+    added, removed, common = classifyPaths(paths1, paths2)
+    yield dict(
+        type="paths",
+        root1=root1,
+        root2=root2,
+        added=added,
+        removed=removed,
+        common=common
+    )
+    if not common:
+        return
     # look for differences
+    digestSource1 = makeDigestSource(root1, manifest1, statCache1)
+    digestSource2 = makeDigestSource(root2, manifest2, statCache2)
+    diffOptions = dict(
+        onlyCompareFontDefaultLayers=onlyCompareFontDefaultLayers,
+        normalizeFontContours=normalizeFontContours,
+        normalizeFontComponents=normalizeFontComponents,
+        normalizeFontAnchors=normalizeFontAnchors,
+        normalizeFontGuidelines=normalizeFontGuidelines,
+        engine=engine
+    )
+    if workerCount > 1:
+        tasks = _makeProcessTasks(common)
+        if len(tasks) > 1:
+            yield from _iterateCommonPathsInProcesses(
+                tasks,
+                digestSource1,
+                digestSource2,
+                diffOptions,
+                workerCount
+            )
+            return
+    yield from _iterateCommonPaths(common, digestSource1, digestSource2, diffOptions)
+
+def collectDifferences(events):
+    """
+    Collect the results from iterateDifferences
+    into the differences that diffDirectories
+    returns. The changed files are in the order of
+    common no matter what order they finished in.
+    """
+    differences = None
+    common = []
+    details = {}
+    for event in events:
+        eventType = event["type"]
+        if eventType == "paths":
+            differences = dict(
+                root1=event["root1"],
+                root2=event["root2"],
+                added=event["added"],
+                removed=event["removed"]
+            )
+            common = event["common"]
+        elif eventType == "file":
+            details[event["path"]] = event["details"]
     changed = {}
     for path in common:
         if isinstance(path, tuple):
-            path1 = os.path.join(root1, path[0])
-            path2 = os.path.join(root2, path[1])
             path = path[0]
+        if details.get(path) is not None:
+            changed[path] = details[path]
+    differences["changed"] = changed
+    return differences
+
+def iterateCollectedDifferences(differences):
+    """
+    Yield the same results as iterateDifferences
+    for differences that have already been collected.
+    Only the changed files are in common.
+    """
+    changed = differences["changed"]
+    yield dict(
+        type="paths",
+        root1=differences["root1"],
+        root2=differences["root2"],
+        added=differences["added"],
+        removed=differences["removed"],
+        common=list(changed.keys())
+    )
+    for path, details in changed.items():
+        fontDifferences = details["differences"]
+        if details["fileType"] == "UFO" and fontDifferences:
+            layers = fontDifferences.get("layers", {}).get("changed", {})
+            for layerDifferences in layers.values():
+                layerName = layerDifferences["layer1"]["name"]
+                glyphs = layerDifferences.get("glyphs", {}).get("changed", {})
+                for glyphName, glyphDifferences in glyphs.items():
+                    yield dict(
+                        type="glyph",
+                        path=path,
+                        layer=layerName,
+                        glyph=glyphName,
+                        differences=glyphDifferences
+                    )
+        yield dict(
+            type="file",
+            path=path,
+            details=details
+        )
+
+def haveDifferences(
+        root1,
+        root2,
+        ignorePaths1=None,
+        ignorePaths2=None,
+        ignoreMatcher1=None,
+        ignoreMatcher2=None,
+        snapshot1=None,
+        snapshot2=None,
+        manifest1=None,
+        manifest2=None,
+        statCache1=None,
+        statCache2=None
+    ):
+    """
+    Find out if anything is different between two
+    roots without finding out what. The arguments
+    are the same as the arguments for diffDirectories.
+    This stops at the first difference.
+
+    The paths are compared first, then the digests
+    that are already known from the manifests and
+    stat caches. Only the files that can't be
+    decided that way are read. Fonts are never
+    opened, so this compares the files rather
+    than the font data. A UFO may be different here
+    when diffDirectories finds nothing in it.
+    """
+    # gather from first root
+    if snapshot1 is None:
+        snapshot1 = walkTree(root1, ignoreMatcher1, skipPaths=ignorePaths1, includeUFOContents=False)
+    paths1 = _gatherFiles(snapshot1)
+    # gather from second root
+    if snapshot2 is None:
+        snapshot2 = walkTree(root2, ignoreMatcher2, skipPaths=ignorePaths2, includeUFOContents=False)
+    paths2 = _gatherFiles(snapshot2)
+    # look for existance differences
+    added, removed, common = classifyPaths(paths1, paths2)
+    if added or removed:
+        return True
+    # look for differences in what is already known
+    digestSource1 = makeDigestSource(root1, manifest1, statCache1)
+    digestSource2 = makeDigestSource(root2, manifest2, statCache2)
+    unknown = []
+    for path in common:
+        if isinstance(path, tuple):
+            relativePath1, relativePath2 = path
         else:
-            path1 = os.path.join(root1, path)
-            path2 = os.path.join(root2, path)
-        different, details = diffFile(
-            path1,
-            path2,
-            onlyCompareFontDefaultLayers=onlyCompareFontDefaultLayers,
-            normalizeFontContours=normalizeFontContours,
-            normalizeFontComponents=normalizeFontComponents,
-            normalizeFontAnchors=normalizeFontAnchors,
-            normalizeFontGuidelines=normalizeFontGuidelines
+            relativePath1 = relativePath2 = path
+        same = compareDigests(digestSource1, relativePath1, digestSource2, relativePath2, read=False)
+        if same is False:
+            return True
+        if same is None:
+            unknown.append((relativePath1, relativePath2))
+    # read what isn't known
+    for relativePath1, relativePath2 in unknown:
+        same = compareDigests(digestSource1, relativePath1, digestSource2, relativePath2)
+        if same is None:
+            path1 = os.path.join(root1, relativePath1)
+            path2 = os.path.join(root2, relativePath2)
+            same = filecmp.cmp(path1, path2, shallow=False)
+        if not same:
+            return True
+    return False
+
+def _iterateCommonPaths(common, digestSource1, digestSource2, diffOptions):
+    """
+    Compare the paths in order. This happens in
+    another thread so that the glyph results can be
+    yielded while a UFO is still being compared.
+    """
+    results = queue.Queue()
+    stop = threading.Event()
+    def compare():
+        for path in common:
+            if stop.is_set():
+                break
+            try:
+                _diffCommonPathEvents(digestSource1, digestSource2, path, diffOptions, results.put)
+            except BaseException as error:
+                # errors are handed to the consumer
+                results.put(error)
+                break
+    thread = threading.Thread(target=compare, daemon=True)
+    thread.start()
+    try:
+        remaining = len(common)
+        while remaining:
+            result = results.get()
+            if isinstance(result, BaseException):
+                raise result
+            if result["type"] == "file":
+                remaining -= 1
+            yield result
+    finally:
+        stop.set()
+        thread.join()
+
+# paths that aren't UFOs are usually decided by
+# their digests, so they are sent in groups to
+# keep the overhead of the processes down.
+processChunkSize = 64
+
+def _makeProcessTasks(common):
+    tasks = []
+    chunk = []
+    for path in common:
+        relativePath = path[0] if isinstance(path, tuple) else path
+        if os.path.splitext(relativePath)[-1].lower() in (".ufo", ".ufoz"):
+            tasks.append([path])
+            continue
+        chunk.append(path)
+        if len(chunk) == processChunkSize:
+            tasks.append(chunk)
+            chunk = []
+    if chunk:
+        tasks.append(chunk)
+    return tasks
+
+def _iterateCommonPathsInProcesses(tasks, digestSource1, digestSource2, diffOptions, workerCount):
+    """
+    Compare the paths in tasks, which are lists
+    of paths, in workerCount processes. Each UFO is
+    its own task, so several UFOs are compared at
+    the same time on different cores.
+
+    The results of a task are yielded together when
+    it is done, so the glyph results of a UFO come
+    all at once right before its file result.
+    """
+    executor = ProcessPoolExecutor(
+        max_workers=min(workerCount, len(tasks)),
+        initializer=_initializeDiffProcess,
+        initargs=(digestSource1, digestSource2, diffOptions)
+    )
+    futures = []
+    try:
+        for paths in tasks:
+            futures.append(executor.submit(_diffCommonPathsInProcess, paths))
+        for future in as_completed(futures):
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+
+# the digest sources and options are sent to each
+# process once rather than with every task.
+_processArguments = {}
+
+def _initializeDiffProcess(digestSource1, digestSource2, diffOptions):
+    _processArguments.update(
+        digestSource1=digestSource1,
+        digestSource2=digestSource2,
+        diffOptions=diffOptions
+    )
+
+def _diffCommonPathsInProcess(paths):
+    events = []
+    for path in paths:
+        _diffCommonPathEvents(
+            _processArguments["digestSource1"],
+            _processArguments["digestSource2"],
+            path,
+            _processArguments["diffOptions"],
+            events.append
+        )
+    return events
+
+def _diffCommonPathEvents(digestSource1, digestSource2, path, diffOptions, handleEvent):
+    """
+    Compare a path and give the "glyph" and "file"
+    results for it to handleEvent.
+    """
+    resultPath = path
+    if isinstance(path, tuple):
+        resultPath = path[0]
+    def glyphCallback(layerName, glyphName, glyphDifferences):
+        handleEvent(
+            dict(
+                type="glyph",
+                path=resultPath,
+                layer=layerName,
+                glyph=glyphName,
+                differences=glyphDifferences
+            )
+        )
+    path, details = _diffCommonPath(digestSource1, digestSource2, path, diffOptions, glyphCallback)
+    handleEvent(
+        dict(
+            type="file",
+            path=path,
+            details=details
         )
-        if different:
-            changed[path] = details
-    # compile and return
-    differences = dict(
-        root1=root1,
-        root2=root2,
-        added=added,
-        removed=removed,
-        changed=changed
     )
-    return differences
 
-def _gatherFiles(directory, ignore):
-    found = []
-    if directory in ignore:
-        return found
-    for fileName in os.listdir(directory):
-        path = os.path.join(directory, fileName)
-        if path in ignore:
-            continue
-        if os.path.isdir(path):
-            if os.path.splitext(path)[-1].lower() == ".ufo":
-                found.append(path)
+def _diffCommonPath(digestSource1, digestSource2, path, diffOptions, glyphCallback=None):
+    """
+    Compare a path that is in both roots. This returns
+    the path and the details or None if nothing
+    is different.
+    """
+    if isinstance(path, tuple):
+        relativePath1, relativePath2 = path
+        path = path[0]
+    else:
+        relativePath1 = relativePath2 = path
+    same = compareDigests(digestSource1, relativePath1, digestSource2, relativePath2)
+    if same:
+        return path, None
+    fileType = os.path.splitext(relativePath1)[-1].lower()
+    if same is not None and fileType not in (".ufo", ".ufoz"):
+        return path, dict(fileType=fileType, differences=None)
+    path1 = os.path.join(digestSource1["root"], relativePath1)
+    path2 = os.path.join(digestSource2["root"], relativePath2)
+    different, details = diffFile(path1, path2, glyphCallback=glyphCallback, **diffOptions)
+    if not different:
+        details = None
+    return path, details
+
+def classifyPaths(paths1, paths2):
+    """
+    Sort the paths in two roots into added, removed
+    and common. UFOs that were compressed, or
+    decompressed, between the two roots are paired
+    and included in common as (path1, path2).
+    """
+    paths1 = set(paths1)
+    paths2 = set(paths2)
+    added = sorted(paths2 - paths1)
+    removed = sorted(paths1 - paths2)
+    common = sorted(paths1 & paths2)
+    # catch UFOs that were compressed on commit
+    addedUFOs = {}
+    for path in added:
+        base, ext = os.path.splitext(path)
+        ext = ext.lower()
+        if ext in _pairedUFOExtensions:
+            addedUFOs[base, ext] = path
+    pairedUFOs = []
+    if addedUFOs:
+        for path in removed:
+            base, ext = os.path.splitext(path)
+            other = _pairedUFOExtensions.get(ext.lower())
+            if other is None:
+                continue
+            match = addedUFOs.pop((base, other), None)
+            if match is not None:
+                pairedUFOs.append((path, match))
+    if pairedUFOs:
+        pairedRemoved = set(before for before, after in pairedUFOs)
+        pairedAdded = set(after for before, after in pairedUFOs)
+        removed = [path for path in removed if path not in pairedRemoved]
+        added = [path for path in added if path not in pairedAdded]
+        common.extend(pairedUFOs)
+    return added, removed, common
+
+_pairedUFOExtensions = {
+    ".ufo" : ".ufoz",
+    ".ufoz" : ".ufo"
+}
+
+def _gatherFiles(snapshot):
+    paths = [
+        path
+        for path in snapshot.getTopLevelPaths()
+        if os.path.basename(path) != ".DS_Store"
+    ]
+    return paths
+
+# -------
+# Digests
+# -------
+
+def makeDigestSource(root, manifest=None, statCache=None):
+    """
+    Collect what is known about the digests of
+    the files in root. See diffDirectories.
+    """
+    if manifest is None:
+        manifest = {}
+    if statCache is None:
+        statCache = {}
+    source = dict(
+        root=root,
+        manifest=manifest,
+        ufos=storage.groupManifestByUFO(manifest),
+        statCache=statCache
+    )
+    return source
+
+def compareDigests(source1, relativePath1, source2, relativePath2, read=True):
+    """
+    Compare the digests of two files or UFOs.
+    This returns True if they are the same,
+    False if they are different and None if
+    that can't be known without reading both
+    files. In that case, the files are better
+    compared directly.
+
+    If read is False, nothing is read or hashed
+    and None is returned if the digests that are
+    already known aren't enough to decide.
+    """
+    fileType = os.path.splitext(relativePath1)[-1].lower()
+    if fileType in (".ufo", ".ufoz"):
+        digests1 = getUFODigests(source1, relativePath1, read=read)
+        digests2 = getUFODigests(source2, relativePath2, read=read)
+        if read:
+            return digests1 == digests2
+        if digests1 is None or digests2 is None:
+            return None
+        if digests1.keys() != digests2.keys():
+            return False
+        same = True
+        for name, digest1 in digests1.items():
+            digest2 = digests2[name]
+            if digest1 is None or digest2 is None:
+                same = None
+            elif digest1 != digest2:
+                return False
+        return same
+    digest1 = getFileDigest(source1, relativePath1, read=False)
+    digest2 = getFileDigest(source2, relativePath2, read=False)
+    if digest1 is None and digest2 is None:
+        return None
+    if not read and (digest1 is None or digest2 is None):
+        return None
+    if digest1 is None:
+        digest1 = getFileDigest(source1, relativePath1)
+    if digest2 is None:
+        digest2 = getFileDigest(source2, relativePath2)
+    return digest1 == digest2
+
+def getFileDigest(source, relativePath, read=True):
+    """
+    Get the digest of a file. If read is False,
+    this returns None rather than hashing it.
+    Racy files are in manifests without a digest,
+    so they are hashed.
+    """
+    entry = source["manifest"].get(relativePath)
+    if entry is not None and entry[2] is not None:
+        return entry[2]
+    path = os.path.join(source["root"], relativePath)
+    entry = source["statCache"].get(relativePath)
+    if entry is not None:
+        if storage.entryIsUnchanged(storage.makeManifestEntry(path), entry):
+            return entry[2]
+    if not read:
+        return None
+    return storage.hashFile(path)
+
+def getUFODigests(source, relativePath, read=True):
+    """
+    Get the digests of the files in a UFO or
+    UFOZ keyed by their path relative to the
+    UFO's parent, which is also their name in
+    a UFOZ.
+
+    If read is False, the digests that aren't
+    known are None. A UFOZ that isn't in the
+    manifest gives None rather than a dict.
+    """
+    # compressed UFOs are listed under
+    # their uncompressed paths.
+    ufoPath = os.path.splitext(relativePath)[0] + ".ufo"
+    entries = source["ufos"].get(relativePath, source["ufos"].get(ufoPath))
+    path = os.path.join(source["root"], relativePath)
+    if entries is not None and relativePath not in source["manifest"]:
+        digests = {name : entry[2] for name, entry in entries.items()}
+        # racy files are in the manifest without a digest
+        missing = [name for name, digest in digests.items() if digest is None]
+        if missing and read:
+            if os.path.isdir(path):
+                relativeParent = os.path.dirname(relativePath)
+                for name in missing:
+                    digests[name] = getFileDigest(source, os.path.join(relativeParent, name))
             else:
-                found += _gatherFiles(path, ignore)
-        else:
-            found.append(path)
-    return found
+                with zipfile.ZipFile(path, "r") as archive:
+                    for name in missing:
+                        with archive.open(name.replace(os.sep, "/"), "r") as f:
+                            digests[name] = storage.hashStream(f)
+        return digests
+    digests = {}
+    if os.path.isdir(path):
+        relativeParent = os.path.dirname(relativePath)
+        parent = os.path.dirname(path)
+        for directory, directoryNames, fileNames in os.walk(path):
+            for fileName in fileNames:
+                name = os.path.relpath(os.path.join(directory, fileName), parent)
+                digests[name] = getFileDigest(source, os.path.join(relativeParent, name), read=read)
+    elif not read:
+        return None
+    else:
+        with zipfile.ZipFile(path, "r") as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                name = info.filename.replace("/", os.sep)
+                with archive.open(info, "r") as f:
+                    digests[name] = storage.hashStream(f)
+    return digests
 
 # ----
 # File
@@ -121,24 +674,48 @@ def diffFile(
         normalizeFontContours=True,
         normalizeFontComponents=True,
         normalizeFontAnchors=True,
-        normalizeFontGuidelines=True
+        normalizeFontGuidelines=True,
+        engine="fontParts",
+        glyphCallback=None
     ):
+    """
+    engine determines how UFOs are read. "fontParts"
+    uses fontParts objects. "ufoLib" uses the lighter
+    objects in ufoData, which are much faster to make
+    and don't need fontParts or defcon. The results
+    have the same structure either way. "ufoLib" is
+    used if fontParts is not available.
+
+    glyphCallback is passed to diffFont.
+    """
     different = False
     fileType = os.path.splitext(path1)[-1].lower()
     if fileType in (".ufo", ".ufoz"):
         fileType = "UFO"
     details = dict(fileType=fileType, differences=None)
     if fileType == "UFO":
-        font1 = OpenFont(path1, showInterface=False)
-        font2 = OpenFont(path2, showInterface=False)
+        font1, font2 = openFonts(path1, path2, engine)
+        # the GLIFs are compared before any glyph
+        # objects are made, so only glyphs with
+        # changed GLIF data are loaded.
+        compressed = [os.path.splitext(path)[-1].lower() == ".ufoz" for path in (path1, path2)]
+        if all(compressed):
+            glifVendor1 = ZipGLIFVendor(path1)
+            glifVendor2 = ZipGLIFVendor(path2)
+        else:
+            glifVendor1 = makeGLIFVendorFromPath(path1)
+            glifVendor2 = makeGLIFVendorFromPath(path2)
         different, differences = diffFont(
             font1,
             font2,
+            glifVendor1=glifVendor1,
+            glifVendor2=glifVendor2,
             onlyCompareDefaultLayers=onlyCompareFontDefaultLayers,
             normalizeContours=normalizeFontContours,
             normalizeComponents=normalizeFontComponents,
             normalizeAnchors=normalizeFontAnchors,
-            normalizeGuidelines=normalizeFontGuidelines
+            normalizeGuidelines=normalizeFontGuidelines,
+            glyphCallback=glyphCallback
         )
         details["differences"] = differences
     else:
@@ -149,6 +726,27 @@ def diffFile(
 # Font
 # ----
 
+fontEngines = ("fontParts", "ufoLib")
+
+def getFontEngine(engine="fontParts"):
+    """
+    Get the engine that is used for engine.
+    "ufoLib" is used if fontParts is not available.
+    """
+    if engine not in fontEngines:
+        raise ValueError("Unknown font engine: %r" % engine)
+    if engine == "fontParts" and OpenFont is None:
+        engine = "ufoLib"
+    return engine
+
+def openFonts(path1, path2, engine="fontParts"):
+    engine = getFontEngine(engine)
+    if engine == "ufoLib":
+        return ufoData.openFont(path1), ufoData.openFont(path2)
+    font1 = OpenFont(path1, showInterface=False)
+    font2 = OpenFont(path2, showInterface=False)
+    return font1, font2
+
 def diffFont(
         font1,
         font2,
@@ -158,8 +756,14 @@ def diffFont(
         normalizeContours=True,
         normalizeComponents=True,
         normalizeAnchors=True,
-        normalizeGuidelines=True
+        normalizeGuidelines=True,
+        glyphCallback=None
     ):
+    """
+    If glyphCallback is given, it is called with the
+    layer name, glyph name and differences of each
+    glyph that is different as soon as it is found.
+    """
     if glifVendor1 is None:
         glifVendor1 = makeGLIFVendorFromLayers(font1)
     if glifVendor2 is None:
@@ -208,7 +812,8 @@ def diffFont(
         normalizeContours=normalizeContours,
         normalizeComponents=normalizeComponents,
         normalizeAnchors=normalizeAnchors,
-        normalizeGuidelines=normalizeGuidelines
+        normalizeGuidelines=normalizeGuidelines,
+        glyphCallback=glyphCallback
     )
     if layers:
         differences["layers"] = layers
@@ -238,9 +843,135 @@ def makeGLIFVendorFromLayers(font):
                     pass
                 else:
                     glif = glyphSet.getGLIF(glyphName)
-                    vendor[layerName, glyphName] = glif
+                    vendor[layerName, glyphName] = makeGLIFDigest(glif)
     return vendor
 
+def makeGLIFVendorFromPath(path):
+    """
+    Make a vendor for the GLIF data of the glyphs
+    in the UFO or UFOZ at path. The data is read
+    with fontTools.ufoLib, so no glyph objects are
+    made and defcon isn't needed.
+    """
+    return GLIFDigestVendor(path)
+
+def makeGLIFDigest(glif):
+    """
+    GLIF vendors hold digests rather than the GLIF
+    data so that the memory they use doesn't depend
+    on the size of the glyphs.
+    """
+    if isinstance(glif, str):
+        glif = glif.encode("utf8")
+    return hashlib.sha256(glif).digest()
+
+class GLIFDigestVendor(object):
+
+    """
+    A GLIF vendor that reads the GLIF data for a
+    layer from a UFO or UFOZ the first time that
+    one of the layer's glyphs is requested. It is
+    used the same as the dicts returned by
+    makeGLIFVendorFromLayers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._layers = {}
+
+    def get(self, key, default=None):
+        layerName, glyphName = key
+        digests = self._layers.get(layerName)
+        if digests is None:
+            digests = self._layers[layerName] = self._readLayer(layerName)
+        return digests.get(glyphName, default)
+
+    def _readLayer(self, layerName):
+        digests = {}
+        with UFOReader(self.path, validate=False) as reader:
+            if layerName not in reader.getLayerNames():
+                return digests
+            glyphSet = reader.getGlyphSet(layerName, validateRead=False)
+            for glyphName in glyphSet.keys():
+                digests[glyphName] = makeGLIFDigest(glyphSet.getGLIF(glyphName))
+        return digests
+
+class ZipGLIFVendor(GLIFDigestVendor):
+
+    """
+    A GLIF vendor for UFOZs that uses the CRC32 and
+    size that the zip's central directory holds for
+    each GLIF, so the GLIFs don't need to be inflated.
+    These can only be compared with the values from
+    another ZipGLIFVendor.
+
+    The layer and glyph contents are read straight
+    from the zip, which is only opened once. Making
+    a UFOReader for a UFOZ is much slower than this
+    when fs isn't installed.
+    """
+
+    def __init__(self, path):
+        super(ZipGLIFVendor, self).__init__(path)
+        self._directoryIsRead = False
+        self._directory = None
+
+    def _readLayer(self, layerName):
+        if not self._directoryIsRead:
+            self._directory = self._readDirectory()
+            self._directoryIsRead = True
+        if self._directory is None:
+            return super(ZipGLIFVendor, self)._readLayer(layerName)
+        rootName, infos, layers = self._directory
+        if layerName not in layers:
+            return {}
+        directoryName, contents = layers[layerName]
+        try:
+            contents = plistlib.loads(contents)
+        except (ValueError, ExpatError):
+            return super(ZipGLIFVendor, self)._readLayer(layerName)
+        digests = {}
+        for glyphName, fileName in contents.items():
+            info = infos.get("/".join((rootName, directoryName, fileName)))
+            if info is not None:
+                digests[glyphName] = (info.CRC, info.file_size)
+        return digests
+
+    def _readDirectory(self):
+        """
+        Read the zip's central directory and the data
+        of each layer's contents.plist. This returns
+        None if the zip isn't laid out like a UFOZ.
+        """
+        with zipfile.ZipFile(self.path, "r") as archive:
+            infos = {info.filename : info for info in archive.infolist()}
+            # UFOZs hold one directory with the UFO in it.
+            rootNames = set(
+                name.split("/")[0]
+                for name in infos.keys()
+                if "/" in name and not name.startswith("__MACOSX/")
+            )
+            if len(rootNames) != 1:
+                return None
+            rootName = rootNames.pop()
+            layerContentsPath = rootName + "/layercontents.plist"
+            if layerContentsPath in infos:
+                try:
+                    layerContents = plistlib.loads(archive.read(layerContentsPath))
+                    layerContents = [(layerName, directoryName) for layerName, directoryName in layerContents]
+                except (ValueError, TypeError, ExpatError):
+                    return None
+            else:
+                # UFO 2 has only the default layer.
+                layerContents = [("public.default", "glyphs")]
+            layers = {}
+            for layerName, directoryName in layerContents:
+                contentsPath = "/".join((rootName, directoryName, "contents.plist"))
+                if contentsPath not in infos:
+                    continue
+                layers[layerName] = (directoryName, archive.read(contentsPath))
+        return rootName, infos, layers
+
 # ----
 # Info
 # ----
@@ -253,9 +984,6 @@ def diffInfo(info1, info2):
         info2,
         attributes
     )
-    if differences:
-        differences["info1"] = info1
-        differences["info2"] = info2
     return differences
 
 # --------
@@ -269,9 +997,6 @@ def diffFeatures(features1, features2):
         features2,
         ("text",)
     )
-    if differences:
-        differences["features1"] = features1
-        differences["features2"] = features2
     return differences
 
 # ------
@@ -280,9 +1005,6 @@ def diffFeatures(features1, features2):
 
 def diffGroups(groups1, groups2):
     differences = diffDict(groups1, groups2)
-    if differences:
-        differences["groups1"] = groups1
-        differences["groups2"] = groups2
     return differences
 
 # -------
@@ -291,9 +1013,6 @@ def diffGroups(groups1, groups2):
 
 def diffKerning(kerning1, kerning2):
     differences = diffDict(kerning1, kerning2)
-    if differences:
-        differences["kerning1"] = kerning1
-        differences["kerning2"] = kerning2
     return differences
 
 # ---
@@ -302,9 +1021,6 @@ def diffKerning(kerning1, kerning2):
 
 def diffLib(lib1, lib2, ignore=None):
     differences = diffDict(lib1, lib2, ignore)
-    if differences:
-        differences["lib1"] = lib1
-        differences["lib2"] = lib2
     return differences
 
 # ------
@@ -320,7 +1036,8 @@ def diffLayers(
         normalizeContours=True,
         normalizeComponents=True,
         normalizeAnchors=True,
-        normalizeGuidelines=True
+        normalizeGuidelines=True,
+        glyphCallback=None
     ):
     if glifVendor1 is None:
         glifVendor1 = {}
@@ -343,7 +1060,8 @@ def diffLayers(
         normalizeContours=normalizeContours,
         normalizeComponents=normalizeComponents,
         normalizeAnchors=normalizeAnchors,
-        normalizeGuidelines=normalizeGuidelines
+        normalizeGuidelines=normalizeGuidelines,
+        glyphCallback=glyphCallback
     )
     if layerDifferences:
         differences["changed"][None] = layerDifferences
@@ -352,10 +1070,10 @@ def diffLayers(
         layerNames2 = set([layerName for layerName in font2.layerOrder if layerName != font2.defaultLayer.name])
         added = layerNames2 - layerNames1
         if added:
-            differences["added"] = {layerName : font2.getLayer(layerName) for layerName in added}
+            differences["added"] = list(sorted(added))
         removed = layerNames1 - layerNames2
         if removed:
-            differences["removed"] = {layerName : font1.getLayer(layerName) for layerName in removed}
+            differences["removed"] = list(sorted(removed))
         common = layerNames1 & layerNames2
         changed = []
         for name in common:
@@ -369,7 +1087,8 @@ def diffLayers(
                 normalizeContours=normalizeContours,
                 normalizeComponents=normalizeComponents,
                 normalizeAnchors=normalizeAnchors,
-                normalizeGuidelines=normalizeGuidelines
+                normalizeGuidelines=normalizeGuidelines,
+                glyphCallback=glyphCallback
             )
             if layerDifferences:
                 differences["changed"][name] = layerDifferences
@@ -389,7 +1108,8 @@ def diffLayer(
         normalizeContours=True,
         normalizeComponents=True,
         normalizeAnchors=True,
-        normalizeGuidelines=True
+        normalizeGuidelines=True,
+        glyphCallback=None
     ):
     if glifVendor1 is None:
         glifVendor1 = {}
@@ -441,13 +1161,15 @@ def diffLayer(
             )
             if glyphDifferences:
                 glyphsDifferences["changed"][glyphName] = glyphDifferences
+                if glyphCallback is not None:
+                    glyphCallback(layer1.name, glyphName, glyphDifferences)
     if not glyphsDifferences["changed"]:
         del glyphsDifferences["changed"]
     if glyphsDifferences:
         differences["glyphs"] = glyphsDifferences
     if differences:
-        differences["layer1"] = layer1
-        differences["layer2"] = layer2
+        differences["layer1"] = makeLayerRecord(layer1)
+        differences["layer2"] = makeLayerRecord(layer2)
     return differences
 
 def _getGlyphOrder(font):
@@ -505,8 +1227,8 @@ def diffGlyph(
     if lib:
         differences["lib"] = lib
     if differences:
-        differences["glyph1"] = glyph1
-        differences["glyph2"] = glyph2
+        differences["glyph1"] = makeGlyphRecord(glyph1)
+        differences["glyph2"] = makeGlyphRecord(glyph2)
     return differences
 
 # --------
@@ -517,21 +1239,16 @@ def diffContours(glyph1, glyph2, normalize=True):
     contours1 = [contour for contour in glyph1.contours]
     contours2 = [contour for contour in glyph2.contours]
     if normalize:
-        contours1, contours2 = matchObjectsWithAttributes(
-            contours1,
-            contours2,
-            ("identifier",),
-            (">len segments", "area")
-        )
+        contours1, contours2 = matchContours(contours1, contours2)
     pairs = itertools.zip_longest(contours1, contours2)
     added = []
     removed = []
     changed = []
     for contour1, contour2 in pairs:
         if contour1 is None:
-            added.append(contour2)
+            added.append(makeContourRecord(contour2))
         elif contour2 is None:
-            removed.append(contour1)
+            removed.append(makeContourRecord(contour1))
         else:
             contourDifferences = diffContour(contour1, contour2, normalize=normalize)
             if contourDifferences:
@@ -550,96 +1267,175 @@ def diffContours(glyph1, glyph2, normalize=True):
 # -------
 
 def diffContour(contour1, contour2, normalize=True):
+    points1 = contour1.points
+    points2 = contour2.points
+    values1 = [_pointValues(point) for point in points1]
+    values2 = [_pointValues(point) for point in points2]
     # basic attributes
     differences = diffObject(
         contour1,
         contour2,
-        ("identifier", "index", "clockwise")
+        ("identifier", "index")
     )
-    # normalize
-    original1 = contour1
-    original2 = contour2
-    if normalize:
-        contour1, contour2 = _normalizeContours(contour1, contour2)
-    # compare points
-    points1 = [_pointData(point) for point in contour1.points]
-    points2 = [_pointData(point) for point in contour2.points]
-    added = []
-    removed = []
+    # identical outlines have the same direction
+    # and don't need to be normalized.
+    if values1 != values2:
+        clockwise1 = contour1.clockwise
+        clockwise2 = contour2.clockwise
+        if clockwise1 != clockwise2:
+            differences["clockwise"] = dict(value1=clockwise1, value2=clockwise2)
+        # normalize
+        if normalize and not _pointValuesAreOpen(values1) and not _pointValuesAreOpen(values2):
+            if clockwise1 != clockwise2:
+                values2 = _reversePointValues(values2)
+            values1, values2 = _alignPointValues(values1, values2)
+        # compare points
+        pointDifferences = _diffPointValues(values1, values2)
+        if pointDifferences:
+            differences["points"] = pointDifferences
+    # store the contours
+    if differences:
+        differences["contour1"] = makeContourRecord(contour1)
+        differences["contour2"] = makeContourRecord(contour2)
+    return differences
+
+# Normalization works on lists of point values, not
+# on the contours. The contours would otherwise have
+# to be copied before they could be changed.
+
+def _pointValues(point):
+    return (point.name, point.identifier, point.x, point.y, point.type, point.smooth)
+
+_pointAttributes = ("name", "identifier", "x", "y", "type", "smooth")
+
+def _pointValuesAreOpen(values):
+    if not values:
+        return True
+    return values[0][4] == "move"
+
+def _reversePointValues(values):
+    """
+    Reverse the direction of closed contour point values
+    in the same way as fontTools' ReverseContourPointPen.
+    The first point stays first and the segment types
+    move to the other end of their segments.
+    """
+    count = len(values)
+    order = [-index % count for index in range(count)]
+    lastSegmentType = None
+    for index in order[::-1]:
+        segmentType = values[index][4]
+        if segmentType != "offcurve":
+            lastSegmentType = segmentType
+            break
+    reversedValues = []
+    for index in order:
+        name, identifier, x, y, segmentType, smooth = values[index]
+        if segmentType != "offcurve":
+            segmentType, lastSegmentType = lastSegmentType, segmentType
+        reversedValues.append((name, identifier, x, y, segmentType, smooth))
+    return reversedValues
+
+def _alignPointValues(values1, values2):
+    """
+    Rotate closed contour point values so that they
+    start at the same place. If the on curve points
+    have identifiers, the second contour is rotated
+    so that its first on curve point with an identifier
+    in the first contour has the same index as it does
+    there. Otherwise both are rotated to the segment
+    with the lowest on curve point, as in fontParts'
+    autoStartSegment.
+    """
+    segments1 = _getSegmentOnCurves(values1)
+    segments2 = _getSegmentOnCurves(values2)
+    # find a start point based on identifiers
+    identifiers1 = {
+        values1[pointIndex][1] : pointIndex
+        for pointIndex in segments1
+        if values1[pointIndex][1] is not None
+    }
+    if identifiers1:
+        for pointIndex2 in sorted(segments2):
+            pointIndex1 = identifiers1.get(values2[pointIndex2][1])
+            if pointIndex1 is not None:
+                shift = (pointIndex2 - pointIndex1) % len(values2)
+                values2 = values2[shift:] + values2[:shift]
+                break
+    # guess the start segment
+    else:
+        values1 = _autoStartSegment(values1, segments1)
+        values2 = _autoStartSegment(values2, segments2)
+    return values1, values2
+
+def _getSegmentOnCurves(values):
+    """
+    Get the index of the on curve point in each segment
+    of closed contour point values. This follows the
+    segment order of fontParts, where the segment that
+    ends with the first on curve point is last.
+    """
+    onCurves = [
+        index
+        for index, value in enumerate(values)
+        if value[4] != "offcurve"
+    ]
+    return onCurves[1:] + onCurves[:1]
+
+def _setStartSegment(values, segments, segmentIndex):
+    if len(segments) < 2 or segmentIndex == 0:
+        return values
+    # the on curve point of the previous segment
+    # becomes the first point. this matches
+    # fontParts' setStartSegment.
+    pointIndex = segments[segmentIndex - 1]
+    return values[pointIndex:] + values[:pointIndex]
+
+def _autoStartSegment(values, segments):
+    startIndex = 0
+    startOn = None
+    for segmentIndex, pointIndex in enumerate(segments):
+        on = values[pointIndex]
+        if startOn is None or (on[3], on[2]) < (startOn[3], startOn[2]):
+            startOn = on
+            startIndex = segmentIndex
+    return _setStartSegment(values, segments, startIndex)
+
+def _diffPointValues(values1, values2):
+    """
+    Compare the point values. The values of each point
+    are in a tuple so that the lists can be compared in
+    bulk and dicts are only made for the points that
+    are different.
+    """
+    commonCount = min(len(values1), len(values2))
+    added = [_makePointRecord(value) for value in values2[commonCount:]]
+    removed = [_makePointRecord(value) for value in values1[commonCount:]]
     changed = []
-    pairs = itertools.zip_longest(points1, points2)
-    for point1, point2 in pairs:
-        if point1 is None:
-            added.append(point2["object"])
-        elif point2 is None:
-            removed.append(point1["object"])
-        else:
+    if values1[:commonCount] != values2[:commonCount]:
+        for index in range(commonCount):
+            value1 = values1[index]
+            value2 = values2[index]
+            if value1 == value2:
+                continue
             pointDifferences = {}
-            for attr in point1.keys():
-                if attr == "object":
-                    continue
-                value1 = point1[attr]
-                value2 = point2[attr]
-                if value1 != value2:
-                    pointDifferences[attr] = dict(value1=value1, value2=value2)
-            if pointDifferences:
-                pointDifferences["point1"] = point1["object"]
-                pointDifferences["point2"] = point2["object"]
-                changed.append(pointDifferences)
-    pointDifferences = {}
+            for attr, attrValue1, attrValue2 in zip(_pointAttributes, value1, value2):
+                if attrValue1 != attrValue2:
+                    pointDifferences[attr] = dict(value1=attrValue1, value2=attrValue2)
+            pointDifferences["point1"] = _makePointRecord(value1)
+            pointDifferences["point2"] = _makePointRecord(value2)
+            changed.append(pointDifferences)
+    differences = {}
     if added:
-        pointDifferences["added"] = added
+        differences["added"] = added
     if removed:
-        pointDifferences["removed"] = removed
+        differences["removed"] = removed
     if changed:
-        pointDifferences["changed"] = changed
-    if pointDifferences:
-        differences["points"] = pointDifferences
-    # store the contours
-    if differences:
-        differences["contour1"] = original1
-        differences["contour2"] = original2
+        differences["changed"] = changed
     return differences
 
-def _normalizeContours(contour1, contour2):
-    contour1 = contour1.copy()
-    contour2 = contour2.copy()
-    if contour1.open or contour2.open:
-        pass
-    else:
-        # set a consistent direction
-        if contour1.clockwise != contour2.clockwise:
-            contour2.clockwise = contour1.clockwise
-        # find a start segment based on identifiers
-        identifiers1 = {
-            segment.onCurve.identifier : index
-            for index, segment in enumerate(contour1)
-            if segment.onCurve.identifier is not None
-        }
-        if identifiers1:
-            for segment in contour2:
-                identifier = segment.onCurve.identifier
-                index = identifiers1.get(identifier)
-                if index is not None:
-                    contour2.setStartSegment(index)
-                    break
-        # guess the start segment
-        else:
-            contour1.autoStartSegment()
-            contour2.autoStartSegment()
-    return contour1, contour2
-
-def _pointData(point):
-    data = dict(
-        object=point,
-        name=point.name,
-        identifier=point.identifier,
-        x=point.x,
-        y=point.y,
-        type=point.type,
-        smooth=point.smooth,
-    )
-    return data
+def _makePointRecord(values):
+    return dict(zip(_pointAttributes, values))
 
 # ---------
 # Component
@@ -649,17 +1445,13 @@ def diffComponents(glyph1, glyph2, normalize=True):
     components1 = [component for component in glyph1.components]
     components2 = [component for component in glyph2.components]
     if normalize:
-        components1, components2 = matchObjectsWithAttributes(
-            components1,
-            components2,
-            ("identifier", "baseGlyph"),
-            ("transformation", "baseGlyph")
-        )
+        components1, components2 = matchComponents(components1, components2)
     differences = diffObjects(
         components1,
         components2,
         ("baseGlyph", "transformation", "identifier"),
-        "component"
+        "component",
+        makeComponentRecord
     )
     return differences
 
@@ -681,7 +1473,8 @@ def diffAnchors(glyph1, glyph2, normalize=True):
         anchors1,
         anchors2,
         ("name", "color", "x", "y", "identifier"),
-        "anchor"
+        "anchor",
+        makeAnchorRecord
     )
     return differences
 
@@ -707,7 +1500,8 @@ def diffGuidelines(object1, object2, normalize=True):
         guidelines1,
         guidelines2,
         (">naked name", "color", "angle", "x", "y", "identifier"),
-        "guideline"
+        "guideline",
+        makeGuidelineRecord
     )
     return differences
 
@@ -721,15 +1515,321 @@ def diffImage(image1, image2):
         image2,
         ("data", "transformation")
     )
+    if "data" in differences:
+        # keep digests rather than the image data
+        # so that the differences stay small.
+        for key, data in differences["data"].items():
+            if data is not None:
+                differences["data"][key] = hashlib.sha256(data).hexdigest()
     if differences:
-        differences["image1"] = image1
-        differences["image2"] = image2
+        differences["image1"] = makeImageRecord(image1)
+        differences["image2"] = makeImageRecord(image2)
     return differences
 
+# -------
+# Records
+# -------
+
+# The differences hold plain data rather than font
+# objects so that the fonts don't stay in memory and
+# so that the differences can be written to disk with
+# dumpDifferences. Glyphs are recorded with the path
+# to their font so that they can be opened again when
+# they need to be drawn.
+
+def makeGlyphRecord(glyph):
+    record = dict(
+        path=glyph.font.path,
+        layer=glyph.layer.name,
+        name=glyph.name
+    )
+    return record
+
+def makeLayerRecord(layer):
+    record = dict(
+        name=layer.name,
+        default=layer.name == layer.font.defaultLayer.name
+    )
+    return record
+
+def makeContourRecord(contour):
+    record = dict(
+        index=contour.index,
+        identifier=contour.identifier
+    )
+    return record
+
+def makeComponentRecord(component):
+    record = dict(
+        index=component.index,
+        baseGlyph=component.baseGlyph,
+        transformation=tuple(component.transformation),
+        identifier=component.identifier
+    )
+    return record
+
+def makeAnchorRecord(anchor):
+    record = dict(
+        name=anchor.name,
+        x=anchor.x,
+        y=anchor.y,
+        color=_makeColorRecord(anchor.color),
+        identifier=anchor.identifier
+    )
+    return record
+
+def makeGuidelineRecord(guideline):
+    record = dict(
+        name=guideline.naked().name,
+        x=guideline.x,
+        y=guideline.y,
+        angle=guideline.angle,
+        color=_makeColorRecord(guideline.color),
+        identifier=guideline.identifier
+    )
+    return record
+
+def makeImageRecord(image):
+    record = dict(
+        transformation=tuple(image.transformation),
+        color=_makeColorRecord(image.color)
+    )
+    return record
+
+def _makeColorRecord(color):
+    if color is None:
+        return None
+    return tuple(color)
+
 # -------
 # Pairing
 # -------
 
+def matchContours(contours1, contours2):
+    """
+    Pair contours for comparison. Contours are paired
+    by identifier, then by identical point coordinates
+    and then by the nearest bounds. Contours are only
+    left unpaired if one glyph has more than the other.
+    """
+    signatures1 = [_getContourSignature(contour) for contour in contours1]
+    signatures2 = [_getContourSignature(contour) for contour in contours2]
+    return _matchObjectsWithSignatures(contours1, contours2, signatures1, signatures2)
+
+def _getContourSignature(contour):
+    coordinates = [(point.x, point.y) for point in contour.points]
+    if coordinates:
+        xs, ys = zip(*coordinates)
+        box = (min(xs), min(ys), max(xs), max(ys))
+    else:
+        box = (0, 0, 0, 0)
+    # the coordinates are sorted so that the
+    # key doesn't depend on the start point
+    # or the direction.
+    key = tuple(sorted(coordinates))
+    return (contour.identifier, key, None, box)
+
+def matchComponents(components1, components2):
+    """
+    Pair components for comparison. Components are
+    paired by identifier, then by identical base glyph
+    and transformation, then by the nearest offset with
+    the same base glyph and then by the nearest offset.
+    """
+    signatures1 = [_getComponentSignature(component) for component in components1]
+    signatures2 = [_getComponentSignature(component) for component in components2]
+    return _matchObjectsWithSignatures(components1, components2, signatures1, signatures2)
+
+def _getComponentSignature(component):
+    transformation = tuple(component.transformation)
+    x, y = transformation[4:]
+    key = (component.baseGlyph, transformation)
+    return (component.identifier, key, component.baseGlyph, (x, y, x, y))
+
+def _matchObjectsWithSignatures(objects1, objects2, signatures1, signatures2):
+    """
+    A signature is a tuple of (identifier, key, group, box).
+    Objects are paired with the same identifier, then with
+    the same key, then with the nearest box in the same
+    group and then with the nearest box. Identifiers and
+    keys that are None are never paired.
+    """
+    unpaired1 = list(range(len(objects1)))
+    unpaired2 = list(range(len(objects2)))
+    pairs = []
+    for position in (0, 1):
+        keys1 = [signature[position] for signature in signatures1]
+        keys2 = [signature[position] for signature in signatures2]
+        found, unpaired1, unpaired2 = _pairIndexesWithKeys(unpaired1, unpaired2, keys1, keys2)
+        pairs += found
+    boxes1 = [signature[3] for signature in signatures1]
+    boxes2 = [signature[3] for signature in signatures2]
+    groups = {}
+    for index, unpaired, signatures in ((0, unpaired1, signatures1), (1, unpaired2, signatures2)):
+        for objectIndex in unpaired:
+            group = signatures[objectIndex][2]
+            if group not in groups:
+                groups[group] = ([], [])
+            groups[group][index].append(objectIndex)
+    if len(groups) > 1:
+        unpaired1 = []
+        unpaired2 = []
+        for groupIndexes1, groupIndexes2 in groups.values():
+            found, groupIndexes1, groupIndexes2 = _pairIndexesWithBoxes(groupIndexes1, groupIndexes2, boxes1, boxes2)
+            pairs += found
+            unpaired1 += groupIndexes1
+            unpaired2 += groupIndexes2
+        unpaired1.sort()
+        unpaired2.sort()
+    found, unpaired1, unpaired2 = _pairIndexesWithBoxes(unpaired1, unpaired2, boxes1, boxes2)
+    pairs += found
+    pairs.sort()
+    matched1 = [objects1[index1] for index1, index2 in pairs]
+    matched2 = [objects2[index2] for index1, index2 in pairs]
+    matched1 += [objects1[index] for index in unpaired1]
+    matched2 += [objects2[index] for index in unpaired2]
+    return matched1, matched2
+
+def _pairIndexesWithKeys(indexes1, indexes2, keys1, keys2):
+    available = {}
+    for index2 in reversed(indexes2):
+        key = keys2[index2]
+        if key is not None:
+            if key not in available:
+                available[key] = []
+            available[key].append(index2)
+    pairs = []
+    unpaired1 = []
+    for index1 in indexes1:
+        candidates = available.get(keys1[index1])
+        if candidates:
+            pairs.append((index1, candidates.pop()))
+        else:
+            unpaired1.append(index1)
+    paired2 = set(index2 for index1, index2 in pairs)
+    unpaired2 = [index2 for index2 in indexes2 if index2 not in paired2]
+    return pairs, unpaired1, unpaired2
+
+def _pairIndexesWithBoxes(indexes1, indexes2, boxes1, boxes2):
+    """
+    Pair indexes with the nearest boxes, the closest
+    of all first, until one side runs out.
+    """
+    if not indexes1 or not indexes2:
+        return [], indexes1, indexes2
+    boxIndex = _BoxIndex(boxes2, indexes2)
+    heap = []
+    for index1 in indexes1:
+        distance, index2 = boxIndex.nearest(boxes1[index1])
+        heap.append((distance, index1, index2))
+    heapq.heapify(heap)
+    pairs = []
+    while heap and len(boxIndex):
+        distance, index1, index2 = heapq.heappop(heap)
+        if index2 in boxIndex:
+            pairs.append((index1, index2))
+            boxIndex.remove(index2)
+        else:
+            # the nearest was taken by something closer
+            distance, index2 = boxIndex.nearest(boxes1[index1])
+            heapq.heappush(heap, (distance, index1, index2))
+    paired1 = set(index1 for index1, index2 in pairs)
+    paired2 = set(index2 for index1, index2 in pairs)
+    unpaired1 = [index1 for index1 in indexes1 if index1 not in paired1]
+    unpaired2 = [index2 for index2 in indexes2 if index2 not in paired2]
+    return pairs, unpaired1, unpaired2
+
+class _BoxIndex(object):
+
+    """
+    A grid of box centers for finding the box that is
+    nearest to another box. The distance between two
+    boxes is the sum of the differences of their edges.
+    """
+
+    def __init__(self, boxes, indexes):
+        self.boxes = boxes
+        centers = [_getBoxCenter(boxes[index]) for index in indexes]
+        xs, ys = zip(*centers)
+        size = max(max(xs) - min(xs), max(ys) - min(ys))
+        # about one box per cell
+        self.cellSize = size / max(1, int(len(indexes) ** 0.5)) or 1
+        self.cells = {}
+        self.indexes = set()
+        for index in indexes:
+            self.add(index)
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __contains__(self, index):
+        return index in self.indexes
+
+    def _getCell(self, box):
+        x, y = _getBoxCenter(box)
+        return int(x // self.cellSize), int(y // self.cellSize)
+
+    def add(self, index):
+        cell = self._getCell(self.boxes[index])
+        if cell not in self.cells:
+            self.cells[cell] = set()
+        self.cells[cell].add(index)
+        self.indexes.add(index)
+
+    def remove(self, index):
+        cell = self._getCell(self.boxes[index])
+        self.cells[cell].discard(index)
+        if not self.cells[cell]:
+            del self.cells[cell]
+        self.indexes.discard(index)
+
+    def nearest(self, box):
+        """
+        Get the distance to and the index of the nearest
+        box or (None, None) if there are no boxes.
+        """
+        best = (None, None)
+        if not self.indexes:
+            return best
+        column, row = self._getCell(box)
+        ring = 0
+        while True:
+            # a big ring costs more than
+            # looking at every box.
+            if ring * 8 > len(self.indexes):
+                return min(
+                    (_getBoxDistance(box, self.boxes[index]), index)
+                    for index in self.indexes
+                )
+            for cell in _iterateRingCells(column, row, ring):
+                for index in self.cells.get(cell, ()):
+                    candidate = (_getBoxDistance(box, self.boxes[index]), index)
+                    if best[0] is None or candidate < best:
+                        best = candidate
+            # boxes in the rings outside of this one
+            # are more than this far away.
+            if best[0] is not None and best[0] <= 2 * ring * self.cellSize:
+                return best
+            ring += 1
+
+def _iterateRingCells(column, row, ring):
+    if ring == 0:
+        yield column, row
+        return
+    for offset in range(-ring, ring + 1):
+        yield column + offset, row - ring
+        yield column + offset, row + ring
+    for offset in range(-ring + 1, ring):
+        yield column - ring, row + offset
+        yield column + ring, row + offset
+
+def _getBoxCenter(box):
+    xMin, yMin, xMax, yMax = box
+    return (xMin + xMax) / 2, (yMin + yMax) / 2
+
+def _getBoxDistance(box1, box2):
+    return sum(abs(value1 - value2) for value1, value2 in zip(box1, box2))
+
 def matchObjectsWithAttributes(objects1, objects2, matchAttributes, sortAttributes):
     matched1 = []
     matched2 = []
@@ -807,7 +1907,8 @@ def _fancyGetAttr(obj, attr):
 def diffObjects(
         objects1, objects2,
         compareAttributes,
-        objectTypeTag
+        objectTypeTag,
+        makeRecord
     ):
     added = []
     removed = []
@@ -815,14 +1916,14 @@ def diffObjects(
     pairs = itertools.zip_longest(objects1, objects2)
     for object1, object2 in pairs:
         if object1 is None:
-            added.append(object2)
+            added.append(makeRecord(object2))
         elif object2 is None:
-            removed.append(object1)
+            removed.append(makeRecord(object1))
         else:
             d = diffObject(object1, object2, compareAttributes)
             if d:
-                d[objectTypeTag + "1"] = object1
-                d[objectTypeTag + "2"] = object2
+                d[objectTypeTag + "1"] = makeRecord(object1)
+                d[objectTypeTag + "2"] = makeRecord(object2)
                 changed.append(d)
     differences = {}
     if added:
@@ -865,3 +1966,55 @@ def diffDict(dict1, dict2, ignore=None):
     if changed:
         differences["changed"] = changed
     return differences
+
+# -------------
+# Serialization
+# -------------
+
+# this changes when the structure of the
+# differences or their JSON changes.
+differencesFormatVersion = 0
+
+def dumpDifferences(differences):
+    """
+    Convert differences to a JSON string. Tuples, dicts
+    with keys that aren't strings, bytes and dates are
+    tagged so that loadDifferences gives back the same
+    differences.
+    """
+    return json.dumps(_packDifferences(differences), separators=(",", ":"))
+
+def loadDifferences(text):
+    return _unpackDifferences(json.loads(text))
+
+def _packDifferences(value):
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value.keys()):
+            return {key : _packDifferences(item) for key, item in value.items()}
+        return {"__dict__" : [[_packDifferences(key), _packDifferences(item)] for key, item in value.items()]}
+    if isinstance(value, tuple):
+        return {"__tuple__" : [_packDifferences(item) for item in value]}
+    if isinstance(value, list):
+        return [_packDifferences(item) for item in value]
+    if isinstance(value, bytes):
+        return {"__bytes__" : base64.b64encode(value).decode("ascii")}
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__" : value.isoformat()}
+    return value
+
+def _unpackDifferences(value):
+    if isinstance(value, list):
+        return [_unpackDifferences(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if len(value) == 1:
+        tag, data = list(value.items())[0]
+        if tag == "__dict__":
+            return {_unpackDifferences(key) : _unpackDifferences(item) for key, item in data}
+        if tag == "__tuple__":
+            return tuple(_unpackDifferences(item) for item in data)
+        if tag == "__bytes__":
+            return base64.b64decode(data)
+        if tag == "__datetime__":
+            return datetime.datetime.fromisoformat(data)
+    return {key : _unpackDifferences(item) for key, item in value.items()}
@@ -0,0 +1,148 @@
+import os
+import json
+import uuid
+import hashlib
+from freezeDryer import storage
+
+# ----------
+# Diff Cache
+# ----------
+
+diffCacheFormatVersion = 1
+
+differencesExtension = ".json"
+reportExtension = ".html"
+
+def getDiffCacheDirectory(archiveDirectory):
+    """
+    The states in an archive never change, so the
+    differences between two of them only need to be
+    compiled once. They are stored in here with
+    one file for the differences and, optionally,
+    one file for the report made from them.
+
+    The cache is limited by size. When it grows
+    past the limit, the entries that were used
+    least recently are removed. Reading an entry
+    touches its files, so their modification time
+    is the time of the last use.
+    """
+    return os.path.join(storage.getArchiveDataDirectory(archiveDirectory), "diffs")
+
+def makeDiffCacheKey(statePath1, statePath2, normalize, onlyCompareFontDefaultLayers, engine):
+    """
+    The state paths are used instead of the stamps so
+    that the paths stored in the differences are
+    always the paths of the states. The engine and
+    the format versions are part of the key, so
+    entries made by another engine or another
+    version of Freeze Dryer are never read.
+    """
+    from freezeDryer import diff
+    data = [
+        diffCacheFormatVersion,
+        diff.differencesFormatVersion,
+        diff.getFontEngine(engine),
+        os.path.normpath(statePath1),
+        os.path.normpath(statePath2),
+        bool(normalize),
+        bool(onlyCompareFontDefaultLayers)
+    ]
+    data = json.dumps(data, separators=(",", ":")).encode("utf8")
+    return hashlib.sha256(data).hexdigest()
+
+def readCachedDifferences(archiveDirectory, key):
+    """
+    Read the differences for key. This returns None
+    if they are not in the cache or can't be read.
+    """
+    from freezeDryer import diff
+    path = _getEntryPath(archiveDirectory, key, differencesExtension)
+    text = _readEntry(path)
+    if text is None:
+        return None
+    try:
+        return diff.loadDifferences(text)
+    except (ValueError, AttributeError):
+        return None
+
+def writeCachedDifferences(archiveDirectory, key, differences, maximumSize):
+    from freezeDryer import diff
+    text = diff.dumpDifferences(differences)
+    _writeEntry(archiveDirectory, key, differencesExtension, text, maximumSize)
+
+def readCachedDiffReport(archiveDirectory, key):
+    """
+    Read the report for key. This returns None
+    if it is not in the cache or can't be read.
+    """
+    path = _getEntryPath(archiveDirectory, key, reportExtension)
+    return _readEntry(path)
+
+def writeCachedDiffReport(archiveDirectory, key, report, maximumSize):
+    _writeEntry(archiveDirectory, key, reportExtension, report, maximumSize)
+
+def pruneDiffCache(archiveDirectory, maximumSize):
+    """
+    Remove the least recently used files until the
+    cache is no larger than maximumSize bytes.
+    """
+    directory = getDiffCacheDirectory(archiveDirectory)
+    try:
+        with os.scandir(directory) as entries:
+            files = []
+            for entry in entries:
+                # skip entries that are being written
+                if not entry.is_file() or entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    info = entry.stat()
+                except OSError:
+                    continue
+                files.append((info.st_mtime_ns, entry.name, info.st_size))
+    except OSError:
+        return
+    size = sum(fileSize for modified, name, fileSize in files)
+    for modified, name, fileSize in sorted(files):
+        if size <= maximumSize:
+            break
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            continue
+        size -= fileSize
+
+def _getEntryPath(archiveDirectory, key, extension):
+    return os.path.join(getDiffCacheDirectory(archiveDirectory), key + extension)
+
+def _readEntry(path):
+    try:
+        with open(path, "r", encoding="utf8") as f:
+            text = f.read()
+        os.utime(path)
+    except OSError:
+        return None
+    return text
+
+def _writeEntry(archiveDirectory, key, extension, text, maximumSize):
+    """
+    Write an entry and prune the cache. The file is
+    swapped in whole so that a reader never sees
+    a partially written entry. Entries that are
+    larger than the cache are not written.
+    """
+    data = text.encode("utf8")
+    if len(data) > maximumSize:
+        return
+    path = _getEntryPath(archiveDirectory, key, extension)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    tempPath = os.path.join(directory, "%s.tmp" % uuid.uuid4().hex)
+    try:
+        with open(tempPath, "wb") as f:
+            f.write(data)
+        os.replace(tempPath, path)
+    finally:
+        if os.path.exists(tempPath):
+            os.remove(tempPath)
+    pruneDiffCache(archiveDirectory, maximumSize)
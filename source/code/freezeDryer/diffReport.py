@@ -5,6 +5,8 @@ import difflib
 import html
 import pprint
 import drawBot as bot
+from freezeDryer import diff
+from freezeDryer import ufoData
 
 # ------
 # Output
@@ -18,7 +20,10 @@ from xml.etree import cElementTree as ET
 def makeDiffReport(differences):
     container = makeHTMLElement()
     body = container.find("body")
-    reportRootDifferences(differences, body)
+    try:
+        reportRootDifferences(differences, body)
+    finally:
+        _closeFonts()
     return makeHTMLString(container)
 
 def makeFontReport(differences):
@@ -141,14 +146,8 @@ def reportFontInfo(differences, parent):
     container = ET.SubElement(parent, "div", {"class" : "fileSection"})
     h1 = ET.SubElement(container, "h1")
     h1.text = "Info"
-    info1 = differences["info1"]
-    info2 = differences["info2"]
     diffs = []
     for attr, data in sorted(differences.items()):
-        if attr == "info1":
-            continue
-        if attr == "info2":
-            continue
         value1 = "%s = %s" % (attr, _fancyRepr(data["value1"], attr))
         value2 = "%s = %s" % (attr, _fancyRepr(data["value2"], attr))
         diffs.append(("removed", value1))
@@ -217,12 +216,12 @@ def reportFontGuidelines(differences, parent):
     if "removed" in differences:
         h1 = ET.SubElement(container, "h1")
         h1.text = "Removed Guidelines"
-        diffs = [("removed", _fancyRepr(guideline)) for guideline in differences["removed"]]
+        diffs = [("removed", _reprGuideline(guideline)) for guideline in differences["removed"]]
         makeDiffTable(diffs, container)
     if "added" in differences:
         h1 = ET.SubElement(container, "h1")
         h1.text = "Added Guidelines"
-        diffs = [("added", _fancyRepr(guideline)) for guideline in differences["added"]]
+        diffs = [("added", _reprGuideline(guideline)) for guideline in differences["added"]]
         makeDiffTable(diffs, container)
     if "changed" in differences:
         h1 = ET.SubElement(container, "h1")
@@ -244,16 +243,16 @@ def reportFontGuidelines(differences, parent):
 
 def _reprGuideline(guideline):
     attrs = []
-    name = guideline.naked().name
+    name = guideline["name"]
     if name:
         attrs.append("name = %s" % _fancyRepr(name))
-    angle = guideline.angle
+    angle = guideline["angle"]
     if angle is not None:
         attrs.append("angle = %s°" % _fancyRepr(angle))
-    x = guideline.x
+    x = guideline["x"]
     if x is not None:
         attrs.append("x = %s" % _fancyRepr(x))
-    y = guideline.y
+    y = guideline["y"]
     if y is not None:
         attrs.append("y = %s" % _fancyRepr(y))
     return ", ".join(attrs)
@@ -306,8 +305,8 @@ def reportFontLayer(differences, parent):
     container = ET.SubElement(parent, "div", {"class" : "fileSection"})
     layer1 = differences["layer1"]
     layer2 = differences["layer2"]
-    layerName = layer1.name
-    if layer1 == layer1.font.defaultLayer:
+    layerName = layer1["name"]
+    if layer1["default"]:
         layerName = "(default)"
     h1 = ET.SubElement(container, "h1")
     h1.text = 'Layer: %s' % layerName
@@ -353,7 +352,7 @@ def reportFontGlyph(differences, parent):
     glyph1 = differences["glyph1"]
     glyph2 = differences["glyph2"]
     h1 = ET.SubElement(container, "h1")
-    h1.text = 'Glyph: %s' % glyph1.name
+    h1.text = 'Glyph: %s' % glyph1["name"]
     # non-visual data
     diffs = []
     needsVisualization = False
@@ -388,7 +387,7 @@ def reportGlyphVisualization(differences, parent):
     makeDiffTable(data, parent)
 
 def drawGlyph(differences, tag):
-    glyph = differences["glyph" + tag]
+    glyph = _openGlyph(differences["glyph" + tag])
     font = glyph.font
     upm = font.info.unitsPerEm
     if upm is None:
@@ -439,7 +438,8 @@ def drawGlyph(differences, tag):
     bot.drawPath(pen)
     # Anchors
     if glyph.anchors:
-        _drawAnchors(glyph.anchors, glyph, scale, pixel)
+        anchors = [diff.makeAnchorRecord(anchor) for anchor in glyph.anchors]
+        _drawAnchors(anchors, glyph, scale, pixel)
     # Component Differences
     if "components" in differences:
         componentDifferences = differences["components"]
@@ -483,26 +483,27 @@ def drawPointDifferences(differences, glyph, tag, scale, pixel):
         points = [d["point" + tag] for d in differences["changed"]]
         _drawPoints(points, scale, pixel, colorChanged)
 
-def _drawContours(components, glyph, scale, pixel, color):
+def _drawContours(contours, glyph, scale, pixel, color):
     with bot.savedState():
         bot.fill(None)
         bot.stroke(*color)
         w = pixel * 2
         bot.strokeWidth(w)
-        for component in components:
+        for contour in contours:
+            contour = glyph.contours[contour["index"]]
             pen = bot.BezierPath(glyphSet=glyph.layer)
-            component.draw(pen)
+            contour.draw(pen)
             bot.drawPath(pen)
 
 def _drawPoints(points, scale, pixel, color):
     with bot.savedState():
         for point in points:
-            x = point.x
-            y = point.y
-            if point.type == "offcurve":
+            x = point["x"]
+            y = point["y"]
+            if point["type"] == "offcurve":
                 s = pixel * 4
                 shape = bot.oval
-            elif point.type == "curve":
+            elif point["type"] == "curve":
                 s = pixel * 6.5
                 shape = bot.oval
             else:
@@ -526,9 +527,9 @@ def drawAnchorDifferences(differences, glyph, tag, scale, pixel):
     if tag == "2" and "added" in differences:
         _drawAnchors(differences["added"], glyph, scale, pixel, colorAdded)
     if "changed" in differences:
-        anchors = set()
+        anchors = []
         for data in differences["changed"]:
-            anchors.add(data["anchor" + tag])
+            anchors.append(data["anchor" + tag])
         _drawAnchors(anchors, glyph, scale, pixel, colorChanged)
 
 def _drawAnchors(anchors, glyph, scale, pixel, color=None):
@@ -538,11 +539,11 @@ def _drawAnchors(anchors, glyph, scale, pixel, color=None):
             if alwaysColor:
                 color = alwaysColor
             else:
-                color = anchor.color
+                color = anchor["color"]
                 if color is None:
                     color = (0, 0, 0, 0.5)
-            x = anchor.x
-            y = anchor.y
+            x = anchor["x"]
+            y = anchor["y"]
             s = pixel * 6.5
             h = s / 2
             r = (x - h, y - h, s, s)
@@ -550,7 +551,7 @@ def _drawAnchors(anchors, glyph, scale, pixel, color=None):
             bot.fill(*color)
             bot.oval(*r)
             if alwaysColor is None:
-                name = anchor.name
+                name = anchor["name"]
                 if name:
                     pointSize = 10
                     bot.fontSize(pixel * pointSize)
@@ -564,9 +565,9 @@ def drawComponentDifferences(differences, glyph, tag, scale, pixel):
     if tag == "2" and "added" in differences:
         _drawComponents(differences["added"], glyph, scale, pixel, colorAdded)
     if "changed" in differences:
-        components = set()
+        components = []
         for data in differences["changed"]:
-            components.add(data["component" + tag])
+            components.append(data["component" + tag])
         _drawComponents(components, glyph, scale, pixel, colorChanged)
 
 def _drawComponents(components, glyph, scale, pixel, color):
@@ -576,10 +577,32 @@ def _drawComponents(components, glyph, scale, pixel, color):
         w = pixel * 2
         bot.strokeWidth(w)
         for component in components:
+            component = glyph.components[component["index"]]
             pen = bot.BezierPath(glyphSet=glyph.layer)
             component.draw(pen)
             bot.drawPath(pen)
 
+# Glyphs
+
+_fonts = {}
+
+def _openGlyph(record):
+    """
+    The differences only record where a glyph is,
+    so glyphs are read again when they are drawn.
+    Fonts stay open until the report is done.
+    """
+    path = record["path"]
+    font = _fonts.get(path)
+    if font is None:
+        font = _fonts[path] = ufoData.openFont(path)
+    return font.getLayer(record["layer"])[record["name"]]
+
+def _closeFonts():
+    for font in _fonts.values():
+        font.close()
+    _fonts.clear()
+
 def _fromStringWithoutNamespace(xml):
     # https://stackoverflow.com/questions/13412496/python-elementtree-module-how-to-ignore-the-namespace-of-xml-files-to-locate-ma
     it = ET.iterparse(StringIO(xml))
@@ -611,14 +634,6 @@ def makeDiffTable(data, parent):
             td.append(info)
 
 def _fancyRepr(value, attr=None):
-    # XXX hack around a bug in defcon
-    from fontParts.fontshell import RGuideline
-    if isinstance(value, RGuideline):
-        if value.naked().name == "":
-            value.naked().name = None
-            r = repr(value)
-            value.naked().name = ""
-            return r
     if attr == "unicodes":
         value = [hex(value).upper()[2:].zfill(4) for value in value]
         value = "[%s]" % ", ".join(value)
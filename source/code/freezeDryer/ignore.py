@@ -0,0 +1,146 @@
+import os
+import re
+
+# -------
+# Matcher
+# -------
+
+class IgnoreMatcher(object):
+
+    """
+    Determine if a path is ignored by a list of
+    ignore patterns. The patterns are compiled
+    once, so each check only looks at the path.
+
+    The patterns use the glob syntax. Patterns
+    starting with "/" are relative to the root.
+    Other patterns match in any directory that
+    is not inside of a UFO. Like glob, patterns
+    ending with "/" only match directories.
+
+    Paths are relative to the root. Only the given
+    path is checked, so walking code shouldn't go
+    into directories that are ignored. See
+    canMatchInUFO for what can be matched inside
+    of a UFO.
+    """
+
+    def __init__(self, patterns):
+        anchored = ([], [])
+        floating = ([], [])
+        self.anchoredDepth = 0
+        self.floatingUFODepth = 0
+        for pattern in patterns:
+            pattern = pattern.strip()
+            directoriesOnly = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            if not pattern:
+                continue
+            if pattern.startswith("/"):
+                pattern = pattern[1:]
+                self.anchoredDepth = max(self.anchoredDepth, pattern.count("/") + 1)
+                anchored[directoriesOnly].append(_translatePattern(pattern))
+            else:
+                # a floating pattern can match as many levels
+                # into a UFO as it has "/" in it, since the
+                # match has to start at or before the UFO.
+                self.floatingUFODepth = max(self.floatingUFODepth, pattern.count("/"))
+                floating[directoriesOnly].append(_translatePattern(pattern))
+        self._anchored = [_compileAnchored(translated) for translated in anchored]
+        self._floating = [_compileFloating(translated) for translated in floating]
+
+    def isIgnored(self, relativePath, isDirectory=False):
+        if os.sep != "/":
+            relativePath = relativePath.replace(os.sep, "/")
+        if self._matches(relativePath, 0):
+            return True
+        if isDirectory:
+            return self._matches(relativePath, 1)
+        return False
+
+    def canMatchInUFO(self, depth, level):
+        """
+        Determine if anything at depth, counted from
+        the root, and level, counted from the UFO
+        that contains it, can be ignored.
+        """
+        return depth <= self.anchoredDepth or level <= self.floatingUFODepth
+
+    def _matches(self, relativePath, index):
+        anchored = self._anchored[index]
+        if anchored is not None:
+            if anchored.match(relativePath):
+                return True
+        floating = self._floating[index]
+        if floating is not None:
+            match = floating.search(relativePath)
+            if match is not None:
+                # floating patterns can't start inside of a UFO.
+                # search finds the match that starts first, so
+                # this only needs to check that one.
+                ufo = _ufoDirectoryPattern.search(relativePath)
+                if ufo is None or match.start() <= ufo.start():
+                    return True
+        return False
+
+def _compileAnchored(translated):
+    if not translated:
+        return None
+    return re.compile("(?:%s)\\Z" % "|".join(translated))
+
+def _compileFloating(translated):
+    if not translated:
+        return None
+    return re.compile("(?:^|/)(?:%s)\\Z" % "|".join(translated))
+
+_ufoDirectoryPattern = re.compile("(?:^|/)[^/]*\\.[uU][fF][oO]/")
+
+# -----------
+# Translation
+# -----------
+
+def _translatePattern(pattern):
+    return "/".join([_translatePatternComponent(component) for component in pattern.split("/")])
+
+def _translatePatternComponent(component):
+    """
+    Translate one component of a glob pattern to a
+    regular expression. This is the same as fnmatch
+    except that nothing matches across a "/" and,
+    like glob, wildcards don't match hidden names.
+    """
+    result = []
+    if not component.startswith("."):
+        result.append("(?!\\.)")
+    index = 0
+    count = len(component)
+    while index < count:
+        character = component[index]
+        index += 1
+        if character == "*":
+            result.append("[^/]*")
+        elif character == "?":
+            result.append("[^/]")
+        elif character == "[":
+            end = index
+            if end < count and component[end] == "!":
+                end += 1
+            if end < count and component[end] == "]":
+                end += 1
+            while end < count and component[end] != "]":
+                end += 1
+            if end >= count:
+                result.append("\\[")
+            else:
+                characters = component[index:end].replace("\\", "\\\\")
+                index = end + 1
+                negate = characters[0] == "!"
+                if negate:
+                    characters = characters[1:]
+                characters = re.sub("([\\[&~|^])", "\\\\\\1", characters)
+                if negate:
+                    characters = "^" + characters
+                result.append("(?!/)[%s]" % characters)
+        else:
+            result.append(re.escape(character))
+    return "".join(result)
@@ -77,7 +77,7 @@ class FDProjectsWindowController(BaseWindowController):
         self.commitTab.messageTextEditor = vanilla.TextEditor(
             "auto"
         )
-        self.commitTab.ignoredTextEditor = vanilla.TextEditor(
+        self.commitTab.previewTextEditor = vanilla.TextEditor(
             "auto",
             readOnly=True
         )
@@ -156,6 +156,11 @@ class FDProjectsWindowController(BaseWindowController):
             "Convert UFO to UFOZ",
             callback=self.settingsCompressUFOsCheckBoxCallback
         )
+        self.settingsTab.deduplicateFilesCheckBox = vanilla.CheckBox(
+            "auto",
+            "Deduplicate Files",
+            callback=self.settingsDeduplicateFilesCheckBoxCallback
+        )
         self.settingsTab.makeGlyphSetProofCheckBox = vanilla.CheckBox(
             "auto",
             "Make Glyph Set Proof",
@@ -245,12 +250,12 @@ class FDProjectsWindowController(BaseWindowController):
 
         rules = [
             "H:|[messageTextEditor]|",
-            "H:|[ignoredTextEditor]|",
+            "H:|[previewTextEditor]|",
             "H:[commitButton]|",
             "V:|"
                 "[messageTextEditor]"
                 "-padding-"
-                "[ignoredTextEditor(==150)]"
+                "[previewTextEditor(==150)]"
                 "-padding-"
                 "[commitButton]"
                 "|",
@@ -299,6 +304,7 @@ class FDProjectsWindowController(BaseWindowController):
             "H:|[filesTitle]|",
             "H:|[filesLine]|",
             "H:|[compressUFOsCheckBox]",
+            "H:|[deduplicateFilesCheckBox]",
             "H:|[makeGlyphSetProofCheckBox]",
             "H:|[makeVisualDiffsReportCheckBox]",
             "H:|-indent-[lenientVisualDiffsReportCheckBox]",
@@ -329,6 +335,7 @@ class FDProjectsWindowController(BaseWindowController):
                 "[filesLine]"
                 "-padding-"
                 "[compressUFOsCheckBox]"
+                "[deduplicateFilesCheckBox]"
                 "[makeGlyphSetProofCheckBox]"
                 "[makeVisualDiffsReportCheckBox]"
                 "[lenientVisualDiffsReportCheckBox]"
@@ -471,7 +478,7 @@ class FDProjectsWindowController(BaseWindowController):
     # ------
 
     def loadCommitSettings(self):
-        self.updateIgnoredTextEditor()
+        self.updateCommitPreview()
 
     def commitButtonCallback(self, sender):
         possible, message = core.canPerformCommit(self.root)
@@ -488,17 +495,25 @@ class FDProjectsWindowController(BaseWindowController):
         finally:
             progress.close()
             self.commitTab.messageTextEditor.set("")
+            self.updateCommitPreview()
 
-    def updateIgnoredTextEditor(self):
+    def updateCommitPreview(self):
+        try:
+            text = core.formatStatus(core.getStatus(self.root))
+        except OSError:
+            # the archive may be on a volume
+            # that went away during the status
+            text = ["The archive is not available."]
+        text.append("")
         ignorePatterns = self.settings["ignore"]
         ignoredPaths = core.gatherIgnoredPaths(self.root, ignorePatterns)
         if not ignoredPaths:
-            text = "No files will be ignored."
+            text.append("No files will be ignored.")
         else:
-            text = ["Ignored Files:"]
+            text.append("Ignored Files:")
             text += [os.path.relpath(path, self.root) for path in ignoredPaths]
-            text = "\n".join(text)
-        self.commitTab.ignoredTextEditor.set(text)
+        text = "\n".join(text)
+        self.commitTab.previewTextEditor.set(text)
 
     # Diffs
     # -----
@@ -539,6 +554,9 @@ class FDProjectsWindowController(BaseWindowController):
         self.settingsTab.compressUFOsCheckBox.set(
             self.settings["compressUFOs"]
         )
+        self.settingsTab.deduplicateFilesCheckBox.set(
+            self.settings["deduplicateFiles"]
+        )
         self.settingsTab.makeGlyphSetProofCheckBox.set(
             self.settings["makeGlyphSetProof"]
         )
@@ -583,6 +601,10 @@ class FDProjectsWindowController(BaseWindowController):
         self.settings["compressUFOs"] = sender.get()
         self._storeSettings()
 
+    def settingsDeduplicateFilesCheckBoxCallback(self, sender):
+        self.settings["deduplicateFiles"] = sender.get()
+        self._storeSettings()
+
     def settingsMakeGlyphSetProofCheckBoxCallback(self, sender):
         self.settings["makeGlyphSetProof"] = sender.get()
         self._storeSettings()
@@ -603,7 +625,7 @@ class FDProjectsWindowController(BaseWindowController):
         patterns = [line.strip() for line in sender.get().splitlines() if line.strip()]
         self.settings["ignore"] = patterns
         self._storeSettings()
-        self.updateIgnoredTextEditor()
+        self.updateCommitPreview()
 
 
 # -----
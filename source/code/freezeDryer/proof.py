@@ -7,9 +7,10 @@ from fontParts.world import OpenFont
 # Main
 # ----
 
-def makeGlyphSetProof(stateDirectory, stamp, fileName):
-    from freezeDryer.core import gatherUFOPaths
-    paths = gatherUFOPaths(stateDirectory)
+def makeGlyphSetProof(stateDirectory, stamp, fileName, paths=None):
+    if paths is None:
+        from freezeDryer.core import gatherUFOPaths
+        paths = gatherUFOPaths(stateDirectory)
     fonts = [OpenFont(path, showInterface=False) for path in paths]
     fonts = fontWidthWeightSort(fonts)
     bot.newDrawing()
@@ -0,0 +1,446 @@
+import os
+import sys
+import shutil
+import stat
+import hashlib
+import uuid
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+# -----------
+# Data Folder
+# -----------
+
+def getArchiveDataDirectory(archiveDirectory):
+    """
+    The directory within the archive that holds
+    data used by this tool. The states in the
+    archive never depend on anything in here.
+    """
+    return os.path.join(archiveDirectory, ".freeze dryer")
+
+# -------
+# Hashing
+# -------
+
+blockSize = 1024 * 1024
+
+def hashFile(path):
+    with open(path, "rb") as f:
+        return hashStream(f)
+
+def hashStream(stream):
+    digest = hashlib.sha256()
+    while True:
+        block = stream.read(blockSize)
+        if not block:
+            break
+        digest.update(block)
+    return digest.hexdigest()
+
+def copyAndHashFile(sourcePath, destinationPath, clone=False):
+    """
+    Copy the file at sourcePath to destinationPath
+    and return the hash of the copied data. The file
+    is only read once.
+    """
+    if clone and cloneFile(sourcePath, destinationPath):
+        return hashFile(destinationPath)
+    with open(sourcePath, "rb") as source:
+        with open(destinationPath, "wb") as destination:
+            digest = copyAndHashStream(source, destination)
+    shutil.copystat(sourcePath, destinationPath)
+    return digest
+
+def copyAndHashStream(source, destination):
+    digest = hashlib.sha256()
+    while True:
+        block = source.read(blockSize)
+        if not block:
+            break
+        digest.update(block)
+        destination.write(block)
+    return digest.hexdigest()
+
+def copyFile(sourcePath, destinationPath, clone=False):
+    if clone and cloneFile(sourcePath, destinationPath):
+        return
+    shutil.copy2(sourcePath, destinationPath)
+
+# -------
+# Cloning
+# -------
+
+def canCloneFiles(sourcePath, destinationDirectory):
+    """
+    Determine if files can be cloned from the
+    file system containing sourcePath to the
+    one containing destinationDirectory.
+    """
+    probePath = os.path.join(destinationDirectory, ".%s.probe" % uuid.uuid4().hex)
+    try:
+        return cloneFile(sourcePath, probePath)
+    finally:
+        if os.path.exists(probePath):
+            os.remove(probePath)
+
+def cloneFile(sourcePath, destinationPath):
+    """
+    Make a copy on write clone of the file at
+    sourcePath at destinationPath. The clone
+    shares its data with the source until one
+    of them is changed. This returns False,
+    and doesn't write anything, if the file
+    system doesn't support cloning.
+    """
+    if sys.platform == "darwin":
+        cloned = _cloneFileMac(sourcePath, destinationPath)
+    elif sys.platform.startswith("linux"):
+        cloned = _cloneFileLinux(sourcePath, destinationPath)
+    else:
+        cloned = False
+    if cloned:
+        shutil.copystat(sourcePath, destinationPath)
+    return cloned
+
+# linux/ioctl.h FICLONE
+_FICLONE = 0x40049409
+
+def _cloneFileLinux(sourcePath, destinationPath):
+    import fcntl
+    with open(sourcePath, "rb") as source:
+        try:
+            with open(destinationPath, "wb") as destination:
+                fcntl.ioctl(destination.fileno(), _FICLONE, source.fileno())
+        except OSError:
+            if os.path.exists(destinationPath):
+                os.remove(destinationPath)
+            return False
+    return True
+
+_macCloneFunction = None
+
+def _cloneFileMac(sourcePath, destinationPath):
+    # clonefile(2) is available on APFS.
+    global _macCloneFunction
+    if _macCloneFunction is None:
+        import ctypes
+        import ctypes.util
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            function = libc.clonefile
+        except (OSError, AttributeError):
+            function = False
+        else:
+            function.argtypes = (ctypes.c_char_p, ctypes.c_char_p, ctypes.c_uint32)
+            function.restype = ctypes.c_int
+        _macCloneFunction = function
+    if not _macCloneFunction:
+        return False
+    result = _macCloneFunction(
+        os.fsencode(sourcePath),
+        os.fsencode(destinationPath),
+        0
+    )
+    return result == 0
+
+# ------------
+# Object Store
+# ------------
+
+readOnlyMode = stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH
+
+def getObjectStoreDirectory(archiveDirectory):
+    return os.path.join(getArchiveDataDirectory(archiveDirectory), "objects")
+
+def getObjectPath(objectStoreDirectory, digest):
+    return os.path.join(objectStoreDirectory, digest[:2], digest[2:])
+
+def storeFile(objectStoreDirectory, path, digest=None, clone=False):
+    """
+    Put the contents of the file at path into
+    the object store. Returns the digest and the
+    path to the object.
+
+    Objects are made read only because they are
+    hard linked into the states. Editing one in
+    place would edit it in every state.
+    """
+    if digest is None:
+        digest = hashFile(path)
+    objectPath = getObjectPath(objectStoreDirectory, digest)
+    if os.path.exists(objectPath):
+        return digest, objectPath
+    # the file could change between hashing and
+    # copying, so the copy is hashed and stored
+    # under whatever was actually copied.
+    directory = os.path.dirname(objectPath)
+    os.makedirs(directory, exist_ok=True)
+    tempPath = os.path.join(directory, "%s.tmp" % uuid.uuid4().hex)
+    try:
+        copiedDigest = copyAndHashFile(path, tempPath, clone=clone)
+        if copiedDigest != digest:
+            digest = copiedDigest
+            objectPath = getObjectPath(objectStoreDirectory, digest)
+            os.makedirs(os.path.dirname(objectPath), exist_ok=True)
+        os.chmod(tempPath, readOnlyMode)
+        if not os.path.exists(objectPath):
+            os.replace(tempPath, objectPath)
+    finally:
+        if os.path.exists(tempPath):
+            os.remove(tempPath)
+    return digest, objectPath
+
+def linkObject(objectPath, destinationPath, clone=False):
+    """
+    Materialize an object at destinationPath.
+    This falls back to a copy when the file
+    system doesn't support hard links.
+    """
+    try:
+        os.link(objectPath, destinationPath)
+    except OSError:
+        copyFile(objectPath, destinationPath, clone=clone)
+
+def storeAndLinkFile(objectStoreDirectory, sourcePath, destinationPath, clone=False):
+    digest, objectPath = storeFile(objectStoreDirectory, sourcePath, clone=clone)
+    linkObject(objectPath, destinationPath, clone=clone)
+    return digest
+
+def pruneObjectStore(objectStoreDirectory):
+    """
+    Remove the objects that aren't linked into any
+    state. Each link in a state adds one to an
+    object's link count, so these are the objects
+    with a link count of 1. This returns the number
+    of bytes that were removed.
+
+    If the file system doesn't support hard links,
+    the states hold copies and every object is
+    removed.
+    """
+    removed = 0
+    try:
+        directories = os.scandir(objectStoreDirectory)
+    except OSError:
+        return removed
+    with directories:
+        for directory in directories:
+            if not directory.is_dir(follow_symlinks=False):
+                continue
+            with os.scandir(directory.path) as entries:
+                for entry in entries:
+                    # skip objects that are being written
+                    if entry.name.endswith(".tmp"):
+                        continue
+                    info = entry.stat(follow_symlinks=False)
+                    if info.st_nlink > 1:
+                        continue
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        continue
+                    removed += info.st_size
+            try:
+                os.rmdir(directory.path)
+            except OSError:
+                # not empty
+                pass
+    return removed
+
+# --------
+# Manifest
+# --------
+
+manifestFormatVersion = 0
+
+def writeManifest(path, manifest):
+    """
+    A manifest records the files that were copied
+    into a state. It maps paths relative to the
+    root to (size, modification time, digest).
+    The size and modification time are those of
+    the file in the root at the time of the commit
+    so that the next commit can skip files that
+    have not changed since then. The digest is None
+    for files that were racy. See entryIsRacy.
+    """
+    data = dict(
+        formatVersion=manifestFormatVersion,
+        files={
+            relativePath : list(entry)
+            for relativePath, entry in sorted(manifest.items())
+        }
+    )
+    with open(path, "w", encoding="utf8") as f:
+        f.write(json.dumps(data, separators=(",", ":")))
+
+def readManifest(path):
+    """
+    Read the manifest at path. This returns None
+    if there is no manifest or if it can't be read.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get("formatVersion") != manifestFormatVersion:
+        return None
+    manifest = {
+        relativePath : tuple(entry)
+        for relativePath, entry in data["files"].items()
+    }
+    return manifest
+
+def makeManifestEntry(path, digest=None, info=None):
+    if info is None:
+        info = os.stat(path)
+    return (info.st_size, info.st_mtime_ns, digest)
+
+def entryIsUnchanged(entry, previousEntry):
+    """
+    Entries without a digest were racy when they
+    were recorded, so they are never unchanged.
+    """
+    if previousEntry is None or previousEntry[2] is None:
+        return False
+    return entry[:2] == previousEntry[:2]
+
+# a file modified this close to the start of a
+# commit or a status, in nanoseconds, could be
+# modified again without its size or modification
+# time changing.
+racyInterval = 2 * 1000000000
+
+def entryIsRacy(entry, startTime):
+    """
+    Determine if the modification time in entry is
+    too close to startTime, in nanoseconds since the
+    epoch, for its digest to be trusted later. The
+    entries for these files are recorded without a
+    digest so that they are hashed again.
+    """
+    return entry[1] >= startTime - racyInterval
+
+def groupManifestByUFO(manifest):
+    """
+    Group the entries in a manifest by the UFO
+    that contains them. The entries are keyed
+    by their path relative to the UFO's parent,
+    which is also their name in a UFOZ.
+    """
+    ufos = {}
+    marker = ".ufo" + os.sep
+    for path, entry in manifest.items():
+        index = path.lower().find(marker)
+        if index == -1:
+            continue
+        ufoPath = path[:index + 4]
+        parent = os.path.dirname(ufoPath)
+        if parent:
+            path = path[len(parent) + 1:]
+        if ufoPath not in ufos:
+            ufos[ufoPath] = {}
+        ufos[ufoPath][path] = entry
+    return ufos
+
+# ---------
+# Transfers
+# ---------
+
+def makeCopyFunction(
+        root,
+        manifest,
+        previousManifest=None,
+        objectStoreDirectory=None,
+        cloneFiles=False,
+        snapshot=None,
+        startTime=None
+    ):
+    """
+    Make a copy function for copyFiles that records
+    everything it copies in manifest. copyFiles may
+    call it from several threads at the same time.
+
+    Files that are unchanged according to
+    previousManifest are not hashed again. If there
+    is an object store, they are linked from it and
+    not read at all. Otherwise they are copied, so
+    they are only not read if cloneFiles is True,
+    which clones rather than copies whenever the
+    file system allows it.
+    If a TreeSnapshot of root is given, the stat
+    results that it gathered are used. If startTime
+    is given, racy entries are recorded without a
+    digest. See entryIsRacy.
+    """
+    if previousManifest is None:
+        previousManifest = {}
+
+    def copyFunction(sourcePath, destinationPath):
+        relativePath = os.path.relpath(sourcePath, root)
+        info = None
+        if snapshot is not None and relativePath in snapshot.files:
+            info = snapshot.stat(relativePath)
+        entry = makeManifestEntry(sourcePath, info=info)
+        previousEntry = previousManifest.get(relativePath)
+        digest = None
+        if entryIsUnchanged(entry, previousEntry):
+            digest = previousEntry[2]
+            if objectStoreDirectory is None:
+                copyFile(sourcePath, destinationPath, clone=cloneFiles)
+            else:
+                objectPath = getObjectPath(objectStoreDirectory, digest)
+                if os.path.exists(objectPath):
+                    linkObject(objectPath, destinationPath, clone=cloneFiles)
+                else:
+                    digest = None
+        if digest is None:
+            if objectStoreDirectory is None:
+                digest = copyAndHashFile(sourcePath, destinationPath, clone=cloneFiles)
+            else:
+                digest = storeAndLinkFile(objectStoreDirectory, sourcePath, destinationPath, clone=cloneFiles)
+        if startTime is not None and entryIsRacy(entry, startTime):
+            digest = None
+        manifest[relativePath] = entry[:2] + (digest,)
+        return destinationPath
+
+    return copyFunction
+
+def copyFiles(directories, files, copyFunction=shutil.copy2, threadCount=1):
+    """
+    Copy lists of (source, destination) pairs.
+    The directories must be ordered parents first.
+    They are made before the files are copied and
+    their stats are copied after.
+    """
+    for source, destination in directories:
+        os.makedirs(destination)
+    if threadCount > 1 and len(files) > 1:
+        # small files are handed to the threads in
+        # chunks to keep the pool overhead down.
+        chunks = [
+            files[i:i + copyChunkSize]
+            for i in range(0, len(files), copyChunkSize)
+        ]
+        with ThreadPoolExecutor(max_workers=threadCount) as executor:
+            futures = [
+                executor.submit(_copyFiles, chunk, copyFunction)
+                for chunk in chunks
+            ]
+            # raise the first error, if there is one
+            for future in futures:
+                future.result()
+    else:
+        _copyFiles(files, copyFunction)
+    for source, destination in reversed(directories):
+        shutil.copystat(source, destination)
+
+copyChunkSize = 32
+
+def _copyFiles(files, copyFunction):
+    for source, destination in files:
+        copyFunction(source, destination)
@@ -0,0 +1,122 @@
+import os
+
+# --------
+# Snapshot
+# --------
+
+class TreeSnapshot(object):
+
+    """
+    The contents of a directory tree as found by
+    walkTree. All paths are relative to root.
+
+    - directories: the directories, parents first.
+      This includes .ufo directories.
+    - files: the files, mapped to their os.DirEntry.
+    - ufos: the UFOs, both .ufo directories and .ufoz files.
+    - ufoContents: the directories and files inside
+      of each .ufo directory, if they were gathered.
+    - ignored: the ignored files and directories.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.directories = []
+        self.files = {}
+        self.ufos = []
+        self.ufoContents = {}
+        self.ignored = []
+
+    def getPath(self, relativePath):
+        return os.path.join(self.root, relativePath)
+
+    def stat(self, relativePath):
+        """
+        The stat result for a file. This is cached
+        so that the file system is only asked once.
+        """
+        return self.files[relativePath].stat()
+
+    def getTopLevelPaths(self):
+        """
+        Get the files and UFOs that are not inside of
+        a UFO. This treats UFOs as single files.
+        """
+        ufoContents = set()
+        for contents in self.ufoContents.values():
+            ufoContents.update(contents)
+        paths = set(self.ufos)
+        for path in self.files.keys():
+            if path not in ufoContents:
+                paths.add(path)
+        return paths
+
+# ----
+# Walk
+# ----
+
+def walkTree(root, ignoreMatcher=None, skipPaths=None, includeUFOContents=True):
+    """
+    Walk the tree at root once and return a TreeSnapshot.
+
+    ignoreMatcher is an IgnoreMatcher. Ignored items
+    are recorded but not walked into. skipPaths is a
+    collection of absolute paths that are passed over
+    without being recorded, for example the archive.
+    If includeUFOContents is False, the contents of
+    .ufo directories are not gathered.
+    """
+    if skipPaths is None:
+        skipPaths = set()
+    else:
+        skipPaths = set(skipPaths)
+    snapshot = TreeSnapshot(root)
+    _walk(snapshot, root, "", 1, None, ignoreMatcher, skipPaths, includeUFOContents)
+    return snapshot
+
+def _walk(snapshot, directory, relativeDirectory, depth, ufo, ignoreMatcher, skipPaths, includeUFOContents):
+    with os.scandir(directory) as entries:
+        entries = sorted(entries, key=lambda entry: entry.name)
+    # inside of UFOs, only some patterns can match
+    # and only down to a certain depth.
+    checkIgnore = ignoreMatcher is not None
+    if checkIgnore and ufo is not None:
+        checkIgnore = ignoreMatcher.canMatchInUFO(depth, depth - ufo.count(os.sep) - 1)
+    record = ufo is None or includeUFOContents
+    for entry in entries:
+        if skipPaths and entry.path in skipPaths:
+            continue
+        if relativeDirectory:
+            relativePath = relativeDirectory + os.sep + entry.name
+        else:
+            relativePath = entry.name
+        isDirectory = entry.is_dir()
+        if checkIgnore and ignoreMatcher.isIgnored(relativePath, isDirectory):
+            snapshot.ignored.append(relativePath)
+            continue
+        # only the extensions of items outside of UFOs matter
+        extension = None
+        if ufo is None:
+            extension = os.path.splitext(entry.name)[-1].lower()
+        if isDirectory:
+            if record:
+                snapshot.directories.append(relativePath)
+                if ufo is not None:
+                    snapshot.ufoContents[ufo].append(relativePath)
+            entryUFO = ufo
+            if ufo is None and extension == ".ufo":
+                entryUFO = relativePath
+                snapshot.ufos.append(relativePath)
+                snapshot.ufoContents[relativePath] = []
+            if entryUFO is not None and not includeUFOContents:
+                # keep going only to find ignored items
+                entryLevel = depth - entryUFO.count(os.sep)
+                if ignoreMatcher is None or not ignoreMatcher.canMatchInUFO(depth + 1, entryLevel):
+                    continue
+            _walk(snapshot, entry.path, relativePath, depth + 1, entryUFO, ignoreMatcher, skipPaths, includeUFOContents)
+        elif record:
+            snapshot.files[relativePath] = entry
+            if ufo is not None:
+                snapshot.ufoContents[ufo].append(relativePath)
+            elif extension == ".ufoz":
+                snapshot.ufos.append(relativePath)
@@ -0,0 +1,365 @@
+"""
+Lightweight, read only font objects that are read
+straight from a UFO or UFOZ with fontTools.ufoLib.
+
+These have the attributes and methods of the fontParts
+objects that diff and diffReport use and nothing else.
+The data is kept in plain attributes, dicts and tuples,
+so nothing is normalized or validated on access.
+"""
+
+from fontTools.ufoLib import UFOReader
+from fontTools.pens.pointPen import AbstractPointPen, PointToSegmentPen
+from fontTools.pens.areaPen import AreaPen
+
+def openFont(path):
+    return Font(path)
+
+# ----
+# Font
+# ----
+
+class Font(object):
+
+    def __init__(self, path):
+        self.path = path
+        self._reader = reader = UFOReader(path, validate=False)
+        self.layerOrder = tuple(reader.getLayerNames())
+        self._defaultLayerName = reader.getDefaultLayerName()
+        self._layers = {}
+        self.info = Info()
+        reader.readInfo(self.info)
+        self.groups = {
+            groupName : tuple(glyphNames)
+            for groupName, glyphNames in reader.readGroups().items()
+        }
+        self.kerning = reader.readKerning()
+        self.lib = reader.readLib()
+        self.features = Features(reader.readFeatures())
+        self.glyphOrder = tuple(self.lib.get("public.glyphOrder", ()))
+        guidelines = self.info.guidelines
+        if guidelines is None:
+            guidelines = []
+        self.guidelines = tuple(Guideline(data) for data in guidelines)
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.path)
+
+    def _get_defaultLayer(self):
+        return self.getLayer(self._defaultLayerName)
+
+    defaultLayer = property(_get_defaultLayer)
+
+    def _get_layers(self):
+        return [self.getLayer(layerName) for layerName in self.layerOrder]
+
+    layers = property(_get_layers)
+
+    def getLayer(self, name):
+        layer = self._layers.get(name)
+        if layer is None:
+            layer = self._layers[name] = Layer(self, name)
+        return layer
+
+    def close(self):
+        self._reader.close()
+
+class Info(object):
+
+    """
+    Attributes that aren't in fontinfo.plist are None.
+    """
+
+    def __getattr__(self, attr):
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return None
+
+class Features(object):
+
+    def __init__(self, text):
+        self.text = text
+
+# -----
+# Layer
+# -----
+
+class Layer(object):
+
+    def __init__(self, font, name):
+        self.font = font
+        self.name = name
+        self._glyphSet = font._reader.getGlyphSet(name, validateRead=False)
+        self._glyphs = {}
+        info = _Attributes()
+        self._glyphSet.readLayerInfo(info, validateRead=False)
+        self.color = _parseColor(getattr(info, "color", None))
+        self.lib = getattr(info, "lib", {})
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.name)
+
+    def keys(self):
+        return self._glyphSet.keys()
+
+    def __contains__(self, glyphName):
+        return glyphName in self._glyphSet
+
+    def __len__(self):
+        return len(self._glyphSet)
+
+    def __getitem__(self, glyphName):
+        glyph = self._glyphs.get(glyphName)
+        if glyph is None:
+            if glyphName not in self._glyphSet:
+                raise KeyError(glyphName)
+            glyph = self._glyphs[glyphName] = Glyph(self, glyphName)
+        return glyph
+
+# -----
+# Glyph
+# -----
+
+class Glyph(object):
+
+    def __init__(self, layer, name):
+        self.layer = layer
+        self.font = layer.font
+        self.name = name
+        data = _Attributes()
+        pen = _GlyphPointPen(self)
+        layer._glyphSet.readGlyph(name, data, pen, validate=False)
+        self.contours = tuple(pen.contours)
+        self.components = tuple(pen.components)
+        self.width = getattr(data, "width", 0)
+        self.height = getattr(data, "height", 0)
+        self.unicodes = tuple(getattr(data, "unicodes", ()))
+        self.note = getattr(data, "note", None)
+        self.lib = getattr(data, "lib", {})
+        self.markColor = _parseColor(self.lib.get("public.markColor"))
+        self.anchors = tuple(Anchor(anchor) for anchor in getattr(data, "anchors", ()))
+        self.guidelines = tuple(Guideline(guideline) for guideline in getattr(data, "guidelines", ()))
+        self.image = Image(self, getattr(data, "image", None))
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.name)
+
+    def draw(self, pen, contours=True, components=True):
+        self.drawPoints(PointToSegmentPen(pen), contours=contours, components=components)
+
+    def drawPoints(self, pointPen, contours=True, components=True):
+        if contours:
+            for contour in self.contours:
+                contour.drawPoints(pointPen)
+        if components:
+            for component in self.components:
+                component.drawPoints(pointPen)
+
+class _GlyphPointPen(AbstractPointPen):
+
+    def __init__(self, glyph):
+        self.glyph = glyph
+        self.contours = []
+        self.components = []
+        self._points = None
+        self._identifier = None
+
+    def beginPath(self, identifier=None, **kwargs):
+        self._points = []
+        self._identifier = identifier
+
+    def addPoint(self, pt, segmentType=None, smooth=False, name=None, identifier=None, **kwargs):
+        self._points.append(_makePoint(pt, segmentType, smooth, name, identifier))
+
+    def endPath(self):
+        contour = Contour(self.glyph, self._points, self._identifier, len(self.contours))
+        self.contours.append(contour)
+        self._points = None
+
+    def addComponent(self, baseGlyph, transformation, identifier=None, **kwargs):
+        component = Component(self.glyph, baseGlyph, transformation, identifier, len(self.components))
+        self.components.append(component)
+
+# -------
+# Contour
+# -------
+
+class Contour(object):
+
+    def __init__(self, glyph, points, identifier=None, index=None):
+        self.glyph = glyph
+        self.points = tuple(points)
+        self.identifier = identifier
+        self.index = index
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.index)
+
+    def _getSignedArea(self):
+        pen = AreaPen()
+        # the same as defcon
+        pen._endPath = pen._closePath
+        self.draw(pen)
+        return pen.value
+
+    def _get_clockwise(self):
+        return self._getSignedArea() < 0
+
+    clockwise = property(_get_clockwise)
+
+    def draw(self, pen):
+        self.drawPoints(PointToSegmentPen(pen))
+
+    def drawPoints(self, pointPen):
+        pointPen.beginPath(identifier=self.identifier)
+        for point in self.points:
+            segmentType = point.type
+            if segmentType == "offcurve":
+                segmentType = None
+            pointPen.addPoint(
+                (point.x, point.y),
+                segmentType=segmentType,
+                smooth=point.smooth,
+                name=point.name,
+                identifier=point.identifier
+            )
+        pointPen.endPath()
+
+class Point(object):
+
+    __slots__ = ("x", "y", "type", "smooth", "name", "identifier")
+
+    def __repr__(self):
+        return "<%s %s (%s, %s)>" % (self.__class__.__name__, self.type, self.x, self.y)
+
+def _makePoint(pt, segmentType, smooth, name, identifier):
+    point = Point()
+    point.x, point.y = pt
+    if segmentType is None:
+        segmentType = "offcurve"
+    point.type = segmentType
+    point.smooth = bool(smooth)
+    point.name = name
+    point.identifier = identifier
+    return point
+
+# ---------
+# Component
+# ---------
+
+class Component(object):
+
+    def __init__(self, glyph, baseGlyph, transformation, identifier=None, index=None):
+        self.glyph = glyph
+        self.baseGlyph = baseGlyph
+        self.transformation = tuple(float(value) for value in transformation)
+        self.identifier = identifier
+        self.index = index
+
+    def __repr__(self):
+        return "<%s %s %r>" % (self.__class__.__name__, self.baseGlyph, self.transformation)
+
+    def draw(self, pen):
+        pen.addComponent(self.baseGlyph, self.transformation)
+
+    def drawPoints(self, pointPen):
+        pointPen.addComponent(self.baseGlyph, self.transformation, identifier=self.identifier)
+
+# ------
+# Anchor
+# ------
+
+class Anchor(object):
+
+    def __init__(self, data):
+        self.x = data.get("x", 0)
+        self.y = data.get("y", 0)
+        self.name = data.get("name")
+        self.color = _parseColor(data.get("color"))
+        self.identifier = data.get("identifier")
+
+    def __repr__(self):
+        return "<%s %s (%s, %s)>" % (self.__class__.__name__, self.name, self.x, self.y)
+
+# ---------
+# Guideline
+# ---------
+
+class Guideline(object):
+
+    def __init__(self, data):
+        x = data.get("x")
+        y = data.get("y")
+        angle = data.get("angle")
+        # the same defaults as fontParts
+        if x is None:
+            x = 0
+        if y is None:
+            y = 0
+        if angle is None:
+            if x != 0 and y == 0:
+                angle = 90
+            else:
+                angle = 0
+        self.x = x
+        self.y = y
+        self.angle = float(angle % 360)
+        self.name = data.get("name")
+        self.color = _parseColor(data.get("color"))
+        self.identifier = data.get("identifier")
+
+    def __repr__(self):
+        return "<%s %s (%s, %s, %s)>" % (self.__class__.__name__, self.name, self.x, self.y, self.angle)
+
+    def naked(self):
+        # diff reads the name from the naked
+        # object to work around a fontParts
+        # normalizer. there is nothing to
+        # work around here.
+        return self
+
+# -----
+# Image
+# -----
+
+class Image(object):
+
+    def __init__(self, glyph, data):
+        self.glyph = glyph
+        self.fileName = None
+        self.transformation = (1, 0, 0, 1, 0, 0)
+        self.color = None
+        if data:
+            self.fileName = data.get("fileName")
+            self.transformation = tuple(
+                data.get(key, default)
+                for key, default in (
+                    ("xScale", 1),
+                    ("xyScale", 0),
+                    ("yxScale", 0),
+                    ("yScale", 1),
+                    ("xOffset", 0),
+                    ("yOffset", 0)
+                )
+            )
+            self.color = _parseColor(data.get("color"))
+
+    def _get_data(self):
+        if self.fileName is None:
+            return None
+        return self.glyph.font._reader.readImage(self.fileName, validate=False)
+
+    data = property(_get_data)
+
+# -----
+# Tools
+# -----
+
+class _Attributes(object):
+
+    pass
+
+def _parseColor(value):
+    if value is None:
+        return None
+    return tuple(float(component) for component in value.split(","))
@@ -0,0 +1,91 @@
+"""
+Time the gathering and classification of paths
+in diff.diffDirectories on synthetic trees of
+increasing size. The time per path should stay
+about the same as the trees grow.
+
+    python test/benchmarkDiffPaths.py [fileCount]
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+
+directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(directory), "source", "code"))
+
+from freezeDryer import diff
+from freezeDryer.tree import walkTree
+
+def makeTree(root, fileCount, filesPerDirectory=500):
+    """
+    Make fileCount empty files in directories
+    of filesPerDirectory files. One in every
+    fifty directories is named like a UFO.
+    """
+    for index in range(fileCount):
+        directoryIndex = index // filesPerDirectory
+        if directoryIndex % 50 == 49:
+            name = "font %d.ufo" % directoryIndex
+        else:
+            name = "directory %d" % directoryIndex
+        path = os.path.join(root, name)
+        if index % filesPerDirectory == 0:
+            os.mkdir(path)
+        open(os.path.join(path, "file %d.txt" % index), "w").close()
+
+def mutatePaths(paths, rate=0.01):
+    """
+    Make a second set of paths with some removed,
+    some added and the UFOs compressed.
+    """
+    random.seed(len(paths))
+    mutated = set()
+    for path in paths:
+        base, ext = os.path.splitext(path)
+        if ext == ".ufo":
+            mutated.add(base + ".ufoz")
+        elif random.random() > rate:
+            mutated.add(path)
+    for index in range(int(len(paths) * rate)):
+        mutated.add(os.path.join("added", "file %d.txt" % index))
+    return mutated
+
+def benchmark(fileCount):
+    root = tempfile.mkdtemp()
+    try:
+        makeTree(root, fileCount)
+        start = time.perf_counter()
+        snapshot = walkTree(root, includeUFOContents=False)
+        paths1 = diff._gatherFiles(snapshot)
+        walkTime = time.perf_counter() - start
+    finally:
+        shutil.rmtree(root)
+    paths2 = mutatePaths(paths1)
+    start = time.perf_counter()
+    added, removed, common = diff.classifyPaths(paths1, paths2)
+    classifyTime = time.perf_counter() - start
+    return walkTime, classifyTime, len(added), len(removed), len(common)
+
+if __name__ == "__main__":
+    maximum = 100000
+    if len(sys.argv) > 1:
+        maximum = int(sys.argv[1])
+    counts = [maximum // 8, maximum // 4, maximum // 2, maximum]
+    print("%8s %10s %10s %12s %8s %8s %8s" % ("files", "walk", "classify", "us/file", "added", "removed", "common"))
+    for fileCount in counts:
+        walkTime, classifyTime, added, removed, common = benchmark(fileCount)
+        print(
+            "%8d %9.3fs %9.3fs %12.2f %8d %8d %8d" % (
+                fileCount,
+                walkTime,
+                classifyTime,
+                classifyTime / fileCount * 1000000,
+                added,
+                removed,
+                common
+            )
+        )
@@ -0,0 +1,80 @@
+"""
+Test the archive catalog.
+
+    python -m unittest discover -s test
+"""
+
+import os
+import shutil
+import unittest
+from unittest import mock
+
+from testCore import ProjectTestCase
+from freezeDryer import core
+from freezeDryer import catalog
+
+class CatalogTest(ProjectTestCase):
+
+    def makeArchive(self, stamps=()):
+        root = self.makeProject()
+        for stamp in stamps:
+            core.performCommit(root, stamp, message=stamp)
+        archiveDirectory = core.getArchiveDirectory(root, core.readSettings(root))
+        return root, archiveDirectory
+
+    def test_commits(self):
+        root, archiveDirectory = self.makeArchive(["2000-01-01-00-00", "2000-01-01-00-01"])
+        with mock.patch.object(core, "rebuildCatalog") as rebuildCatalog:
+            records = core.getStateRecords(archiveDirectory)
+        self.assertFalse(rebuildCatalog.called)
+        self.assertEqual([record["stamp"] for record in records], ["2000-01-01-00-00", "2000-01-01-00-01"])
+        self.assertEqual([record["message"] for record in records], ["2000-01-01-00-00", "2000-01-01-00-01"])
+
+    def test_stateAdded(self):
+        root, archiveDirectory = self.makeArchive(["2000-01-01-00-00"])
+        shutil.copytree(
+            os.path.join(archiveDirectory, "2000-01-01-00-00"),
+            os.path.join(archiveDirectory, "2000-01-01-00-01")
+        )
+        self.assertEqual(core.getStateNames(archiveDirectory), ["2000-01-01-00-00", "2000-01-01-00-01"])
+        self.assertIsNotNone(catalog.readCatalog(archiveDirectory))
+
+    def test_stateRemoved(self):
+        root, archiveDirectory = self.makeArchive(["2000-01-01-00-00", "2000-01-01-00-01"])
+        shutil.rmtree(os.path.join(archiveDirectory, "2000-01-01-00-00"))
+        self.assertEqual(core.getStateNames(archiveDirectory), ["2000-01-01-00-01"])
+        self.assertIsNotNone(catalog.readCatalog(archiveDirectory))
+
+    def test_corrupt(self):
+        root, archiveDirectory = self.makeArchive(["2000-01-01-00-00"])
+        with open(catalog.getCatalogPath(archiveDirectory), "w") as f:
+            f.write("{")
+        self.assertIsNone(catalog.readCatalog(archiveDirectory))
+        self.assertEqual(core.getStateNames(archiveDirectory), ["2000-01-01-00-00"])
+        self.assertIsNotNone(catalog.readCatalog(archiveDirectory))
+
+    def test_missing(self):
+        root, archiveDirectory = self.makeArchive(["2000-01-01-00-00"])
+        os.remove(catalog.getCatalogPath(archiveDirectory))
+        self.assertEqual(core.getStateNames(archiveDirectory), ["2000-01-01-00-00"])
+        self.assertIsNotNone(catalog.readCatalog(archiveDirectory))
+
+    def test_emptyArchive(self):
+        root, archiveDirectory = self.makeArchive()
+        self.assertEqual(core.getStateNames(archiveDirectory), [])
+        with mock.patch.object(catalog, "writeCatalog") as writeCatalog:
+            self.assertEqual(core.getStateNames(archiveDirectory), [])
+            self.assertEqual(core.getStateNames(archiveDirectory), [])
+        self.assertFalse(writeCatalog.called)
+
+    def test_firstCommit(self):
+        root, archiveDirectory = self.makeArchive()
+        self.assertEqual(core.getStateNames(archiveDirectory), [])
+        core.performCommit(root, "2000-01-01-00-00")
+        with mock.patch.object(core, "rebuildCatalog") as rebuildCatalog:
+            self.assertEqual(core.getStateNames(archiveDirectory), ["2000-01-01-00-00"])
+        self.assertFalse(rebuildCatalog.called)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,293 @@
+"""
+Test the project functions in core.
+
+    python -m unittest discover -s test
+"""
+
+import os
+import sys
+import shutil
+import plistlib
+import zipfile
+import tempfile
+import unittest
+from unittest import mock
+
+directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(directory), "source", "code"))
+
+# readPlist and writePlist were removed from
+# plistlib in Python 3.9.
+if not hasattr(plistlib, "readPlist"):
+    def readPlist(path):
+        with open(path, "rb") as f:
+            return plistlib.load(f)
+    def writePlist(value, path):
+        with open(path, "wb") as f:
+            plistlib.dump(value, f)
+    plistlib.readPlist = readPlist
+    plistlib.writePlist = writePlist
+
+from freezeDryer import core
+from freezeDryer import storage
+
+fixtureDirectory = os.path.join(directory, "diff", "0000-00-00-00-00")
+
+class ProjectTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temporaryDirectory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temporaryDirectory)
+
+    def makeProject(self, **settings):
+        """
+        Make a project from the test fixture.
+        The settings override the defaults.
+        """
+        root = os.path.join(self.temporaryDirectory, "project")
+        shutil.copytree(fixtureDirectory, root)
+        projectSettings = core.getDefaultSettings(root)
+        projectSettings.update(settings)
+        core.initializeProject(root, projectSettings)
+        return root
+
+
+class HaveChangesTest(ProjectTestCase):
+
+    def test_noStates(self):
+        root = self.makeProject()
+        self.assertTrue(core.haveChanges(root))
+
+    def test_afterCommit(self):
+        root = self.makeProject()
+        core.performCommit(root, "2000-01-01-00-00")
+        self.assertFalse(core.haveChanges(root))
+
+    def test_afterCommitWithMessage(self):
+        root = self.makeProject()
+        core.performCommit(root, "2000-01-01-00-00", message="First.")
+        self.assertFalse(core.haveChanges(root))
+
+    def test_afterCommitWithReports(self):
+        root = self.makeProject()
+        stamp = "2000-01-01-00-00"
+        core.performCommit(root, stamp, message="First.")
+        # the reports need DrawBot, so stand ins are written
+        archiveDirectory = core.getArchiveDirectory(root, core.readSettings(root))
+        stateDirectory = core.getStatePath(archiveDirectory, stamp)
+        for fileName in (core.makeDiffReportFileName(stamp), core.makeProofFileName(stamp)):
+            with open(os.path.join(stateDirectory, fileName), "w") as f:
+                f.write("report")
+        self.assertFalse(core.haveChanges(root))
+
+    def test_afterCommitWithCompressedUFOs(self):
+        root = self.makeProject(compressUFOs=True)
+        core.performCommit(root, "2000-01-01-00-00", message="Compress.")
+        self.assertFalse(core.haveChanges(root))
+
+    def test_change(self):
+        root = self.makeProject()
+        core.performCommit(root, "2000-01-01-00-00", message="First.")
+        with open(os.path.join(root, "new.txt"), "w") as f:
+            f.write("new")
+        self.assertTrue(core.haveChanges(root))
+
+    def test_missingArchive(self):
+        root = self.makeProject()
+        core.performCommit(root, "2000-01-01-00-00")
+        shutil.rmtree(core.getArchiveDirectory(root, core.readSettings(root)))
+        self.assertFalse(core.haveChanges(root))
+
+
+class GetStatusTest(ProjectTestCase):
+
+    def test_noStates(self):
+        root = self.makeProject()
+        status = core.getStatus(root)
+        self.assertTrue(status["archive"])
+        self.assertIsNone(status["state"])
+        self.assertIn("changed.md", status["added"])
+
+    def test_afterCommit(self):
+        root = self.makeProject()
+        core.performCommit(root, "2000-01-01-00-00", message="First.")
+        status = core.getStatus(root)
+        self.assertEqual(status["state"], "2000-01-01-00-00")
+        self.assertEqual(status["added"], [])
+        self.assertEqual(status["removed"], [])
+        self.assertEqual(status["modified"], [])
+
+    def test_missingArchive(self):
+        root = self.makeProject()
+        archiveDirectory = core.getArchiveDirectory(root, core.readSettings(root))
+        shutil.rmtree(archiveDirectory)
+        status = core.getStatus(root)
+        self.assertFalse(status["archive"])
+        self.assertIsNone(status["state"])
+        self.assertEqual(status["added"], [])
+        self.assertEqual(core.formatStatus(status), ["The archive is not available."])
+        # the status index must not bring the archive back
+        self.assertFalse(os.path.exists(archiveDirectory))
+
+
+class RacyFileTest(ProjectTestCase):
+
+    def rewrite(self, path, old, new):
+        """
+        Change the contents of a file without
+        changing its size or modification time.
+        """
+        info = os.stat(path)
+        with open(path, "rb") as f:
+            data = f.read()
+        self.assertEqual(len(old), len(new))
+        self.assertIn(old, data)
+        with open(path, "wb") as f:
+            f.write(data.replace(old, new, 1))
+        os.utime(path, ns=(info.st_atime_ns, info.st_mtime_ns))
+
+    def readManifest(self, root, stamp):
+        archiveDirectory = core.getArchiveDirectory(root, core.readSettings(root))
+        return core.readStateManifest(archiveDirectory, stamp)
+
+    def commitRacyChange(self, root, relativePath):
+        path = os.path.join(root, relativePath)
+        os.utime(path)
+        core.performCommit(root, "2000-01-01-00-00")
+        entry = self.readManifest(root, "2000-01-01-00-00")[relativePath]
+        self.assertIsNone(entry[2])
+        self.assertFalse(core.haveChanges(root))
+        status = core.getStatus(root)
+        self.assertEqual(status["modified"], [])
+        self.rewrite(path, b"<glyph", b"<GLYPH")
+        self.assertTrue(core.haveChanges(root))
+        status = core.getStatus(root)
+        self.assertEqual(status["modified"], ["font.ufo"])
+        # the new contents must be stored, not the
+        # contents of the previous state
+        core.performCommit(root, "2000-01-01-00-01")
+        self.assertFalse(core.haveChanges(root))
+        status = core.getStatus(root)
+        self.assertEqual(status["modified"], [])
+
+    def test_racyFile(self):
+        root = self.makeProject()
+        self.commitRacyChange(root, os.path.join("font.ufo", "glyphs", "anchors.glif"))
+
+    def test_racyFileInCompressedUFO(self):
+        root = self.makeProject(compressUFOs=True)
+        self.commitRacyChange(root, os.path.join("font.ufo", "glyphs", "anchors.glif"))
+
+
+class DeduplicateFilesTest(ProjectTestCase):
+
+    def getObjects(self, archiveDirectory):
+        objects = set()
+        objectStoreDirectory = storage.getObjectStoreDirectory(archiveDirectory)
+        for directory, directoryNames, fileNames in os.walk(objectStoreDirectory):
+            for fileName in fileNames:
+                objects.add(os.path.basename(directory) + fileName)
+        return objects
+
+    def getStateDigests(self, archiveDirectory, stamp):
+        # the manifest doesn't have the digests of racy files
+        digests = set()
+        skip = core.getStateFilePaths(archiveDirectory, stamp)
+        for directory, directoryNames, fileNames in os.walk(core.getStatePath(archiveDirectory, stamp)):
+            for fileName in fileNames:
+                path = os.path.join(directory, fileName)
+                if path not in skip:
+                    digests.add(storage.hashFile(path))
+        return digests
+
+    def test_pruneDeletedState(self):
+        root = self.makeProject(deduplicateFiles=True)
+        archiveDirectory = core.getArchiveDirectory(root, core.readSettings(root))
+        with open(os.path.join(root, "old.txt"), "w") as f:
+            f.write("old")
+        core.performCommit(root, "2000-01-01-00-00")
+        os.remove(os.path.join(root, "old.txt"))
+        with open(os.path.join(root, "new.txt"), "w") as f:
+            f.write("new")
+        core.performCommit(root, "2000-01-01-00-01")
+        digests1 = self.getStateDigests(archiveDirectory, "2000-01-01-00-00")
+        digests2 = self.getStateDigests(archiveDirectory, "2000-01-01-00-01")
+        self.assertEqual(self.getObjects(archiveDirectory), digests1 | digests2)
+        # files in states are read only
+        path = os.path.join(archiveDirectory, "2000-01-01-00-01", "new.txt")
+        self.assertFalse(os.stat(path).st_mode & 0o222)
+        # nothing is pruned while the states are there
+        core.rebuildCatalog(archiveDirectory)
+        self.assertEqual(self.getObjects(archiveDirectory), digests1 | digests2)
+        shutil.rmtree(os.path.join(archiveDirectory, "2000-01-01-00-00"))
+        self.assertEqual(core.getStateNames(archiveDirectory), ["2000-01-01-00-01"])
+        self.assertEqual(self.getObjects(archiveDirectory), digests2)
+        self.assertFalse(core.haveChanges(root))
+
+
+class CopyCompressedZipMemberTest(ProjectTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.contents = {
+            "a.txt" : b"a" * 1000,
+            "b.bin" : os.urandom(100000)
+        }
+        self.sourcePath = os.path.join(self.temporaryDirectory, "source.zip")
+        with zipfile.ZipFile(self.sourcePath, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, data in self.contents.items():
+                archive.writestr(name, data)
+        self.destinationPath = os.path.join(self.temporaryDirectory, "destination.zip")
+
+    def copy(self, names=None, getInfo=None):
+        with zipfile.ZipFile(self.sourcePath, "r") as sourceArchive:
+            with zipfile.ZipFile(self.destinationPath, "w") as destinationArchive:
+                for info in sourceArchive.infolist():
+                    if names is not None and info.filename not in names:
+                        continue
+                    if getInfo is not None:
+                        info = getInfo(sourceArchive, info)
+                    core._copyCompressedZipMember(sourceArchive, info, destinationArchive)
+        with zipfile.ZipFile(self.destinationPath, "r") as archive:
+            self.assertIsNone(archive.testzip())
+            copied = {name : archive.read(name) for name in archive.namelist()}
+        if names is None:
+            names = list(self.contents.keys())
+        self.assertEqual(copied, {name : self.contents[name] for name in names})
+
+    def test_copy(self):
+        self.copy()
+
+    def test_fallback(self):
+        # the private parts of ZipFile are gone
+        with mock.patch.object(core, "_copyRawZipMember", side_effect=AttributeError) as copyRawZipMember:
+            self.copy()
+        self.assertTrue(copyRawZipMember.called)
+
+    def test_fallbackAfterPartialCopy(self):
+        # the raw copy runs out of data after it has
+        # written most of the source into the member
+        def getInfo(sourceArchive, sourceInfo):
+            info = zipfile.ZipInfo(sourceInfo.filename, sourceInfo.date_time)
+            for attribute in ("compress_type", "header_offset", "CRC", "file_size"):
+                setattr(info, attribute, getattr(sourceInfo, attribute))
+            info.compress_size = os.path.getsize(self.sourcePath)
+            return info
+        self.copy(names=["a.txt"], getInfo=getInfo)
+
+    def test_commit(self):
+        root = self.makeProject(compressUFOs=True)
+        core.performCommit(root, "2000-01-01-00-00")
+        with open(os.path.join(root, "font.ufo", "glyphs", "anchors.glif"), "a") as f:
+            f.write("\n")
+        with mock.patch.object(core, "_copyRawZipMember", side_effect=AttributeError) as copyRawZipMember:
+            core.performCommit(root, "2000-01-01-00-01")
+        self.assertTrue(copyRawZipMember.called)
+        self.assertFalse(core.haveChanges(root))
+        archiveDirectory = core.getArchiveDirectory(root, core.readSettings(root))
+        path = os.path.join(core.getStatePath(archiveDirectory, "2000-01-01-00-01"), "font.ufoz")
+        with zipfile.ZipFile(path, "r") as archive:
+            self.assertIsNone(archive.testzip())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,672 @@
+"""
+Test the differences.
+
+    python -m unittest discover -s test
+"""
+
+import os
+import sys
+import types
+import shutil
+import random
+import tempfile
+import contextlib
+import unittest
+from unittest import mock
+
+directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(directory), "source", "code"))
+
+from freezeDryer import diff
+from freezeDryer import ufoData
+
+try:
+    from fontParts.world import NewFont
+except ImportError:
+    NewFont = None
+
+root1 = os.path.join(directory, "diff", "0000-00-00-00-00")
+root2 = os.path.join(directory, "diff", "0000-00-00-00-01")
+
+def compileDifferences(**kwargs):
+    events = diff.iterateDifferences(root1, root2, **kwargs)
+    return diff.collectDifferences(list(events))
+
+
+class ProcessTest(unittest.TestCase):
+
+    def test_sameAsSerial(self):
+        for normalize in (False, True):
+            with self.subTest(normalize=normalize):
+                expected = compileDifferences(normalizeFontContours=normalize, workerCount=1)
+                with mock.patch.object(diff, "_iterateCommonPathsInProcesses", wraps=diff._iterateCommonPathsInProcesses) as iterateCommonPathsInProcesses:
+                    differences = compileDifferences(normalizeFontContours=normalize, workerCount=2)
+                self.assertTrue(iterateCommonPathsInProcesses.called)
+                self.assertEqual(diff.dumpDifferences(differences), diff.dumpDifferences(expected))
+
+    def test_stopEarly(self):
+        events = diff.iterateDifferences(root1, root2, workerCount=2)
+        for event in events:
+            if event["type"] == "glyph":
+                break
+        events.close()
+
+    def test_tasks(self):
+        common = ["a.txt", "font.ufo", "b.txt", "font.ufoz"]
+        self.assertEqual(
+            diff._makeProcessTasks(common),
+            [["font.ufo"], ["font.ufoz"], ["a.txt", "b.txt"]]
+        )
+
+
+# --------
+# Contours
+# --------
+
+def oldNormalizeContours(contour1, contour2):
+    """
+    The _normalizeContours that normalized copies
+    of the contours with fontParts.
+    """
+    contour1 = contour1.copy()
+    contour2 = contour2.copy()
+    if contour1.open or contour2.open:
+        pass
+    else:
+        # set a consistent direction
+        if contour1.clockwise != contour2.clockwise:
+            contour2.clockwise = contour1.clockwise
+        # find a start segment based on identifiers
+        identifiers1 = {
+            segment.onCurve.identifier : index
+            for index, segment in enumerate(contour1)
+            if segment.onCurve.identifier is not None
+        }
+        if identifiers1:
+            for segment in contour2:
+                identifier = segment.onCurve.identifier
+                index = identifiers1.get(identifier)
+                if index is not None:
+                    contour2.setStartSegment(index)
+                    break
+        # guess the start segment
+        else:
+            contour1.autoStartSegment()
+            contour2.autoStartSegment()
+    return contour1, contour2
+
+def oldDiffContours(glyph1, glyph2):
+    """
+    diffContours as it was with _normalizeContours
+    and the pairing by order and area, with the
+    objects replaced by records.
+    """
+    contours1, contours2 = diff.matchObjectsWithAttributes(
+        list(glyph1.contours),
+        list(glyph2.contours),
+        ("identifier",),
+        (">len segments", "area")
+    )
+    added = []
+    removed = []
+    changed = []
+    for contour1, contour2 in zip(contours1, contours2):
+        differences = diff.diffObject(contour1, contour2, ("identifier", "index", "clockwise"))
+        normalized1, normalized2 = oldNormalizeContours(contour1, contour2)
+        values1 = [diff._pointValues(point) for point in normalized1.points]
+        values2 = [diff._pointValues(point) for point in normalized2.points]
+        pointDifferences = diff._diffPointValues(values1, values2)
+        if pointDifferences:
+            differences["points"] = pointDifferences
+        if differences:
+            differences["contour1"] = diff.makeContourRecord(contour1)
+            differences["contour2"] = diff.makeContourRecord(contour2)
+            changed.append(differences)
+    commonCount = min(len(contours1), len(contours2))
+    added = [diff.makeContourRecord(contour) for contour in contours2[commonCount:]]
+    removed = [diff.makeContourRecord(contour) for contour in contours1[commonCount:]]
+    differences = {}
+    if added:
+        differences["added"] = added
+    if removed:
+        differences["removed"] = removed
+    if changed:
+        differences["changed"] = changed
+    return differences
+
+def makeRandomContour(randomizer):
+    """
+    Make a list of (x, y, segmentType) for a closed
+    contour with lines, curves and quadratic curves.
+    """
+    points = []
+    for segmentIndex in range(randomizer.randint(1, 8)):
+        segmentType = randomizer.choice(("line", "curve", "qcurve"))
+        offCurveCount = dict(line=0, curve=2, qcurve=randomizer.randint(1, 3))[segmentType]
+        for index in range(offCurveCount):
+            points.append((randomizer.randint(-500, 500), randomizer.randint(-500, 500), None))
+        points.append((randomizer.randint(-500, 500), randomizer.randint(-500, 500), segmentType))
+    return points
+
+def rotateContour(points, randomizer):
+    # start at a random on curve point
+    onCurves = [index for index, (x, y, segmentType) in enumerate(points) if segmentType is not None]
+    index = randomizer.choice(onCurves) + 1
+    return points[index:] + points[:index]
+
+def drawContours(glyph, contours, identifiers=False):
+    pen = glyph.getPointPen()
+    for contourIndex, points in enumerate(contours):
+        pen.beginPath()
+        for x, y, segmentType in points:
+            identifier = None
+            if identifiers and segmentType is not None:
+                identifier = "%s-%s-%s" % (contourIndex, x, y)
+            pen.addPoint((x, y), segmentType=segmentType, identifier=identifier)
+        pen.endPath()
+
+def getContourValues(contour):
+    return [diff._pointValues(point) for point in contour.points]
+
+
+class NormalizeContoursTest(unittest.TestCase):
+
+    def setUp(self):
+        if NewFont is None:
+            self.skipTest("fontParts is not available")
+        self.font = NewFont()
+        self.randomizer = random.Random(0)
+
+    def makeGlyph(self, name, contours, identifiers=False):
+        glyph = self.font.newGlyph(name)
+        drawContours(glyph, contours, identifiers)
+        return glyph
+
+    def test_reversePointValues(self):
+        for index in range(200):
+            glyph = self.makeGlyph("a", [makeRandomContour(self.randomizer)])
+            contour = glyph.contours[0]
+            values = getContourValues(contour)
+            contour.reverse()
+            self.assertEqual(diff._reversePointValues(values), getContourValues(contour))
+
+    def test_autoStartSegment(self):
+        for index in range(200):
+            points = rotateContour(makeRandomContour(self.randomizer), self.randomizer)
+            glyph = self.makeGlyph("a", [points])
+            contour = glyph.contours[0]
+            values = getContourValues(contour)
+            contour.autoStartSegment()
+            result = diff._autoStartSegment(values, diff._getSegmentOnCurves(values))
+            self.assertEqual(result, getContourValues(contour))
+
+    def test_sameAsOld(self):
+        def reverse(contour):
+            contour.reverse()
+        def rotate(contour):
+            contour.setStartSegment(self.randomizer.randrange(len(contour.segments)))
+        def reverseAndRotate(contour):
+            reverse(contour)
+            rotate(contour)
+        def move(contour):
+            contour.points[self.randomizer.randrange(len(contour.points))].x += 10
+        def addPoint(contour):
+            contour.appendPoint((0, 0), type="line")
+        def removeSegment(contour):
+            if len(contour.segments) > 1:
+                contour.removeSegment(self.randomizer.randrange(len(contour.segments)))
+        def moveAndRotate(contour):
+            move(contour)
+            rotate(contour)
+        changes = [reverse, rotate, reverseAndRotate, move, addPoint, removeSegment, moveAndRotate]
+        for change in changes:
+            with self.subTest(change=change.__name__):
+                # one contour, so that this doesn't
+                # depend on the pairing
+                for index in range(30):
+                    contours = [makeRandomContour(self.randomizer)]
+                    glyph1 = self.makeGlyph("a", contours)
+                    glyph2 = self.makeGlyph("b", contours)
+                    for contour in glyph2.contours:
+                        change(contour)
+                    self.assertEqual(diff.diffContours(glyph1, glyph2), oldDiffContours(glyph1, glyph2))
+
+    def test_unchanged(self):
+        points = makeRandomContour(self.randomizer)
+        glyph1 = self.makeGlyph("a", [points])
+        glyph2 = self.makeGlyph("b", [rotateContour(points, self.randomizer)])
+        glyph2.contours[0].reverse()
+        differences = diff.diffContours(glyph1, glyph2)
+        self.assertEqual(list(differences["changed"][0].keys()), ["clockwise", "contour1", "contour2"])
+        self.assertEqual(differences, oldDiffContours(glyph1, glyph2))
+
+    def test_identifiers(self):
+        # the on curve point with the same identifier
+        # ends up at the same index.
+        points = [(0, 0, "line"), (0, 100, "line"), (100, 100, "line"), (100, 0, "line")]
+        glyph1 = self.makeGlyph("a", [points], identifiers=True)
+        glyph2 = self.makeGlyph("b", [points[2:] + points[:2]], identifiers=True)
+        self.assertEqual(diff.diffContours(glyph1, glyph2), {})
+
+
+class PointValuesTest(unittest.TestCase):
+
+    def makeValues(self, *points):
+        return [(None, None, x, y, segmentType, False) for x, y, segmentType in points]
+
+    def test_alignIdentifiers(self):
+        values1 = self.makeValues((0, 0, "line"), (0, 100, "line"), (100, 100, "line"))
+        values1 = [value[:1] + ("id%d" % index,) + value[2:] for index, value in enumerate(values1)]
+        values2 = [values1[1], values1[2], values1[0]]
+        self.assertEqual(diff._alignPointValues(values1, values2), (values1, values1))
+
+    def test_alignWithoutIdentifiers(self):
+        values1 = self.makeValues((0, 100, "line"), (100, 100, "line"), (0, 0, "line"))
+        values2 = values1[1:] + values1[:1]
+        aligned1, aligned2 = diff._alignPointValues(values1, values2)
+        self.assertEqual(aligned1, aligned2)
+        # the segment of the lowest point is first
+        self.assertEqual(aligned1[0][2:4], (100, 100))
+
+    def test_autoStartSegmentOffCurves(self):
+        values = self.makeValues(
+            (0, 100, "line"),
+            (50, 150, "offcurve"),
+            (100, 150, "offcurve"),
+            (100, 100, "curve"),
+            (100, 0, "line"),
+            (0, 0, "line")
+        )
+        result = diff._autoStartSegment(values, diff._getSegmentOnCurves(values))
+        self.assertEqual(result, values[-2:] + values[:-2])
+
+    def test_diffPointValues(self):
+        values1 = self.makeValues((0, 0, "line"), (0, 100, "line"))
+        values2 = self.makeValues((0, 0, "line"), (10, 100, "curve"), (100, 100, "line"))
+        self.assertEqual(
+            diff._diffPointValues(values1, values2),
+            dict(
+                added=[diff._makePointRecord(values2[2])],
+                changed=[
+                    dict(
+                        x=dict(value1=0, value2=10),
+                        type=dict(value1="line", value2="curve"),
+                        point1=diff._makePointRecord(values1[1]),
+                        point2=diff._makePointRecord(values2[1])
+                    )
+                ]
+            )
+        )
+        self.assertEqual(diff._diffPointValues(values2, values1)["removed"], [diff._makePointRecord(values2[2])])
+        self.assertEqual(diff._diffPointValues(values1, values1), {})
+
+# -------
+# Records
+# -------
+
+def makeDrawBotStandIn():
+    """
+    Make a module that can stand in for drawBot,
+    which is only available on macOS. The glyphs
+    are still drawn, but nothing is rendered.
+    """
+    from fontTools.pens.recordingPen import RecordingPen
+    class BezierPath(RecordingPen):
+        def __init__(self, glyphSet=None):
+            super().__init__()
+            self.glyphSet = glyphSet
+        def addComponent(self, baseGlyph, transformation):
+            if baseGlyph in self.glyphSet:
+                self.glyphSet[baseGlyph].draw(self)
+    def saveImage(path):
+        with open(path, "w") as f:
+            f.write('<svg xmlns="http://www.w3.org/2000/svg"/>')
+    module = types.ModuleType("drawBot")
+    module.BezierPath = BezierPath
+    module.saveImage = saveImage
+    module.savedState = contextlib.nullcontext
+    for name in ("newDrawing", "newPage", "translate", "scale", "fill", "stroke", "strokeWidth", "line", "drawPath", "oval", "rect", "fontSize", "text"):
+        setattr(module, name, lambda *args, **kwargs: None)
+    return module
+
+
+class RecordsTest(unittest.TestCase):
+
+    def test_roundTrip(self):
+        for engine in diff.fontEngines:
+            for onlyDefaultLayer in (True, False):
+                with self.subTest(engine=engine, onlyDefaultLayer=onlyDefaultLayer):
+                    differences = diff.diffDirectories(root1, root2, onlyCompareFontDefaultLayers=onlyDefaultLayer, engine=engine)
+                    self.assertIn("font.ufo", differences["changed"])
+                    text = diff.dumpDifferences(differences)
+                    self.assertEqual(diff.loadDifferences(text), differences)
+
+    def test_reportFromLoadedRecords(self):
+        try:
+            import drawBot
+            modules = {}
+        except ImportError:
+            modules = {"drawBot" : makeDrawBotStandIn()}
+        with mock.patch.dict(sys.modules, modules):
+            from freezeDryer import diffReport
+        differences = diff.diffDirectories(root1, root2, onlyCompareFontDefaultLayers=False)
+        differences = diff.loadDifferences(diff.dumpDifferences(differences))
+        # fonts are only opened to draw glyphs,
+        # once for each font.
+        openGlyph = mock.patch.object(diffReport, "_openGlyph", wraps=diffReport._openGlyph)
+        openFont = mock.patch.object(ufoData, "openFont", wraps=ufoData.openFont)
+        openFonts = mock.patch.object(diff, "openFonts", side_effect=AssertionError)
+        getFontEngine = mock.patch.object(diff, "getFontEngine", side_effect=AssertionError)
+        with openGlyph as openGlyph, openFont as openFont, openFonts, getFontEngine:
+            report = diffReport.makeDiffReport(differences)
+        self.assertIn("font.ufo", report)
+        self.assertTrue(openGlyph.called)
+        paths = set(call.args[0]["path"] for call in openGlyph.call_args_list)
+        self.assertEqual(sorted(call.args[0] for call in openFont.call_args_list), sorted(paths))
+        self.assertEqual(diffReport._fonts, {})
+
+
+# ---------
+# Streaming
+# ---------
+
+def oldDiffDirectories(root1, root2, **diffOptions):
+    """
+    The serial diffDirectories that compared the
+    common paths one at a time and then returned
+    everything at once.
+    """
+    paths1 = diff._gatherFiles(diff.walkTree(root1, None, includeUFOContents=False))
+    paths2 = diff._gatherFiles(diff.walkTree(root2, None, includeUFOContents=False))
+    added, removed, common = diff.classifyPaths(paths1, paths2)
+    digestSource1 = diff.makeDigestSource(root1)
+    digestSource2 = diff.makeDigestSource(root2)
+    changed = {}
+    for path in common:
+        path, details = diff._diffCommonPath(digestSource1, digestSource2, path, diffOptions)
+        if details is not None:
+            changed[path] = details
+    differences = dict(
+        root1=root1,
+        root2=root2,
+        added=added,
+        removed=removed,
+        changed=changed
+    )
+    return differences
+
+
+class CollectDifferencesTest(unittest.TestCase):
+
+    def test_sameAsOld(self):
+        for normalize in (False, True):
+            for onlyDefaultLayer in (True, False):
+                for workerCount in (1, 2):
+                    with self.subTest(normalize=normalize, onlyDefaultLayer=onlyDefaultLayer, workerCount=workerCount):
+                        options = dict(
+                            onlyCompareFontDefaultLayers=onlyDefaultLayer,
+                            normalizeFontContours=normalize,
+                            normalizeFontComponents=normalize,
+                            normalizeFontAnchors=normalize,
+                            normalizeFontGuidelines=normalize,
+                            engine="ufoLib"
+                        )
+                        expected = oldDiffDirectories(root1, root2, **options)
+                        events = list(diff.iterateDifferences(root1, root2, workerCount=workerCount, **options))
+                        self.assertEqual(diff.collectDifferences(events), expected)
+                        self.assertEqual(diff.diffDirectories(root1, root2, workerCount=workerCount, **options), expected)
+                        # the glyph results are the glyphs in the file results
+                        glyphs = {}
+                        for event in events:
+                            if event["type"] == "glyph":
+                                glyphs[event["glyph"]] = event["differences"]
+                        layers = expected["changed"]["font.ufo"]["differences"]["layers"]["changed"]
+                        expectedGlyphs = {}
+                        for layerDifferences in layers.values():
+                            expectedGlyphs.update(layerDifferences.get("glyphs", {}).get("changed", {}))
+                        self.assertTrue(glyphs)
+                        self.assertEqual(glyphs, expectedGlyphs)
+
+    def test_iterateCollectedDifferences(self):
+        differences = diff.diffDirectories(root1, root2)
+        events = list(diff.iterateCollectedDifferences(differences))
+        self.assertEqual(diff.collectDifferences(events), differences)
+
+
+class HaveDifferencesTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.root1 = os.path.join(directory, "root1")
+        self.root2 = os.path.join(directory, "root2")
+        fontPath = os.path.join(root1, "font.ufo")
+        for root in (self.root1, self.root2):
+            for fileName in ("a.ufo", "b.ufo", "c.ufo"):
+                shutil.copytree(fontPath, os.path.join(root, fileName))
+
+    def change(self, fileName):
+        path = os.path.join(self.root2, fileName, "glyphs", "anchors.glif")
+        with open(path, "a") as f:
+            f.write("\n")
+
+    def test_stopAtFirstDifference(self):
+        self.change("a.ufo")
+        getUFODigests = mock.patch.object(diff, "getUFODigests", wraps=diff.getUFODigests)
+        diffFile = mock.patch.object(diff, "diffFile", side_effect=AssertionError)
+        with getUFODigests as getUFODigests, diffFile:
+            self.assertTrue(diff.haveDifferences(self.root1, self.root2))
+        self.assertEqual(
+            sorted(set(call.args[1] for call in getUFODigests.call_args_list if call.kwargs.get("read", True))),
+            ["a.ufo"]
+        )
+
+    def test_noDifferences(self):
+        getUFODigests = mock.patch.object(diff, "getUFODigests", wraps=diff.getUFODigests)
+        diffFile = mock.patch.object(diff, "diffFile", side_effect=AssertionError)
+        with getUFODigests as getUFODigests, diffFile:
+            self.assertFalse(diff.haveDifferences(self.root1, self.root2))
+        self.assertEqual(
+            sorted(set(call.args[1] for call in getUFODigests.call_args_list if call.kwargs.get("read", True))),
+            ["a.ufo", "b.ufo", "c.ufo"]
+        )
+
+    def test_lastDifferent(self):
+        self.change("c.ufo")
+        with mock.patch.object(diff, "diffFile", side_effect=AssertionError):
+            self.assertTrue(diff.haveDifferences(self.root1, self.root2))
+
+
+# -------
+# Engines
+# -------
+
+class FontEngineTest(unittest.TestCase):
+
+    def test_sameDifferences(self):
+        if diff.OpenFont is None:
+            self.skipTest("fontParts is not available")
+        for normalize in (False, True):
+            for onlyDefaultLayer in (True, False):
+                with self.subTest(normalize=normalize, onlyDefaultLayer=onlyDefaultLayer):
+                    dumped = {}
+                    for engine in ("fontParts", "ufoLib"):
+                        differences = diff.diffDirectories(
+                            root1,
+                            root2,
+                            onlyCompareFontDefaultLayers=onlyDefaultLayer,
+                            normalizeFontContours=normalize,
+                            normalizeFontComponents=normalize,
+                            normalizeFontAnchors=normalize,
+                            normalizeFontGuidelines=normalize,
+                            engine=engine
+                        )
+                        self.assertIn("font.ufo", differences["changed"])
+                        dumped[engine] = diff.dumpDifferences(differences)
+                    self.assertEqual(dumped["fontParts"], dumped["ufoLib"])
+
+
+# -------
+# Pairing
+# -------
+
+def matchIndexes(signatures1, signatures2):
+    objects1 = list(range(len(signatures1)))
+    objects2 = list(range(len(signatures2)))
+    matched1, matched2 = diff._matchObjectsWithSignatures(objects1, objects2, signatures1, signatures2)
+    return list(zip(matched1, matched2)), matched1[len(matched2):], matched2[len(matched1):]
+
+def makeBox(x, y, size=10):
+    return (x, y, x + size, y + size)
+
+
+class MatchObjectsWithSignaturesTest(unittest.TestCase):
+
+    def test_identifiers(self):
+        signatures1 = [("a", 1, None, makeBox(0, 0)), ("b", 2, None, makeBox(100, 0))]
+        signatures2 = [("b", 1, None, makeBox(0, 0)), ("a", 2, None, makeBox(100, 0))]
+        self.assertEqual(matchIndexes(signatures1, signatures2), ([(0, 1), (1, 0)], [], []))
+
+    def test_keys(self):
+        signatures1 = [(None, 1, None, makeBox(0, 0)), (None, 2, None, makeBox(100, 0))]
+        signatures2 = [(None, 2, None, makeBox(0, 0)), (None, 1, None, makeBox(100, 0))]
+        self.assertEqual(matchIndexes(signatures1, signatures2), ([(0, 1), (1, 0)], [], []))
+
+    def test_duplicateKeys(self):
+        # duplicates are paired in order
+        signatures1 = [(None, 1, None, makeBox(0, 0))] * 3
+        signatures2 = [(None, 1, None, makeBox(0, 0))] * 2
+        self.assertEqual(matchIndexes(signatures1, signatures2), ([(0, 0), (1, 1)], [2], []))
+        self.assertEqual(matchIndexes(signatures2, signatures1), ([(0, 0), (1, 1)], [], [2]))
+
+    def test_nearestBoxes(self):
+        signatures1 = [(None, index, None, makeBox(index * 100, 0)) for index in range(5)]
+        signatures2 = [(None, -index, None, makeBox(index * 100 + 3, 5)) for index in reversed(range(5))]
+        pairs, unpaired1, unpaired2 = matchIndexes(signatures1, signatures2)
+        self.assertEqual(pairs, [(0, 4), (1, 3), (2, 2), (3, 1), (4, 0)])
+
+    def test_closestFirst(self):
+        # 1 is closer to the only box than 0 is
+        signatures1 = [(None, 1, None, makeBox(0, 0)), (None, 2, None, makeBox(95, 0))]
+        signatures2 = [(None, 3, None, makeBox(100, 0))]
+        self.assertEqual(matchIndexes(signatures1, signatures2), ([(1, 0)], [0], []))
+
+    def test_groups(self):
+        # the same group wins over a nearer box
+        signatures1 = [(None, 1, "a", makeBox(0, 0)), (None, 2, "b", makeBox(100, 0))]
+        signatures2 = [(None, 3, "b", makeBox(5, 0)), (None, 4, "a", makeBox(200, 0))]
+        self.assertEqual(matchIndexes(signatures1, signatures2), ([(0, 1), (1, 0)], [], []))
+        # then anything that is left
+        signatures2 = [(None, 3, "c", makeBox(5, 0)), (None, 4, "a", makeBox(200, 0))]
+        self.assertEqual(matchIndexes(signatures1, signatures2), ([(0, 1), (1, 0)], [], []))
+
+    def test_priority(self):
+        # identifiers, then keys, then boxes
+        signatures1 = [("a", 1, None, makeBox(0, 0)), (None, 2, None, makeBox(0, 0)), (None, 3, None, makeBox(0, 0))]
+        signatures2 = [(None, 2, None, makeBox(500, 0)), (None, 1, None, makeBox(0, 0)), ("a", 4, None, makeBox(900, 0))]
+        self.assertEqual(matchIndexes(signatures1, signatures2), ([(0, 2), (1, 0), (2, 1)], [], []))
+
+
+class MatchContoursAndComponentsTest(unittest.TestCase):
+
+    def setUp(self):
+        if NewFont is None:
+            self.skipTest("fontParts is not available")
+        self.font = NewFont()
+        self.randomizer = random.Random(0)
+
+    def getIndexes(self, matched1, matched2):
+        return [(object1.index, object2.index) for object1, object2 in zip(matched1, matched2)]
+
+    def test_contoursReordered(self):
+        contours = [makeRandomContour(self.randomizer) for index in range(20)]
+        order = list(range(20))
+        self.randomizer.shuffle(order)
+        glyph1 = self.font.newGlyph("a")
+        drawContours(glyph1, contours)
+        glyph2 = self.font.newGlyph("b")
+        drawContours(glyph2, [contours[index] for index in order])
+        # reversed and rotated contours have the same key
+        glyph2.contours[0].reverse()
+        glyph2.contours[1].setStartSegment(1)
+        matched1, matched2 = diff.matchContours(list(glyph1.contours), list(glyph2.contours))
+        self.assertEqual(
+            sorted(self.getIndexes(matched1, matched2)),
+            sorted((index, position) for position, index in enumerate(order))
+        )
+
+    def test_contoursSameAsOld(self):
+        # contours that stay in order and are edited
+        # are paired the same as before.
+        for index in range(10):
+            contours1 = [makeRandomContour(self.randomizer) for i in range(5)]
+            contours2 = [
+                [(x + self.randomizer.randint(-5, 5), y, segmentType) for x, y, segmentType in points]
+                for points in contours1
+            ]
+            glyph1 = self.font.newGlyph("a")
+            drawContours(glyph1, contours1)
+            glyph2 = self.font.newGlyph("b")
+            drawContours(glyph2, contours2)
+            contours1 = list(glyph1.contours)
+            contours2 = list(glyph2.contours)
+            self.assertEqual(
+                self.getIndexes(*diff.matchContours(contours1, contours2)),
+                self.getIndexes(*diff.matchObjectsWithAttributes(contours1, contours2, ("identifier",), (">len segments", "area")))
+            )
+            self.assertEqual(diff.diffContours(glyph1, glyph2), oldDiffContours(glyph1, glyph2))
+
+    def makeComponents(self, name, components):
+        glyph = self.font.newGlyph(name)
+        for baseGlyph, offset in components:
+            glyph.appendComponent(baseGlyph, offset=offset)
+        return glyph
+
+    def test_components(self):
+        glyph1 = self.makeComponents("a", [("x", (0, 0)), ("y", (0, 0)), ("x", (500, 0)), ("z", (0, 0))])
+        glyph2 = self.makeComponents("b", [("y", (10, 0)), ("x", (500, 0)), ("x", (20, 0))])
+        matched1, matched2 = diff.matchComponents(list(glyph1.components), list(glyph2.components))
+        self.assertEqual(self.getIndexes(matched1, matched2), [(0, 2), (1, 0), (2, 1)])
+        self.assertEqual([component.index for component in matched1[len(matched2):]], [3])
+
+    def test_componentsSameAsOld(self):
+        components = [(self.randomizer.choice("xyz"), (index * 100, 0)) for index in range(10)]
+        self.randomizer.shuffle(components)
+        glyph1 = self.makeComponents("a", components)
+        glyph2 = self.makeComponents("b", [(baseGlyph, (x + 5, y)) for baseGlyph, (x, y) in components])
+        components1 = list(glyph1.components)
+        components2 = list(glyph2.components)
+        self.assertEqual(
+            self.getIndexes(*diff.matchComponents(components1, components2)),
+            self.getIndexes(*diff.matchObjectsWithAttributes(components1, components2, ("identifier", "baseGlyph"), ("transformation", "baseGlyph")))
+        )
+
+
+class BoxIndexTest(unittest.TestCase):
+
+    def test_nearest(self):
+        randomizer = random.Random(0)
+        for size in (1, 2, 10, 100):
+            boxes = [makeBox(randomizer.randint(0, 1000), randomizer.randint(0, 1000), randomizer.randint(0, 100)) for index in range(size)]
+            indexes = list(range(size))
+            boxIndex = diff._BoxIndex(boxes, indexes)
+            while indexes:
+                box = makeBox(randomizer.randint(-100, 1100), randomizer.randint(-100, 1100), randomizer.randint(0, 100))
+                expected = min(diff._getBoxDistance(box, boxes[index]) for index in indexes)
+                distance, index = boxIndex.nearest(box)
+                self.assertEqual(distance, expected)
+                self.assertEqual(diff._getBoxDistance(box, boxes[index]), expected)
+                boxIndex.remove(index)
+                indexes.remove(index)
+                self.assertNotIn(index, boxIndex)
+                self.assertEqual(len(boxIndex), len(indexes))
+            self.assertEqual(boxIndex.nearest(makeBox(0, 0)), (None, None))
+
+    def test_sameBoxes(self):
+        boxes = [makeBox(0, 0)] * 3
+        boxIndex = diff._BoxIndex(boxes, [0, 1, 2])
+        self.assertEqual(boxIndex.nearest(makeBox(0, 0)), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
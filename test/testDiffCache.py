@@ -0,0 +1,74 @@
+"""
+Test the diff cache.
+
+    python -m unittest discover -s test
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(directory), "source", "code"))
+
+from freezeDryer import diff
+from freezeDryer import diffCache
+
+class DiffCacheKeyTest(unittest.TestCase):
+
+    def makeKey(self, engine="ufoLib"):
+        return diffCache.makeDiffCacheKey("archive/a", "archive/b", False, True, engine)
+
+    def test_sameKey(self):
+        self.assertEqual(self.makeKey(), self.makeKey())
+
+    def test_engine(self):
+        if diff.OpenFont is None:
+            self.skipTest("fontParts is not available")
+        self.assertNotEqual(self.makeKey("fontParts"), self.makeKey("ufoLib"))
+
+    def test_unavailableEngine(self):
+        # fontParts falls back to ufoLib
+        with mock.patch.object(diff, "OpenFont", None):
+            self.assertEqual(self.makeKey("fontParts"), self.makeKey("ufoLib"))
+
+    def test_differencesFormatVersion(self):
+        key = self.makeKey()
+        with mock.patch.object(diff, "differencesFormatVersion", diff.differencesFormatVersion + 1):
+            self.assertNotEqual(self.makeKey(), key)
+
+    def test_diffCacheFormatVersion(self):
+        key = self.makeKey()
+        with mock.patch.object(diffCache, "diffCacheFormatVersion", diffCache.diffCacheFormatVersion + 1):
+            self.assertNotEqual(self.makeKey(), key)
+
+
+class CachedDifferencesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.archiveDirectory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.archiveDirectory)
+
+    def test_roundTrip(self):
+        differences = dict(
+            root1="a",
+            root2="b",
+            added=["added.txt"],
+            removed=[("removed.ufo", "removed.ufoz")],
+            changed={}
+        )
+        key = "key"
+        diffCache.writeCachedDifferences(self.archiveDirectory, key, differences, 1024 * 1024)
+        names = os.listdir(diffCache.getDiffCacheDirectory(self.archiveDirectory))
+        self.assertEqual(names, [key + ".json"])
+        self.assertEqual(diffCache.readCachedDifferences(self.archiveDirectory, key), differences)
+
+    def test_missing(self):
+        self.assertIsNone(diffCache.readCachedDifferences(self.archiveDirectory, "key"))
+
+
+if __name__ == "__main__":
+    unittest.main()
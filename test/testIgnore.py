@@ -0,0 +1,153 @@
+"""
+Test the ignore pattern matcher.
+
+    python -m unittest discover -s test
+"""
+
+import os
+import sys
+import glob
+import shutil
+import tempfile
+import unittest
+
+directory = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(directory), "source", "code"))
+
+from freezeDryer import core
+from freezeDryer.ignore import IgnoreMatcher
+
+def globGatherIgnoredPaths(directory, ignorePatterns, level=0):
+    """
+    The glob based gatherIgnoredPaths that
+    IgnoreMatcher replaced.
+    """
+    found = []
+    # match file names
+    for pattern in ignorePatterns:
+        if pattern.startswith("/") and level > 0:
+            continue
+        elif pattern.startswith("/"):
+            pattern = pattern[1:]
+        fullPattern = os.path.join(directory, pattern)
+        found += glob.glob(fullPattern)
+    # recurse through sub-directories
+    level += 1
+    for fileName in os.listdir(directory):
+        if os.path.splitext(fileName)[-1].lower() == ".ufo":
+            continue
+        fullPath = os.path.join(directory, fileName)
+        if fullPath in found:
+            continue
+        if os.path.isdir(fullPath):
+            found += globGatherIgnoredPaths(fullPath, ignorePatterns, level)
+    return found
+
+treePaths = """
+a.idlk
+notes.txt
+.hidden
+build/
+build/out.txt
+docs/build
+docs/readme.txt
+docs/old/a.idlk
+docs/old/draft.txt
+docs/.cache/a.idlk
+sources/font.ufo/fontinfo.plist
+sources/font.ufo/metainfo.plist
+sources/font.ufo/a.idlk
+sources/font.ufo/glyphs/contents.plist
+sources/font.ufo/glyphs/a.glif
+sources/font.ufo/glyphs/b.glif
+sources/font.ufo/images/
+sources/Bold.UFO/fontinfo.plist
+sources/Bold.UFO/glyphs/a.glif
+sources/font.ufoz
+sources/temp/
+sources/temp/x.txt
+sources/drafts/temp
+sources/drafts/v1.txt
+sources/drafts/v2.txt
+sources/drafts/v10.txt
+""".split()
+
+patternSets = [
+    # the defaults
+    core.getDefaultIgnorePatterns(),
+    # floating
+    ["*.idlk", "*.txt"],
+    ["v?.txt", "v[0-9][0-9].txt", "v[!1].txt"],
+    [".*"],
+    # anchored
+    ["/notes.txt", "/docs/old", "/sources/*.ufoz"],
+    # directories only
+    ["build/", "temp/"],
+    ["/build/", "/docs/build/"],
+    # inside of UFOs
+    ["/sources/font.ufo/glyphs/a.glif", "/sources/*.ufo/fontinfo.plist"],
+    ["/sources/font.ufo/images/"],
+    ["*.ufo/fontinfo.plist", "glyphs/*.glif", "*.UFO/glyphs/"],
+    ["*.glif", "fontinfo.plist"],
+]
+
+class IgnoreMatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        for path in treePaths:
+            path = os.path.join(self.root, *path.split("/"))
+            if path.endswith(os.sep):
+                os.makedirs(path)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(path)
+
+    def gatherWithGlob(self, patterns):
+        """
+        Gather with glob and leave out the paths that
+        are in directories that are already ignored,
+        which the matcher doesn't go into.
+        """
+        paths = set(
+            os.path.relpath(path.rstrip(os.sep), self.root)
+            for path in globGatherIgnoredPaths(self.root, patterns)
+        )
+        return set(
+            path for path in paths
+            if not any(path.startswith(other + os.sep) for other in paths)
+        )
+
+    def gatherWithMatcher(self, patterns):
+        return set(
+            os.path.relpath(path, self.root)
+            for path in core.gatherIgnoredPaths(self.root, patterns)
+        )
+
+    def test_sameAsGlob(self):
+        for patterns in patternSets:
+            with self.subTest(patterns=patterns):
+                expected = self.gatherWithGlob(patterns)
+                self.assertEqual(self.gatherWithMatcher(patterns), expected)
+
+    def test_directoriesOnly(self):
+        matcher = IgnoreMatcher(["build/", "/docs/"])
+        self.assertTrue(matcher.isIgnored("build", isDirectory=True))
+        self.assertFalse(matcher.isIgnored("build"))
+        self.assertTrue(matcher.isIgnored(os.path.join("docs", "build"), isDirectory=True))
+        self.assertFalse(matcher.isIgnored(os.path.join("docs", "build")))
+        self.assertTrue(matcher.isIgnored("docs", isDirectory=True))
+        self.assertFalse(matcher.isIgnored("docs"))
+
+    def test_notInUFOs(self):
+        matcher = IgnoreMatcher(["*.glif"])
+        self.assertTrue(matcher.isIgnored("a.glif"))
+        self.assertFalse(matcher.isIgnored(os.path.join("font.ufo", "glyphs", "a.glif")))
+        matcher = IgnoreMatcher(["/font.ufo/glyphs/a.glif"])
+        self.assertTrue(matcher.isIgnored(os.path.join("font.ufo", "glyphs", "a.glif")))
+
+
+if __name__ == "__main__":
+    unittest.main()